@@ -0,0 +1,72 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from accounts.models import ApiToken, User
+
+class Command(BaseCommand):
+    help = 'Issue, list and revoke API tokens of integration clients'
+
+    def add_arguments(self, parser):
+        actions = parser.add_subparsers(dest='action', required=True)
+
+        issue = actions.add_parser('issue', help="Issue a token scoped to the user's role and print its key once")
+        issue.add_argument('username', type=str, help='User the token acts for')
+        issue.add_argument('--name', type=str, default='', help='What the token is used for')
+        issue.add_argument(
+            '--days', type=int, default=settings.API_TOKEN_EXPIRY_DAYS,
+            help=f'Days until the token expires; 0 for never (default: {settings.API_TOKEN_EXPIRY_DAYS})'
+        )
+
+        revoke = actions.add_parser('revoke', help='Revoke a token by its prefix, or all tokens of a user')
+        revoke.add_argument('prefix', nargs='?', type=str, help='Prefix of the token, as listed')
+        revoke.add_argument('--user', type=str, help='Revoke every token of this user')
+
+        listing = actions.add_parser('list', help='List tokens that are neither revoked nor expired')
+        listing.add_argument('--user', type=str, help='Only the tokens of this user')
+
+    def handle(self, *args, **kwargs):
+        actions = {'issue': self.issue, 'revoke': self.revoke, 'list': self.list_tokens}
+        actions[kwargs['action']](kwargs)
+
+    def issue(self, kwargs):
+        try:
+            user = User.objects.get(username=kwargs['username'])
+        except User.DoesNotExist:
+            raise CommandError(f"User {kwargs['username']} does not exist.")
+        if kwargs['days'] < 0:
+            raise CommandError('--days must not be negative.')
+        expires_at = timezone.now() + timedelta(days=kwargs['days']) if kwargs['days'] else None
+
+        token, key = ApiToken.objects.issue(user, name=kwargs['name'], expires_at=expires_at)
+        expiry = f'expires {expires_at:%Y-%m-%d %H:%M %Z}' if expires_at else 'does not expire'
+        self.stdout.write(self.style.SUCCESS(
+            f'Issued {token.scope} token {token.prefix} for {user.username}; it {expiry}.'
+        ))
+        self.stdout.write(f'Send "Authorization: Token {key}". The key is not stored and cannot be shown again.')
+
+    def revoke(self, kwargs):
+        if bool(kwargs['prefix']) == bool(kwargs['user']):
+            raise CommandError('Give either a token prefix or --user.')
+        if kwargs['user']:
+            tokens = ApiToken.objects.filter(user__username=kwargs['user'])
+        else:
+            tokens = ApiToken.objects.filter(prefix=kwargs['prefix'])
+            if tokens.count() > 1:
+                raise CommandError(f"Several tokens start with {kwargs['prefix']}; revoke them with --user.")
+        count = tokens.revoke()
+        timeout = settings.CACHES['api_tokens']['TIMEOUT']
+        self.stdout.write(self.style.SUCCESS(
+            f'Revoked {count} token(s). Running servers refuse them within {timeout} seconds.'
+        ))
+
+    def list_tokens(self, kwargs):
+        tokens = ApiToken.objects.usable().select_related('user')
+        if kwargs['user']:
+            tokens = tokens.filter(user__username=kwargs['user'])
+        for token in tokens:
+            expiry = f'{token.expires_at:%Y-%m-%d}' if token.expires_at else 'never'
+            self.stdout.write(
+                f'{token.prefix}  {token.user.username:<20} {token.scope:<14} expires {expiry:<10}  {token.name}'
+            )
@@ -0,0 +1,104 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+from requests.benchmarks import ENDPOINTS, BenchmarkError, benchmark_users, sample_request_ids, save_results
+from requests.server_benchmarks import SERVERS, ServerBenchmark
+
+# Session engines compared, by the name used in the output
+SESSION_ENGINES = {
+    'db': 'django.contrib.sessions.backends.db',
+    'signed': 'accounts.sessions',
+}
+DEFAULT_ENDPOINTS = ('dashboard', 'support_dashboard')
+
+class Command(BaseCommand):
+    help = (
+        'Serve the application with the database session engine and with the signed-cookie engine '
+        'and compare throughput and latency of the dashboards at several levels of concurrency'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--engine', action='append', choices=list(SESSION_ENGINES),
+            help='Benchmark only this session engine (repeatable)'
+        )
+        parser.add_argument(
+            '--server', choices=[server.name for server in SERVERS], default='wsgi',
+            help='Server to run the application under (default: wsgi)'
+        )
+        parser.add_argument(
+            '--endpoint', action='append', choices=[endpoint.name for endpoint in ENDPOINTS],
+            help=f"Benchmark this endpoint (repeatable; default: {', '.join(DEFAULT_ENDPOINTS)})"
+        )
+        parser.add_argument(
+            '--concurrency', action='append', type=int,
+            help='Concurrent clients (repeatable; default: 1, 10 and 50)'
+        )
+        parser.add_argument('--duration', type=float, default=10.0, help='Seconds of load per endpoint and concurrency')
+        parser.add_argument('--warmup', type=float, default=2.0, help='Seconds of unmeasured load per endpoint first')
+        parser.add_argument('--workers', type=int, default=1, help='Worker processes of the server')
+        parser.add_argument('--threads', type=int, default=8, help='Threads per gunicorn worker')
+        parser.add_argument('--seed', type=int, default=0, help='Seed for choosing the request detail pages')
+        parser.add_argument('--output', type=str, help='Write the results to this JSON file')
+
+    def handle(self, *args, **kwargs):
+        concurrency = kwargs['concurrency'] or [1, 10, 50]
+        if min(concurrency) < 1 or kwargs['duration'] <= 0 or kwargs['warmup'] < 0:
+            raise CommandError('--concurrency and --duration must be positive and --warmup not negative.')
+        if kwargs['workers'] < 1 or kwargs['threads'] < 1:
+            raise CommandError('--workers and --threads must be positive.')
+        if settings.SECURE_SSL_REDIRECT:
+            raise CommandError('SECURE_SSL_REDIRECT would redirect the plain HTTP benchmark requests; set DJANGO_DEBUG=True.')
+
+        engines = kwargs['engine'] or list(SESSION_ENGINES)
+        servers = [server for server in SERVERS if server.name == kwargs['server']]
+        selected = kwargs['endpoint'] or DEFAULT_ENDPOINTS
+        endpoints = [endpoint for endpoint in ENDPOINTS if endpoint.name in selected]
+
+        request_ids = sample_request_ids(100, kwargs['seed'])
+        try:
+            users = benchmark_users()
+        except BenchmarkError as error:
+            raise CommandError(str(error))
+        if not request_ids:
+            raise CommandError('There are no service requests; see manage.py generate_service_data.')
+
+        def report(engine):
+            def on_result(server, name, clients, stats):
+                line = (
+                    f"{engine:<7} {name:<20} {clients:>4} clients  {stats['throughput_rps']:>8.1f} req/s  "
+                    f"p50 {stats['p50_ms']:>8.1f} ms  p95 {stats['p95_ms']:>8.1f} ms  p99 {stats['p99_ms']:>8.1f} ms"
+                )
+                if stats['failures']:
+                    self.stdout.write(self.style.WARNING(f"{line}  {stats['failures']} failed"))
+                else:
+                    self.stdout.write(line)
+            return on_result
+
+        results = {}
+        for engine in engines:
+            # The benchmark's session cookies must come from the engine the server runs
+            with override_settings(SESSION_ENGINE=SESSION_ENGINES[engine]):
+                benchmark = ServerBenchmark(
+                    users, request_ids, concurrency=concurrency, duration=kwargs['duration'], warmup=kwargs['warmup'],
+                    workers=kwargs['workers'], threads=kwargs['threads'],
+                    environ={'DJANGO_SESSION_ENGINE': SESSION_ENGINES[engine]}
+                )
+            try:
+                results[engine] = benchmark.run(servers, endpoints, on_result=report(engine))
+            except BenchmarkError as error:
+                raise CommandError(str(error))
+
+        if len(results) == 2:
+            self.stdout.write('\nSigned-cookie sessions compared with database sessions:')
+            before, after = (results[engine]['servers'][kwargs['server']]['endpoints'] for engine in SESSION_ENGINES)
+            for name, levels in before.items():
+                for clients, stats in levels.items():
+                    old, new = stats['throughput_rps'], after[name][clients]['throughput_rps']
+                    self.stdout.write(
+                        f"{name:<20} {clients:>4} clients  {old:>8.1f} -> {new:>8.1f} req/s  {(new - old) / old:+.0%}  "
+                        f"p95 {stats['p95_ms']:.1f} -> {after[name][clients]['p95_ms']:.1f} ms"
+                    )
+        if kwargs['output']:
+            save_results({'engines': results}, kwargs['output'])
+            self.stdout.write(self.style.SUCCESS(f"Saved results to {kwargs['output']}."))
@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from accounts.sessions import purge_expired_sessions
+
+class Command(BaseCommand):
+    help = (
+        'Delete revocations of expired signed-cookie sessions and expired database sessions in short '
+        'batches, so request writes are never held up for long. Run it from cron, e.g. daily.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=settings.SESSION_PURGE_BATCH_SIZE,
+            help='Rows deleted per transaction (default: SESSION_PURGE_BATCH_SIZE)'
+        )
+
+    def handle(self, *args, **kwargs):
+        if kwargs['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive.')
+        deleted = purge_expired_sessions(kwargs['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} expired sessions and revocations.'))
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-18 15:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_alter_user_options_user_created_at_user_updated_at_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customer',
+            name='last_request_seq',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text="Sequence number given to the customer's most recent service request"),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.1.7 on 2026-10-18 13:37
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_customer_last_request_seq'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ApiToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(blank=True, help_text='What the token is used for', max_length=100)),
+                ('prefix', models.CharField(db_index=True, help_text='First characters of the key, to tell tokens apart', max_length=8)),
+                ('digest', models.CharField(editable=False, max_length=64, unique=True)),
+                ('scope', models.CharField(choices=[('customer', 'Customer'), ('support_staff', 'Support Staff')], help_text='The role the token may act as', max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('expires_at', models.DateTimeField(blank=True, null=True)),
+                ('revoked_at', models.DateTimeField(blank=True, null=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='api_tokens', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'API Token',
+                'verbose_name_plural': 'API Tokens',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
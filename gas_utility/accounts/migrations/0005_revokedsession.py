@@ -0,0 +1,25 @@
+# Generated by Django 5.1.7 on 2026-10-18 13:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0004_apitoken'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RevokedSession',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('session_id', models.CharField(max_length=32, unique=True)),
+                ('revoked_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+            options={
+                'verbose_name': 'Revoked Session',
+                'verbose_name_plural': 'Revoked Sessions',
+            },
+        ),
+    ]
@@ -1,3 +1,6 @@
+import hashlib
+import secrets
+
 from django.contrib.auth.models import AbstractUser
 from django.db import models
 from django.utils.translation import gettext_lazy as _
@@ -60,6 +63,11 @@ class Customer(models.Model):
         null=True,
         help_text=_("Customer's address for service visits")
     )
+    last_request_seq = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        help_text=_("Sequence number given to the customer's most recent service request")
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -80,6 +88,19 @@ class Customer(models.Model):
         return self.user.username
 
 
+class SupportRepresentativeQuerySet(models.QuerySet):
+    """QuerySet helpers for loading support representatives efficiently."""
+
+    def with_active_requests_count(self):
+        """Annotate each representative with ``active_requests`` (non-resolved assigned requests)."""
+        return self.annotate(
+            active_requests=models.Count(
+                'assigned_requests',
+                filter=~models.Q(assigned_requests__status='Resolved')
+            )
+        )
+
+
 class SupportRepresentative(models.Model):
     """
     Support Representative model representing staff who handle service requests.
@@ -106,6 +127,8 @@ class SupportRepresentative(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = SupportRepresentativeQuerySet.as_manager()
+    
     class Meta:
         verbose_name = _("Support Representative")
         verbose_name_plural = _("Support Representatives")
@@ -124,4 +147,109 @@ class SupportRepresentative(models.Model):
     
     def get_active_requests_count(self):
         """Return the count of active requests assigned to this representative."""
+        # Use the value annotated by with_active_requests_count() when available
+        if hasattr(self, 'active_requests'):
+            return self.active_requests
         return self.assigned_requests.exclude(status='Resolved').count()
+
+
+def api_token_digest(key):
+    """
+    The stored form of an API token.
+
+    Keys are 256 random bits, so a plain SHA-256 digest cannot be reversed by
+    guessing. A deliberately slow hash such as PBKDF2 protects guessable
+    passwords and is not needed here.
+    """
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+class ApiTokenQuerySet(models.QuerySet):
+    """QuerySet helpers for API tokens."""
+
+    def usable(self):
+        """Tokens that are neither revoked nor expired."""
+        return self.filter(revoked_at__isnull=True).filter(
+            models.Q(expires_at__isnull=True) | models.Q(expires_at__gt=timezone.now())
+        )
+
+    def issue(self, user, name='', expires_at=None):
+        """
+        Create a token for ``user``, scoped to their current role, and return
+        it with its key. Only the key's digest is stored, so the key cannot be
+        shown again.
+        """
+        key = secrets.token_hex(32)
+        token = self.create(
+            user=user, name=name, prefix=key[:8], digest=api_token_digest(key),
+            scope=user.role, expires_at=expires_at
+        )
+        return token, key
+
+    def revoke(self):
+        """Revoke the tokens that are still usable and return how many there were."""
+        return self.filter(revoked_at__isnull=True).update(revoked_at=timezone.now())
+
+
+class ApiToken(models.Model):
+    """
+    A token that authenticates an integration client to the API.
+
+    A token acts for its user only while the user's role matches the token's
+    scope, so a token issued to support staff stops working if they become a
+    customer.
+    """
+    user = models.ForeignKey(
+        'accounts.User',
+        on_delete=models.CASCADE,
+        related_name='api_tokens'
+    )
+    name = models.CharField(
+        max_length=100,
+        blank=True,
+        help_text=_("What the token is used for")
+    )
+    prefix = models.CharField(
+        max_length=8,
+        db_index=True,
+        help_text=_("First characters of the key, to tell tokens apart")
+    )
+    digest = models.CharField(max_length=64, unique=True, editable=False)
+    scope = models.CharField(
+        max_length=20,
+        choices=User.ROLE_CHOICES,
+        help_text=_("The role the token may act as")
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(blank=True, null=True)
+    revoked_at = models.DateTimeField(blank=True, null=True)
+
+    objects = ApiTokenQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = _("API Token")
+        verbose_name_plural = _("API Tokens")
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.prefix}... ({self.user.username})"
+
+    def is_usable(self, now=None):
+        """Whether the token is neither revoked nor expired."""
+        now = now or timezone.now()
+        return self.revoked_at is None and (self.expires_at is None or self.expires_at > now)
+
+
+class RevokedSession(models.Model):
+    """
+    A signed-cookie session that was signed out; see accounts.sessions.
+
+    The cookie cannot be taken back from the client, so its id is kept here
+    until the cookie would have expired anyway.
+    """
+    session_id = models.CharField(max_length=32, unique=True)
+    revoked_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        verbose_name = _("Revoked Session")
+        verbose_name_plural = _("Revoked Sessions")
@@ -0,0 +1,165 @@
+"""
+The signed-in user's customer and support representative profiles, resolved once per request.
+
+ProfileMiddleware gives every request a ``profiles`` attribute. The first
+use of ``request.profiles.customer`` or ``request.profiles.support_rep``
+looks up the ids of both profiles in one query, and the rest of the request
+reuses them. Users signed in with a session also keep the ids in the
+session, so later requests need no query at all. Signing in stores them
+straight away, in the session write that login makes anyway.
+
+The session entry carries the user's ``updated_at``. Any save of the user
+advances it, and so does creating or deleting one of their profiles (see
+accounts.signals). A stale entry is therefore detected against the user row
+that authentication loads on every request. Users authenticated without a
+session, such as API clients using HTTP Basic, get one query per request and
+are never given a session.
+
+Profiles are loaded with just their ``id`` and ``user``; any other field is
+fetched when it is first read.
+"""
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.contrib.auth import SESSION_KEY
+from django.db import router
+
+from .models import Customer, SupportRepresentative, User
+
+SESSION_PROFILES_KEY = '_profile_ids'
+NO_PROFILES = (None, None)
+
+
+def profile_ids_query(user):
+    """Query for (updated_at, customer id, support representative id) of ``user``."""
+    return User.objects.filter(pk=user.pk).values_list('updated_at', 'customer_profile', 'support_profile')
+
+
+def session_entry(row):
+    updated_at, customer_id, support_rep_id = row
+    return {'stamp': updated_at.isoformat(), 'customer': customer_id, 'support_rep': support_rep_id}
+
+
+def ids_from_entry(entry, user):
+    """The (customer id, support representative id) in a session entry, or None if it is stale."""
+    if entry and entry.get('stamp') == user.updated_at.isoformat():
+        return entry['customer'], entry['support_rep']
+    return None
+
+
+def store_profile_ids(request, user):
+    """Keep ``user``'s profile ids in the session of the request that signs them in."""
+    row = profile_ids_query(user).first()
+    if row:
+        request.session[SESSION_PROFILES_KEY] = session_entry(row)
+
+
+def load_profile(model, pk, user):
+    """An instance of ``model`` with only its id and user loaded, or None."""
+    if pk is None:
+        return None
+    profile = model.from_db(router.db_for_read(model), ['id', 'user_id'], [pk, user.pk])
+    profile.user = user
+    return profile
+
+
+class RequestProfiles:
+    """
+    The profiles of ``request.user``, looked up at most once per request.
+
+    Async views use the ``a``-prefixed methods, which read the user and the
+    session without blocking the event loop.
+    """
+
+    def __init__(self, request):
+        self.request = request
+        # user pk -> (customer id, support representative id)
+        self.resolved = {}
+
+    def uses_session(self, user, session_user_id):
+        # Only the session's own user; a Basic-authenticated request must not start a session
+        return session_user_id == user._meta.pk.value_to_string(user)
+
+    def ids(self):
+        """Return (customer id, support representative id) of the user; either may be None."""
+        user = self.request.user
+        if not user.is_authenticated:
+            return NO_PROFILES
+        if user.pk not in self.resolved:
+            session = getattr(self.request, 'session', None)
+            uses_session = session is not None and self.uses_session(user, session.get(SESSION_KEY))
+            ids = ids_from_entry(session.get(SESSION_PROFILES_KEY), user) if uses_session else None
+            if ids is None:
+                row = profile_ids_query(user).first()
+                ids = row[1:] if row else NO_PROFILES
+                if row and uses_session:
+                    session[SESSION_PROFILES_KEY] = session_entry(row)
+            self.resolved[user.pk] = ids
+        return self.resolved[user.pk]
+
+    @property
+    def customer(self):
+        """The user's Customer, or None."""
+        return load_profile(Customer, self.ids()[0], self.request.user)
+
+    @property
+    def support_rep(self):
+        """The user's SupportRepresentative, or None."""
+        return load_profile(SupportRepresentative, self.ids()[1], self.request.user)
+
+    def get_or_create_customer(self):
+        """The user's Customer, created if they have none."""
+        customer = self.customer
+        if customer is None:
+            customer, created = Customer.objects.get_or_create(user=self.request.user)
+            self.resolved[self.request.user.pk] = (customer.pk, self.ids()[1])
+        return customer
+
+    async def aids(self):
+        user = await self.request.auser()
+        if not user.is_authenticated:
+            return NO_PROFILES
+        if user.pk not in self.resolved:
+            session = getattr(self.request, 'session', None)
+            uses_session = session is not None and self.uses_session(user, await session.aget(SESSION_KEY))
+            ids = ids_from_entry(await session.aget(SESSION_PROFILES_KEY), user) if uses_session else None
+            if ids is None:
+                row = await profile_ids_query(user).afirst()
+                ids = row[1:] if row else NO_PROFILES
+                if row and uses_session:
+                    await session.aset(SESSION_PROFILES_KEY, session_entry(row))
+            self.resolved[user.pk] = ids
+        return self.resolved[user.pk]
+
+    async def acustomer(self):
+        return load_profile(Customer, (await self.aids())[0], await self.request.auser())
+
+    async def asupport_rep(self):
+        return load_profile(SupportRepresentative, (await self.aids())[1], await self.request.auser())
+
+    async def aget_or_create_customer(self):
+        customer = await self.acustomer()
+        if customer is None:
+            user = await self.request.auser()
+            customer, created = await Customer.objects.aget_or_create(user=user)
+            self.resolved[user.pk] = (customer.pk, (await self.aids())[1])
+        return customer
+
+
+class ProfileMiddleware:
+    """
+    Set ``request.profiles`` to the request's RequestProfiles.
+
+    Must come after SessionMiddleware; the lookup itself waits until a view
+    asks for a profile, after any authentication of its own.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        request.profiles = RequestProfiles(request)
+        return self.get_response(request)
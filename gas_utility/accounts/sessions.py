@@ -0,0 +1,156 @@
+"""
+Session engine for the dashboards: signed cookies with a server-side revocation list.
+
+With the database engine every signed-in request reads ``django_session``,
+and every sign-in and sign-out writes it. On SQLite those writes wait for
+the same lock as service request writes. Here the session data travels in
+the client's cookie, signed with SECRET_KEY, so loading or changing a
+session uses no table at all. Clients can read the cookie's contents (the
+user id and profile ids) but cannot change them.
+
+Signing out is the exception, because the client keeps a copy of the cookie.
+Each session carries a random id, and sign-out stores that id as a
+RevokedSession. Each process keeps the revoked ids in memory and reads new
+ones with one indexed query at most every SESSION_REVOCATION_REFRESH
+seconds. A signed-out cookie is refused at once by the process that signed it
+out, and by the others after that interval. A revocation only matters until
+the cookie expires (SESSION_COOKIE_AGE after it was signed).
+``purge_expired_sessions`` then deletes it, together with expired rows left
+by the database engine. It deletes in batches, so it never holds the write
+lock for long.
+"""
+import threading
+import time
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.sessions.backends import signed_cookies
+from django.contrib.sessions.models import Session
+from django.db import transaction
+from django.utils import timezone
+from django.utils.crypto import get_random_string
+
+from .models import RevokedSession
+
+# Session key holding the session's id
+SESSION_ID_KEY = '_session_id'
+# Revocations read again on each refresh, in case their transaction committed late
+REFRESH_OVERLAP = timedelta(seconds=60)
+
+
+class RevocationList:
+    """This process's copy of the revoked session ids that can still matter."""
+
+    def __init__(self):
+        # session id -> revoked_at
+        self.revoked = {}
+        self.refreshed_at = None
+        self.next_refresh = 0
+        self.lock = threading.Lock()
+
+    def __contains__(self, session_id):
+        return session_id in self.revoked
+
+    def due(self):
+        return time.monotonic() >= self.next_refresh
+
+    def refresh(self, force=False):
+        """Read revocations made since the last refresh and forget expired ones."""
+        with self.lock:
+            if not (force or self.due()):
+                return
+            now = timezone.now()
+            cutoff = now - timedelta(seconds=settings.SESSION_COOKIE_AGE)
+            since = self.refreshed_at - REFRESH_OVERLAP if self.refreshed_at else cutoff
+            self.revoked.update(
+                RevokedSession.objects.filter(revoked_at__gte=since).values_list('session_id', 'revoked_at')
+            )
+            self.revoked = {
+                session_id: revoked_at for session_id, revoked_at in self.revoked.items() if revoked_at > cutoff
+            }
+            self.refreshed_at = now
+            self.next_refresh = time.monotonic() + settings.SESSION_REVOCATION_REFRESH
+
+    def revoke(self, session_id):
+        RevokedSession.objects.bulk_create([RevokedSession(session_id=session_id)], ignore_conflicts=True)
+        self.revoked[session_id] = timezone.now()
+
+
+revocations = RevocationList()
+
+
+class SessionStore(signed_cookies.SessionStore):
+    """The signed-cookie session, refused once its id is revoked."""
+
+    def load(self):
+        if revocations.due():
+            revocations.refresh()
+        return self.unless_revoked(super().load())
+
+    async def aload(self):
+        if revocations.due():
+            await sync_to_async(revocations.refresh)()
+        return self.unless_revoked(super().load())
+
+    def unless_revoked(self, data):
+        if data.get(SESSION_ID_KEY) in revocations:
+            self.create()
+            return {}
+        return data
+
+    def _get_session_key(self):
+        if self._session and SESSION_ID_KEY not in self._session:
+            self._session[SESSION_ID_KEY] = get_random_string(32)
+        return super()._get_session_key()
+
+    def cycle_key(self):
+        # The new cookie gets an id of its own
+        self._session.pop(SESSION_ID_KEY, None)
+        super().cycle_key()
+
+    async def acycle_key(self):
+        (await self._aget_session()).pop(SESSION_ID_KEY, None)
+        super().cycle_key()
+
+    def flush(self):
+        session_id = self._session.get(SESSION_ID_KEY)
+        super().flush()
+        if session_id:
+            revocations.revoke(session_id)
+
+    async def aflush(self):
+        session_id = (await self._aget_session()).get(SESSION_ID_KEY)
+        await super().aflush()
+        if session_id:
+            await sync_to_async(revocations.revoke)(session_id)
+
+    @classmethod
+    def clear_expired(cls):
+        purge_expired_sessions()
+
+    @classmethod
+    async def aclear_expired(cls):
+        await sync_to_async(purge_expired_sessions)()
+
+
+def purge_expired_sessions(batch_size=None):
+    """
+    Delete revocations of sessions that have expired, and expired database
+    sessions, ``batch_size`` rows per transaction. Return the number deleted.
+    """
+    batch_size = batch_size or settings.SESSION_PURGE_BATCH_SIZE
+    now = timezone.now()
+    expired = [
+        RevokedSession.objects.filter(revoked_at__lt=now - timedelta(seconds=settings.SESSION_COOKIE_AGE)),
+        Session.objects.filter(expire_date__lt=now),
+    ]
+    deleted = 0
+    for queryset in expired:
+        while True:
+            with transaction.atomic():
+                batch = list(queryset.values_list('pk', flat=True)[:batch_size])
+                if not batch:
+                    break
+                deleted += queryset.model.objects.filter(pk__in=batch).delete()[0]
+    return deleted
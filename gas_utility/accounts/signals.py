@@ -0,0 +1,33 @@
+from django.contrib.auth.signals import user_logged_in
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Customer, SupportRepresentative, User
+from .profiles import store_profile_ids
+
+
+@receiver(post_save, sender=Customer)
+@receiver(post_save, sender=SupportRepresentative)
+@receiver(post_delete, sender=Customer)
+@receiver(post_delete, sender=SupportRepresentative)
+def invalidate_session_profiles(sender, instance, using, created=True, **kwargs):
+    """
+    Advance the user's ``updated_at`` when a profile is created or deleted, so
+    the profile ids kept in their sessions are looked up again.
+    """
+    # post_delete sends no ``created``; a profile that was only updated changes no ids
+    if not created:
+        return
+    now = timezone.now()
+    User.objects.using(using).filter(pk=instance.user_id).update(updated_at=now)
+    # A user object the caller holds, such as request.user, stays current
+    user = sender.user.field.get_cached_value(instance, None)
+    if user is not None:
+        user.updated_at = now
+
+
+@receiver(user_logged_in)
+def remember_session_profiles(sender, request, user, **kwargs):
+    if request is not None and hasattr(request, 'session'):
+        store_profile_ids(request, user)
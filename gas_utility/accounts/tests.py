@@ -1,3 +1,310 @@
-from django.test import TestCase
+import base64
+import io
+import re
+from datetime import timedelta
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.core.cache import caches
+from django.core.management import call_command
+from django.urls import reverse
+from django.utils import timezone
+
+from gas_utility import metrics
+from gas_utility.testing import ServiceDataTestCase, query_budget
+from .models import ApiToken, RevokedSession, User, Customer, SupportRepresentative
+from .profiles import SESSION_PROFILES_KEY
+from .sessions import SESSION_ID_KEY, revocations
+
+# Upper bound on total SQL time per request, in seconds
+SQL_TIME_BUDGET = 0.5
+
+
+class AuthPageQueryBudgetTests(ServiceDataTestCase):
+    """Query budgets for registration, login and logout."""
+
+    def test_register_form(self):
+        with query_budget(0, SQL_TIME_BUDGET):
+            response = self.client.get(reverse('register'))
+        self.assertEqual(response.status_code, 200)
+
+    def test_register(self):
+        with query_budget(6, SQL_TIME_BUDGET):
+            response = self.client.post(reverse('register'), {
+                'username': 'newcustomer', 'email': 'new@example.com',
+                'first_name': 'New', 'last_name': 'Customer',
+                'password': 'a-long-password', 'confirm_password': 'a-long-password',
+            })
+        self.assertRedirects(response, reverse('login'), fetch_redirect_response=False)
+        self.assertTrue(Customer.objects.filter(user__username='newcustomer').exists())
+
+    def test_login_form(self):
+        with query_budget(0, SQL_TIME_BUDGET):
+            response = self.client.get(reverse('login'))
+        self.assertEqual(response.status_code, 200)
+
+    def test_login_as_customer(self):
+        with query_budget(3, SQL_TIME_BUDGET):
+            response = self.client.post(reverse('login'), {
+                'username': self.customer_user.username, 'password': self.PASSWORD,
+            })
+        self.assertRedirects(response, reverse('dashboard'), fetch_redirect_response=False)
+
+    def test_login_as_staff(self):
+        with query_budget(3, SQL_TIME_BUDGET):
+            response = self.client.post(reverse('login'), {
+                'username': self.staff_user.username, 'password': self.PASSWORD,
+            })
+        self.assertRedirects(response, reverse('support_dashboard'), fetch_redirect_response=False)
+
+    def test_logout(self):
+        self.client.force_login(self.customer_user)
+        with query_budget(2, SQL_TIME_BUDGET):
+            response = self.client.get(reverse('logout'))
+        self.assertRedirects(response, reverse('login'), fetch_redirect_response=False)
+
+
+class AccountsApiQueryBudgetTests(ServiceDataTestCase):
+    """Query budgets for the accounts API as a customer and as support staff."""
+
+    def test_users_as_customer(self):
+        self.client.force_login(self.customer_user)
+        with query_budget(3, SQL_TIME_BUDGET):
+            response = self.client.get('/accounts/api/users/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['count'], 1)
+
+    def test_users_as_staff(self):
+        self.client.force_login(self.staff_user)
+        with query_budget(3, SQL_TIME_BUDGET):
+            response = self.client.get('/accounts/api/users/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['count'], User.objects.count())
+
+    def test_user_me(self):
+        self.client.force_login(self.customer_user)
+        with query_budget(1, SQL_TIME_BUDGET):
+            response = self.client.get('/accounts/api/users/me/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_customers_as_customer(self):
+        self.client.force_login(self.customer_user)
+        with query_budget(3, SQL_TIME_BUDGET):
+            response = self.client.get('/accounts/api/customers/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_customers_as_staff(self):
+        self.client.force_login(self.staff_user)
+        with query_budget(3, SQL_TIME_BUDGET):
+            response = self.client.get('/accounts/api/customers/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['count'], self.CUSTOMERS)
+        ids = [row['id'] for row in response.json()['results']]
+        self.assertEqual(ids, sorted(ids))
+
+    def test_customer_detail_as_staff(self):
+        self.client.force_login(self.staff_user)
+        with query_budget(2, SQL_TIME_BUDGET):
+            response = self.client.get(f'/accounts/api/customers/{self.customer.id}/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_customer_me(self):
+        self.client.force_login(self.customer_user)
+        with query_budget(2, SQL_TIME_BUDGET):
+            response = self.client.get('/accounts/api/customers/me/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_support_representatives_as_staff(self):
+        self.client.force_login(self.staff_user)
+        with query_budget(3, SQL_TIME_BUDGET):
+            response = self.client.get('/accounts/api/support-representatives/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['count'], self.REPS)
+        ids = [row['id'] for row in response.json()['results']]
+        self.assertEqual(ids, sorted(ids))
+
+    def test_support_representatives_as_customer(self):
+        self.client.force_login(self.customer_user)
+        with query_budget(2, SQL_TIME_BUDGET):
+            response = self.client.get('/accounts/api/support-representatives/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['count'], 0)
+
+    def test_support_representative_me(self):
+        self.client.force_login(self.staff_user)
+        with query_budget(2, SQL_TIME_BUDGET):
+            response = self.client.get('/accounts/api/support-representatives/me/')
+        self.assertEqual(response.status_code, 200)
+
+
+def profile_queries(queries):
+    return [query for query in queries if '"accounts_customer"' in query['sql'] or '"accounts_supportrepresentative"' in query['sql']]
+
+
+class RequestProfileTests(ServiceDataTestCase):
+    """Profile lookups through request.profiles and the ids kept in the session."""
+
+    def test_login_keeps_profile_ids_in_session(self):
+        self.client.force_login(self.staff_user)
+        entry = self.client.session[SESSION_PROFILES_KEY]
+        self.assertEqual((entry['customer'], entry['support_rep']), (None, self.staff_rep.id))
+
+    def test_pages_use_session_profile_ids(self):
+        self.client.force_login(self.customer_user)
+        for url in (reverse('dashboard'), reverse('submit_request')):
+            with query_budget(3, SQL_TIME_BUDGET) as budget:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(profile_queries(budget.queries), [])
+
+    def test_assigned_to_me_uses_session_profile_ids(self):
+        self.client.force_login(self.staff_user)
+        with query_budget(5, SQL_TIME_BUDGET) as budget:
+            response = self.client.get(reverse('support_dashboard'), {'assigned': 'me'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['current_support_rep'].id, self.staff_rep.id)
+        self.assertNotIn('FROM "accounts_supportrepresentative" WHERE', ' '.join(q['sql'] for q in budget.queries))
+
+    def test_new_profile_replaces_session_profile_ids(self):
+        self.client.force_login(self.customer_user)
+        rep = SupportRepresentative.objects.create(user=self.customer_user)
+        response = self.client.get(reverse('support_dashboard'), {'assigned': 'me'})
+        self.assertEqual(response.status_code, 302)
+        self.client.get(reverse('dashboard'))
+        self.assertEqual(self.client.session[SESSION_PROFILES_KEY]['support_rep'], rep.id)
+
+    def test_deleted_customer_profile_is_recreated(self):
+        self.client.force_login(self.customer_user)
+        self.customer.delete()
+        response = self.client.get(reverse('dashboard'))
+        self.assertEqual(response.status_code, 200)
+        customer = Customer.objects.get(user=self.customer_user)
+        self.assertNotEqual(customer.id, self.customer.id)
+        self.client.get(reverse('dashboard'))
+        self.assertEqual(self.client.session[SESSION_PROFILES_KEY]['customer'], customer.id)
+
+    def test_basic_authentication_does_not_start_a_session(self):
+        credentials = base64.b64encode(f'{self.customer_user.username}:{self.PASSWORD}'.encode()).decode()
+        response = self.client.post('/api/service-requests/', {
+            'customer': self.customer.id, 'service_type': 'Meter Problem',
+            'description': 'Meter display is blank', 'priority': 'Low',
+        }, HTTP_AUTHORIZATION=f'Basic {credentials}')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['customer'], self.customer.id)
+        self.assertNotIn(settings.SESSION_COOKIE_NAME, response.cookies)
+
+
+class ApiTokenTests(ServiceDataTestCase):
+    """API token authentication, its cache and the api_token command."""
+
+    def setUp(self):
+        caches['api_tokens'].clear()
+
+    def get_list(self, key):
+        return self.client.get('/api/service-requests/', HTTP_AUTHORIZATION=f'Token {key}')
+
+    def test_token_authenticates_from_cache(self):
+        token, key = ApiToken.objects.issue(self.customer_user)
+        self.assertEqual(token.scope, 'customer')
+        self.assertNotIn(key, token.digest)
+        response = self.get_list(key)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['count'], self.CUSTOMER_REQUESTS)
+        self.assertNotIn(settings.SESSION_COOKIE_NAME, response.cookies)
+
+        hits = metrics.registry.counters.get(('gas_utility_cache_lookups_total', ('api_tokens', 'hit')), 0)
+        with query_budget(3, SQL_TIME_BUDGET) as budget:
+            self.assertEqual(self.get_list(key).status_code, 200)
+        self.assertNotIn('accounts_apitoken', ' '.join(query['sql'] for query in budget.queries))
+        self.assertEqual(metrics.registry.counters[('gas_utility_cache_lookups_total', ('api_tokens', 'hit'))], hits + 1)
+
+    def test_unusable_tokens_are_refused(self):
+        self.assertEqual(self.get_list('not-a-token').status_code, 403)
+        self.assertEqual(self.client.get(
+            '/api/service-requests/', HTTP_AUTHORIZATION='Token two parts'
+        ).status_code, 403)
+
+        expired, expired_key = ApiToken.objects.issue(self.customer_user, expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(self.get_list(expired_key).status_code, 403)
+
+        revoked, revoked_key = ApiToken.objects.issue(self.customer_user)
+        self.assertEqual(self.get_list(revoked_key).status_code, 200)
+        self.assertEqual(ApiToken.objects.filter(pk=revoked.pk).revoke(), 1)
+        caches['api_tokens'].clear()
+        self.assertEqual(self.get_list(revoked_key).status_code, 403)
+
+    def test_scope_must_match_role(self):
+        token, key = ApiToken.objects.issue(self.staff_user)
+        self.assertEqual(self.client.get(
+            '/api/service-requests/statistics/', HTTP_AUTHORIZATION=f'Token {key}'
+        ).status_code, 200)
+        User.objects.filter(pk=self.staff_user.pk).update(role='customer')
+        caches['api_tokens'].clear()
+        self.assertEqual(self.get_list(key).status_code, 403)
+
+    def test_api_token_command(self):
+        stdout = io.StringIO()
+        call_command('api_token', 'issue', self.customer_user.username, '--name', 'billing', stdout=stdout)
+        key = re.search(r'Token ([0-9a-f]{64})', stdout.getvalue()).group(1)
+        token = ApiToken.objects.get(prefix=key[:8])
+        self.assertEqual((token.name, token.scope), ('billing', 'customer'))
+        self.assertEqual(token.expires_at.date(), (timezone.now() + timedelta(days=settings.API_TOKEN_EXPIRY_DAYS)).date())
+        self.assertEqual(self.get_list(key).status_code, 200)
+
+        stdout = io.StringIO()
+        call_command('api_token', 'list', stdout=stdout)
+        self.assertIn(token.prefix, stdout.getvalue())
+
+        call_command('api_token', 'revoke', token.prefix, stdout=io.StringIO())
+        token.refresh_from_db()
+        self.assertIsNotNone(token.revoked_at)
+        stdout = io.StringIO()
+        call_command('api_token', 'list', stdout=stdout)
+        self.assertNotIn(token.prefix, stdout.getvalue())
+
+
+class SignedSessionTests(ServiceDataTestCase):
+    """Signed-cookie sessions, their revocation on sign-out and the purge."""
+
+    def test_sessions_use_no_table(self):
+        self.client.force_login(self.customer_user)
+        self.assertEqual(len(self.client.session[SESSION_ID_KEY]), 32)
+        with query_budget(3, SQL_TIME_BUDGET) as budget:
+            self.assertEqual(self.client.get(reverse('dashboard')).status_code, 200)
+        self.assertNotIn('django_session', ' '.join(query['sql'] for query in budget.queries))
+        self.assertFalse(Session.objects.exists())
+
+    def test_sign_out_revokes_the_cookie(self):
+        self.client.force_login(self.customer_user)
+        cookie = self.client.cookies[settings.SESSION_COOKIE_NAME].value
+        session_id = self.client.session[SESSION_ID_KEY]
+        self.client.get(reverse('logout'))
+        self.assertTrue(RevokedSession.objects.filter(session_id=session_id).exists())
+
+        self.client.cookies[settings.SESSION_COOKIE_NAME] = cookie
+        response = self.client.get(reverse('dashboard'))
+        self.assertRedirects(response, f"{reverse('login')}?next={reverse('dashboard')}", fetch_redirect_response=False)
+
+    def test_revocations_by_other_processes_apply_after_refresh(self):
+        self.client.force_login(self.staff_user)
+        RevokedSession.objects.create(session_id=self.client.session[SESSION_ID_KEY])
+        self.assertEqual(self.client.get(reverse('support_dashboard')).status_code, 200)
+        revocations.refresh(force=True)
+        self.assertEqual(self.client.get(reverse('support_dashboard')).status_code, 302)
+
+    def test_purge_sessions_deletes_expired_rows_in_batches(self):
+        now = timezone.now()
+        expired = now - timedelta(seconds=settings.SESSION_COOKIE_AGE + 60)
+        RevokedSession.objects.bulk_create([RevokedSession(session_id=f'old{index}') for index in range(5)])
+        RevokedSession.objects.update(revoked_at=expired)
+        RevokedSession.objects.create(session_id='recent')
+        Session.objects.bulk_create([
+            Session(session_key=f'session{index}', session_data='', expire_date=now + timedelta(days=1 - index))
+            for index in range(4)
+        ])
+
+        stdout = io.StringIO()
+        call_command('purge_sessions', '--batch-size', '2', stdout=stdout)
+        self.assertIn('Deleted 8 ', stdout.getvalue())
+        self.assertEqual(list(RevokedSession.objects.values_list('session_id', flat=True)), ['recent'])
+        self.assertEqual(list(Session.objects.values_list('session_key', flat=True)), ['session0'])
@@ -95,13 +95,15 @@ class CustomerViewSet(viewsets.ModelViewSet):
         Limit customers based on the requesting user's role.
         """
         user = self.request.user
+        # Ordered so pages are stable
+        queryset = Customer.objects.select_related('user').order_by('id')
         
         # Support staff can see all customers
         if user.role == 'support_staff':
-            return Customer.objects.all()
+            return queryset
         
         # Regular users can only see their own customer profile
-        return Customer.objects.filter(user=user)
+        return queryset.filter(user=user)
     
     @action(detail=False, methods=['get'])
     def me(self, request):
@@ -109,7 +111,7 @@ class CustomerViewSet(viewsets.ModelViewSet):
         Return the authenticated user's customer profile.
         """
         try:
-            customer = Customer.objects.get(user=request.user)
+            customer = self.get_queryset().get(user=request.user)
             serializer = self.get_serializer(customer)
             return Response(serializer.data)
         except Customer.DoesNotExist:
@@ -146,12 +148,15 @@ class SupportRepresentativeViewSet(viewsets.ModelViewSet):
         """
         user = self.request.user
         
+        # Ordered so pages are stable
+        queryset = SupportRepresentative.objects.select_related('user').with_active_requests_count().order_by('id')
+        
         # Support staff can see all support representatives
         if user.role == 'support_staff':
-            return SupportRepresentative.objects.all()
+            return queryset
         
         # Regular users can only see their own support profile if they have one
-        return SupportRepresentative.objects.filter(user=user)
+        return queryset.filter(user=user)
     
     @action(detail=False, methods=['get'])
     def me(self, request):
@@ -165,7 +170,7 @@ class SupportRepresentativeViewSet(viewsets.ModelViewSet):
             )
         
         try:
-            support_rep = SupportRepresentative.objects.get(user=request.user)
+            support_rep = self.get_queryset().get(user=request.user)
             serializer = self.get_serializer(support_rep)
             return Response(serializer.data)
         except SupportRepresentative.DoesNotExist:
@@ -0,0 +1,21 @@
+"""
+URL configuration used under ASGI; gas_utility.routing.AsgiUrlconfMiddleware selects it.
+
+The service request API and the customer dashboard are served by the async
+views in requests.async_views, which also stream live updates to the support
+dashboard. Every other URL is routed by gas_utility.urls.
+"""
+from django.urls import path, include
+from rest_framework.routers import DefaultRouter
+
+from requests.async_views import AsyncServiceRequestViewSet, dashboard, support_dashboard_events
+
+router = DefaultRouter()
+router.register(r'service-requests', AsyncServiceRequestViewSet)
+
+urlpatterns = [
+    path('api/', include(router.urls)),
+    path('dashboard/', dashboard, name='dashboard'),
+    path('support/dashboard/events/', support_dashboard_events, name='support_dashboard_events'),
+    path('', include('gas_utility.urls')),
+]
@@ -0,0 +1,341 @@
+"""
+Prometheus metrics for the web application, served at ``/metrics``.
+
+MetricsMiddleware records, per URL name, a request latency histogram,
+request and error counters, and the number and duration of SQL queries.
+Code that keeps a cache reports lookups with ``record_cache_lookup``. Two
+gauges are computed when ``/metrics`` is scraped: the service request
+backlog by status and priority (read from the materialized
+ServiceRequestCounter rows), and each cache's hit ratio.
+
+Gunicorn runs several worker processes and a scrape reaches only one of
+them. With ``METRICS_DIR`` set, every process writes its counters to its own
+file in that directory, at most every ``METRICS_FLUSH_INTERVAL`` seconds
+and when it exits. ``/metrics`` then adds up the files of all processes,
+including processes that have exited, so counters never go backwards.
+Empty the directory when the server starts, e.g. in gunicorn's
+``on_starting`` hook. Without ``METRICS_DIR``, the scraped process reports
+only its own counters.
+"""
+import atexit
+import json
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+
+from .query_observers import observe_queries
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+HTTP_METHODS = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'}
+
+# name: (type, help, label names)
+METRICS = {
+    'gas_utility_http_requests_total': ('counter', 'HTTP requests by URL name, method and status code.', ('view', 'method', 'status')),
+    'gas_utility_http_errors_total': ('counter', 'HTTP requests answered with a 5xx status.', ('view', 'method')),
+    'gas_utility_http_request_duration_seconds': ('histogram', 'Time spent handling a request.', ('view',)),
+    'gas_utility_db_queries_total': ('counter', 'SQL queries run while handling requests.', ('view',)),
+    'gas_utility_db_query_duration_seconds_total': ('counter', 'Time spent in SQL queries while handling requests.', ('view',)),
+    'gas_utility_cache_lookups_total': ('counter', 'Cache lookups by cache and result (hit or miss).', ('cache', 'result')),
+}
+GAUGES = {
+    'gas_utility_service_requests': 'Service requests by status and priority.',
+    'gas_utility_cache_hit_ratio': 'Share of cache lookups that were hits.',
+}
+
+
+class Registry:
+    """
+    This process's counters and histograms.
+
+    Series are keyed by (metric name, label values). A forked child starts
+    from zero with a file of its own, so nothing is counted twice.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.pid = os.getpid()
+        self.file_name = f'{self.pid}-{uuid.uuid4().hex[:12]}.json'
+        self.counters = defaultdict(float)
+        # key -> [bucket counts..., sum, count]
+        self.histograms = {}
+        self.dirty = False
+        self.flusher = None
+
+    def _check_process(self):
+        if os.getpid() != self.pid:
+            self.reset()
+
+    def inc(self, name, labels, amount=1):
+        with self.lock:
+            self._check_process()
+            self.counters[name, labels] += amount
+            self._changed()
+
+    def observe(self, name, labels, value):
+        with self.lock:
+            self._check_process()
+            series = self.histograms.get((name, labels))
+            if series is None:
+                series = self.histograms[name, labels] = [0] * (len(LATENCY_BUCKETS) + 2)
+            for index, bound in enumerate(LATENCY_BUCKETS):
+                if value <= bound:
+                    series[index] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+            self._changed()
+
+    def _changed(self):
+        self.dirty = True
+        if self.flusher is None and getattr(settings, 'METRICS_DIR', None):
+            self.flusher = threading.Thread(target=self._flush_periodically, name='metrics-flush', daemon=True)
+            self.flusher.start()
+            atexit.register(self.flush)
+
+    def snapshot(self):
+        with self.lock:
+            self._check_process()
+            return {
+                'counters': [[name, list(labels), value] for (name, labels), value in self.counters.items()],
+                'histograms': [[name, list(labels), list(series)] for (name, labels), series in self.histograms.items()],
+            }
+
+    def flush(self):
+        """Write this process's snapshot to its file in METRICS_DIR."""
+        directory = getattr(settings, 'METRICS_DIR', None)
+        if not directory:
+            return
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        with self.flush_lock:
+            self.dirty = False
+            snapshot = self.snapshot()
+            temporary = directory / f'.{self.file_name}.tmp'
+            temporary.write_text(json.dumps(snapshot))
+            os.replace(temporary, directory / self.file_name)
+
+    def _flush_periodically(self):
+        while True:
+            time.sleep(getattr(settings, 'METRICS_FLUSH_INTERVAL', 1.0))
+            if self.dirty:
+                self.flush()
+
+
+registry = Registry()
+
+
+def record_cache_lookup(cache, hit):
+    """Count one lookup in the cache called ``cache``."""
+    registry.inc('gas_utility_cache_lookups_total', (cache, 'hit' if hit else 'miss'))
+
+
+def collect_snapshots():
+    """Return the snapshots of all processes (or only this one without METRICS_DIR)."""
+    directory = getattr(settings, 'METRICS_DIR', None)
+    if not directory:
+        return [registry.snapshot()]
+    registry.flush()
+    snapshots = []
+    for path in Path(directory).glob('*.json'):
+        try:
+            snapshots.append(json.loads(path.read_text()))
+        except (OSError, ValueError):
+            continue
+    return snapshots
+
+
+def merge(snapshots):
+    """Add up counters and histogram series with the same name and labels."""
+    counters = defaultdict(float)
+    histograms = {}
+    for snapshot in snapshots:
+        for name, labels, value in snapshot.get('counters', []):
+            counters[name, tuple(labels)] += value
+        for name, labels, series in snapshot.get('histograms', []):
+            merged = histograms.setdefault((name, tuple(labels)), [0] * len(series))
+            for index, value in enumerate(series):
+                merged[index] += value
+    return counters, histograms
+
+
+def format_labels(names, values):
+    if not names:
+        return ''
+    escaped = (str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n') for value in values)
+    return '{' + ','.join(f'{name}="{value}"' for name, value in zip(names, escaped)) + '}'
+
+
+def format_number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def service_request_gauge():
+    """Yield ((status, priority), count) from the materialized counters."""
+    from django.db.models import Sum
+    from requests.models import ServiceRequestCounter
+
+    rows = ServiceRequestCounter.objects.values('status', 'priority').annotate(total=Sum('count')).order_by('status', 'priority')
+    for row in rows:
+        yield (row['status'], row['priority']), row['total']
+
+
+def render_metrics():
+    """Return all metrics in the Prometheus text exposition format."""
+    counters, histograms = merge(collect_snapshots())
+    lines = []
+    for name, (metric_type, help_text, label_names) in METRICS.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {metric_type}')
+        if metric_type == 'counter':
+            for (series_name, labels), value in sorted(counters.items()):
+                if series_name == name:
+                    lines.append(f'{name}{format_labels(label_names, labels)} {format_number(value)}')
+            continue
+        for (series_name, labels), series in sorted(histograms.items()):
+            if series_name != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS, series):
+                cumulative += count
+                lines.append(f"{name}_bucket{format_labels(label_names + ('le',), labels + (bound,))} {cumulative}")
+            lines.append(f"{name}_bucket{format_labels(label_names + ('le',), labels + ('+Inf',))} {series[-1]}")
+            lines.append(f'{name}_sum{format_labels(label_names, labels)} {format_number(series[-2])}')
+            lines.append(f'{name}_count{format_labels(label_names, labels)} {series[-1]}')
+
+    lines.append(f"# HELP gas_utility_service_requests {GAUGES['gas_utility_service_requests']}")
+    lines.append('# TYPE gas_utility_service_requests gauge')
+    for labels, value in service_request_gauge():
+        lines.append(f"gas_utility_service_requests{format_labels(('status', 'priority'), labels)} {value}")
+
+    lookups = defaultdict(lambda: {'hit': 0, 'miss': 0})
+    for (name, labels), value in counters.items():
+        if name == 'gas_utility_cache_lookups_total':
+            cache, result = labels
+            lookups[cache][result] += value
+    lines.append(f"# HELP gas_utility_cache_hit_ratio {GAUGES['gas_utility_cache_hit_ratio']}")
+    lines.append('# TYPE gas_utility_cache_hit_ratio gauge')
+    for cache, results in sorted(lookups.items()):
+        total = results['hit'] + results['miss']
+        lines.append(f'gas_utility_cache_hit_ratio{format_labels(("cache",), (cache,))} {results["hit"] / total if total else 0.0}')
+    return '\n'.join(lines) + '\n'
+
+
+class QueryCounter:
+    """Query observer counting queries and the time spent in them."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+
+
+def view_label(request):
+    """The URL name of the matched view, to keep the number of series small."""
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match is not None else 'unmatched'
+
+
+class MetricsMiddleware:
+    """
+    Record latency, status, errors and SQL queries of every request.
+
+    Put it first in MIDDLEWARE so the latency includes the other middleware.
+    Set METRICS_ENABLED to False to remove it. Works in both sync and async
+    middleware chains, so it adds no thread switch under ASGI.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if not getattr(settings, 'METRICS_ENABLED', True):
+            raise MiddlewareNotUsed
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with self.measure(request) as measured:
+            measured['response'] = self.get_response(request)
+        return measured['response']
+
+    async def __acall__(self, request):
+        with self.measure(request) as measured:
+            measured['response'] = await self.get_response(request)
+        return measured['response']
+
+    @contextmanager
+    def measure(self, request):
+        """Count the queries and time of the block, which stores its response in the yielded dict."""
+        queries = QueryCounter()
+        measured = {}
+        with observe_queries(queries):
+            started = time.perf_counter()
+            yield measured
+            elapsed = time.perf_counter() - started
+
+        response = measured['response']
+        view = view_label(request)
+        method = request.method if request.method in HTTP_METHODS else 'other'
+        registry.inc('gas_utility_http_requests_total', (view, method, str(response.status_code)))
+        if response.status_code >= 500:
+            registry.inc('gas_utility_http_errors_total', (view, method))
+        registry.observe('gas_utility_http_request_duration_seconds', (view,), elapsed)
+        if queries.count:
+            registry.inc('gas_utility_db_queries_total', (view,), queries.count)
+            registry.inc('gas_utility_db_query_duration_seconds_total', (view,), queries.duration)
+
+
+class InstrumentedLocMemCache(LocMemCache):
+    """The local-memory cache backend, with ``get`` hits and misses counted in /metrics."""
+
+    _missing = object()
+
+    def __init__(self, name, params):
+        super().__init__(name, params)
+        self.metrics_name = name or 'default'
+
+    def get(self, key, default=None, version=None):
+        value = super().get(key, self._missing, version)
+        record_cache_lookup(self.metrics_name, value is not self._missing)
+        return default if value is self._missing else value
+
+
+def metrics_view(request):
+    """
+    Serve /metrics to requests bearing METRICS_TOKEN or coming from an address
+    listed in METRICS_ALLOWED_IPS; everyone else is refused, local addresses
+    included, since behind a reverse proxy every request arrives from one.
+    """
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    allowed = (
+        token and constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}')
+    ) or request.META.get('REMOTE_ADDR') in getattr(settings, 'METRICS_ALLOWED_IPS', ())
+    if not allowed:
+        return HttpResponseForbidden()
+    return HttpResponse(render_metrics(), content_type=CONTENT_TYPE)
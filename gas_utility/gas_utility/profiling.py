@@ -0,0 +1,257 @@
+"""
+Per-request timing and on-demand profiling.
+
+With ``SERVER_TIMING`` on, ServerTimingMiddleware adds a ``Server-Timing``
+header to every response. The header holds total view time, SQL queries and
+SQL time, template rendering time and serializer time, and browser dev tools
+show it next to the request.
+
+With ``REQUEST_PROFILING`` on, a staff user can profile a single request by
+sending ``X-Profile: cprofile`` or ``X-Profile: memory``, or by adding
+``?_profile=cprofile`` or ``?_profile=memory`` to the URL. The request then
+runs under cProfile or tracemalloc, and the result is saved in
+``REQUEST_PROFILE_DIR``. The ``X-Profile-Download`` response header links
+to it. Load ``.prof`` files with ``pstats`` or snakeviz, and ``.tracemalloc``
+files with ``tracemalloc.Snapshot.load``.
+
+When both settings are off the middleware removes itself at startup, and the
+template and serializer hooks cost one context variable lookup.
+
+Under ASGI, cProfile only sees the event loop thread. ORM calls from async
+views run in a worker thread and are left out of the profile, but their SQL
+time is still in Server-Timing.
+"""
+import cProfile
+import re
+import threading
+import tracemalloc
+import uuid
+from collections import defaultdict
+from contextlib import ExitStack, contextmanager, nullcontext
+from contextvars import ContextVar
+from pathlib import Path
+from time import perf_counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import FileResponse, Http404
+from django.template.backends.django import DjangoTemplates, Template
+from django.urls import reverse
+from django.utils import timezone
+
+from .query_observers import observe_queries
+
+# Timings of the request being handled in this thread or task, if measured
+current_timings = ContextVar('current_timings', default=None)
+
+PROFILE_MODES = {'cprofile': '.prof', 'memory': '.tracemalloc'}
+PROFILE_NAME = re.compile(r'^[0-9]{8}-[0-9]{6}-[0-9a-f]{32}\.(prof|tracemalloc)$')
+
+# tracemalloc traces the whole process, so memory profiles run one at a time
+_memory_profile_lock = threading.Lock()
+
+
+class RequestTimings:
+    """Accumulated durations (in seconds) and the SQL query count of one request."""
+
+    def __init__(self):
+        self.durations = defaultdict(float)
+        self.queries = 0
+        self.active = set()
+
+    @contextmanager
+    def measure(self, metric):
+        # Nested measurements of the same metric (an include, a nested serializer) count once
+        if metric in self.active:
+            yield
+            return
+        self.active.add(metric)
+        started = perf_counter()
+        try:
+            yield
+        finally:
+            self.durations[metric] += perf_counter() - started
+            self.active.discard(metric)
+
+    def execute_wrapper(self, execute, sql, params, many, context):
+        started = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.durations['sql'] += perf_counter() - started
+            self.queries += 1
+
+    def header(self, total, extra=()):
+        """Return the Server-Timing header value, durations in milliseconds."""
+        entries = [f'total;dur={total * 1000:.1f}']
+        entries.append(f'sql;dur={self.durations["sql"] * 1000:.1f};desc="{self.queries} queries"')
+        for metric in ('template', 'serializer'):
+            if metric in self.durations:
+                entries.append(f'{metric};dur={self.durations[metric] * 1000:.1f}')
+        entries.extend(extra)
+        return ', '.join(entries)
+
+
+def timed(metric):
+    """Measure the block as ``metric`` if the current request is being timed."""
+    timings = current_timings.get()
+    return timings.measure(metric) if timings is not None else nullcontext()
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        with timed('template'):
+            return super().render(context, request)
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """The Django template backend, with rendering time reported in Server-Timing."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code).template, self)
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name).template, self)
+
+
+class TimedSerializerMixin:
+    """Serializer mixin that reports ``to_representation`` time in Server-Timing."""
+
+    def to_representation(self, instance):
+        with timed('serializer'):
+            return super().to_representation(instance)
+
+
+def profile_directory():
+    return Path(getattr(settings, 'REQUEST_PROFILE_DIR', settings.BASE_DIR / 'profiles'))
+
+
+def prune_profiles(directory, keep):
+    """Delete all but the ``keep`` newest saved profiles."""
+    saved = sorted(path for path in directory.iterdir() if PROFILE_NAME.match(path.name))
+    for path in saved[:-keep]:
+        path.unlink(missing_ok=True)
+
+
+class ServerTimingMiddleware:
+    """
+    Add Server-Timing to responses and profile single requests for staff on demand.
+
+    Must come after AuthenticationMiddleware, which identifies staff users.
+    Streaming responses are timed until the view returns them.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.server_timing = getattr(settings, 'SERVER_TIMING', False)
+        self.profiling = getattr(settings, 'REQUEST_PROFILING', False)
+        if not (self.server_timing or self.profiling):
+            raise MiddlewareNotUsed
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def requested_profile(self, request):
+        """Return the profile mode asked for in the request, before checking who asked."""
+        mode = request.headers.get('X-Profile') or request.GET.get('_profile')
+        return mode if self.profiling and mode in PROFILE_MODES else None
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        mode = self.requested_profile(request)
+        if mode and not (request.user.is_authenticated and request.user.is_staff):
+            mode = None
+        if not (self.server_timing or mode):
+            return self.get_response(request)
+        with self.measure(mode) as measured:
+            measured['response'] = self.get_response(request)
+        return measured['response']
+
+    async def __acall__(self, request):
+        mode = self.requested_profile(request)
+        if mode:
+            user = await request.auser()
+            if not (user.is_authenticated and user.is_staff):
+                mode = None
+        if not (self.server_timing or mode):
+            return await self.get_response(request)
+        with self.measure(mode) as measured:
+            measured['response'] = await self.get_response(request)
+        return measured['response']
+
+    @contextmanager
+    def measure(self, mode):
+        """
+        Time the block, and profile it if ``mode`` is set. The block stores its
+        response in the yielded dict; the response then gets the headers.
+        """
+        timings = RequestTimings()
+        measured = {}
+        token = current_timings.set(timings)
+        try:
+            with ExitStack() as stack:
+                stack.enter_context(observe_queries(timings.execute_wrapper))
+                profile = stack.enter_context(self.profile(mode)) if mode else {'name': None, 'extra': []}
+                started = perf_counter()
+                yield measured
+                total = perf_counter() - started
+        finally:
+            current_timings.reset(token)
+        response = measured['response']
+        response.headers['Server-Timing'] = timings.header(total, profile['extra'])
+        if profile['name']:
+            response.headers['X-Profile-Download'] = reverse('profile_download', args=[profile['name']])
+
+    @contextmanager
+    def profile(self, mode):
+        """
+        Run the block under the profiler for ``mode`` and save the result. The
+        yielded dict receives the saved profile's ``name`` and ``extra`` Server-Timing entries.
+        """
+        directory = profile_directory()
+        directory.mkdir(parents=True, exist_ok=True)
+        name = f"{timezone.now().strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex}{PROFILE_MODES[mode]}"
+        profile = {'name': None, 'extra': []}
+
+        if mode == 'cprofile':
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                yield profile
+            finally:
+                profiler.disable()
+            profiler.dump_stats(directory / name)
+        else:
+            if not _memory_profile_lock.acquire(blocking=False):
+                profile['extra'].append('memory;desc="skipped, another memory profile is running"')
+                yield profile
+                return
+            try:
+                tracemalloc.start(25)
+                try:
+                    yield profile
+                    snapshot = tracemalloc.take_snapshot()
+                    peak = tracemalloc.get_traced_memory()[1]
+                finally:
+                    tracemalloc.stop()
+            finally:
+                _memory_profile_lock.release()
+            snapshot.dump(str(directory / name))
+            profile['extra'].append(f'memory;desc="peak {peak / 1024 / 1024:.1f} MB"')
+
+        prune_profiles(directory, getattr(settings, 'REQUEST_PROFILE_KEEP', 50))
+        profile['name'] = name
+
+
+@staff_member_required
+def profile_download(request, name):
+    """Download a profile saved by ServerTimingMiddleware."""
+    path = profile_directory() / name
+    if not PROFILE_NAME.match(name) or not path.is_file():
+        raise Http404("No such profile.")
+    return FileResponse(path.open('rb'), as_attachment=True, filename=name)
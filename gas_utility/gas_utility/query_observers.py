@@ -0,0 +1,54 @@
+"""
+Watch the SQL queries of the current request, whichever thread runs them.
+
+``connection.execute_wrapper()`` only wraps the calling thread's connection.
+Under ASGI, an async view's ORM calls run in a worker thread that has
+connections of its own, so a middleware wrapper would miss them. Instead,
+every connection gets one permanent wrapper when it connects. That wrapper
+passes each query through the observers that ``observe_queries`` registered
+in the current context. Context variables follow ``sync_to_async`` into the
+worker thread.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import partial
+
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+_observers = ContextVar('query_observers', default=())
+
+
+def _execute(execute, sql, params, many, context):
+    # The first registered observer is the outermost wrapper
+    for observer in reversed(_observers.get()):
+        execute = partial(observer, execute)
+    return execute(sql, params, many, context)
+
+
+def install(connection):
+    if _execute not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_execute)
+
+
+def _connection_created(sender, connection, **kwargs):
+    install(connection)
+
+
+connection_created.connect(_connection_created, dispatch_uid='gas_utility.query_observers')
+
+
+@contextmanager
+def observe_queries(observer):
+    """
+    Pass every query run in this context through ``observer`` until the block
+    exits. ``observer`` takes the arguments of an execute_wrapper.
+    """
+    # Connections this thread opened before this module was imported
+    for connection in connections.all(initialized_only=True):
+        install(connection)
+    token = _observers.set(_observers.get() + (observer,))
+    try:
+        yield
+    finally:
+        _observers.reset(token)
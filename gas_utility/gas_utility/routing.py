@@ -0,0 +1,33 @@
+"""
+URLconf selection per server interface.
+
+Requests served through ``gas_utility.asgi`` are routed by ASGI_ROOT_URLCONF,
+which adds the async views; WSGI requests and everything else resolving URLs
+without a request (management commands, tests) use ROOT_URLCONF.
+"""
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+
+
+class AsgiUrlconfMiddleware:
+    """
+    Route ASGI requests with ASGI_ROOT_URLCONF by setting ``request.urlconf``.
+
+    Django resolves the request, and reverses URLs while handling it, with
+    that URLconf. Settings are left alone, so one process can serve both.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.urlconf = getattr(settings, 'ASGI_ROOT_URLCONF', None)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.urlconf and isinstance(request, ASGIRequest):
+            request.urlconf = self.urlconf
+        return self.get_response(request)
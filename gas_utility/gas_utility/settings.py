@@ -44,20 +44,26 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'gas_utility.metrics.MetricsMiddleware',
+    'gas_utility.routing.AsgiUrlconfMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'accounts.profiles.ProfileMiddleware',
+    'gas_utility.profiling.ServerTimingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
 ROOT_URLCONF = 'gas_utility.urls'
+# Requests served through gas_utility.asgi also get the async views; see gas_utility/routing.py
+ASGI_ROOT_URLCONF = 'gas_utility.asgi_urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'gas_utility.profiling.TimedDjangoTemplates',
         'DIRS': [BASE_DIR / 'templates'],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -146,6 +152,7 @@ REST_FRAMEWORK = {
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework.authentication.SessionAuthentication',
+        'accounts.authentication.ApiTokenAuthentication',
         'rest_framework.authentication.BasicAuthentication',
     ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
@@ -157,6 +164,11 @@ REST_FRAMEWORK = {
     ],
 }
 
+# API tokens for integration clients; see accounts/authentication.py. Tokens
+# issued with "manage.py api_token issue" expire after API_TOKEN_EXPIRY_DAYS
+# unless another lifetime is given.
+API_TOKEN_EXPIRY_DAYS = 90
+
 # Security settings
 if not DEBUG:
     # HTTPS settings
@@ -174,6 +186,10 @@ if not DEBUG:
     SECURE_BROWSER_XSS_FILTER = True
     X_FRAME_OPTIONS = 'DENY'
 
+# Outgoing email (customer notifications are sent by the job worker, manage.py run_jobs)
+EMAIL_BACKEND = os.environ.get('EMAIL_BACKEND', 'django.core.mail.backends.console.EmailBackend')
+DEFAULT_FROM_EMAIL = os.environ.get('DEFAULT_FROM_EMAIL', 'no-reply@gas-utility.local')
+
 # Login URL
 LOGIN_URL = 'login'
 LOGIN_REDIRECT_URL = 'dashboard'
@@ -181,3 +197,70 @@ LOGOUT_REDIRECT_URL = 'login'
 
 # File upload settings
 FILE_UPLOAD_MAX_MEMORY_SIZE = 5 * 1024 * 1024  # 5 MB
+
+# Let the web server send attachment files once the view has checked access:
+# 'X-Sendfile' (Apache, lighttpd) or 'X-Accel-Redirect' (nginx). For nginx, map
+# ATTACHMENT_ACCEL_REDIRECT_PREFIX to MEDIA_ROOT in an internal location.
+ATTACHMENT_SENDFILE_HEADER = os.environ.get('ATTACHMENT_SENDFILE_HEADER') or None
+ATTACHMENT_ACCEL_REDIRECT_PREFIX = os.environ.get('ATTACHMENT_ACCEL_REDIRECT_PREFIX', '/protected-media/')
+
+# Prometheus metrics at /metrics; see gas_utility/metrics.py. Under gunicorn set
+# METRICS_DIR to a directory shared by the workers (emptied when the server
+# starts) so a scrape adds up all worker processes. /metrics answers only
+# requests with "Authorization: Bearer $METRICS_TOKEN" or from an address in
+# METRICS_ALLOWED_IPS (comma-separated, empty by default). Behind a reverse
+# proxy REMOTE_ADDR is the proxy's address, so use the token there.
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'True') == 'True'
+METRICS_DIR = os.environ.get('METRICS_DIR') or None
+METRICS_FLUSH_INTERVAL = 1.0
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN') or None
+METRICS_ALLOWED_IPS = [ip.strip() for ip in os.environ.get('METRICS_ALLOWED_IPS', '').split(',') if ip.strip()]
+
+# Local-memory cache with hits and misses reported in /metrics
+CACHES = {
+    'default': {
+        'BACKEND': 'gas_utility.metrics.InstrumentedLocMemCache',
+        'LOCATION': 'default',
+    },
+    # Verified API tokens. Each process keeps its own copies, so a revoked token
+    # is refused everywhere once TIMEOUT seconds have passed.
+    'api_tokens': {
+        'BACKEND': 'gas_utility.metrics.InstrumentedLocMemCache',
+        'LOCATION': 'api_tokens',
+        'TIMEOUT': 30,
+        'OPTIONS': {'MAX_ENTRIES': 1000},
+    },
+}
+
+# Per-request timing and profiling; see gas_utility/profiling.py. SERVER_TIMING
+# adds a Server-Timing header (view, SQL, template and serializer time) to every
+# response. REQUEST_PROFILING lets staff profile one request with an
+# "X-Profile: cprofile|memory" header or ?_profile=cprofile|memory.
+SERVER_TIMING = os.environ.get('SERVER_TIMING', str(DEBUG)) == 'True'
+REQUEST_PROFILING = os.environ.get('REQUEST_PROFILING', 'False') == 'True'
+REQUEST_PROFILE_DIR = BASE_DIR / 'profiles'
+# Saved profiles kept; older ones are deleted
+REQUEST_PROFILE_KEEP = 50
+
+# Live updates on the support dashboard, streamed under ASGI; see requests/live.py.
+# Each server process reads new changes once per LIVE_UPDATES_POLL_INTERVAL
+# seconds while dashboards are open; changes are kept for reconnecting clients
+# for LIVE_UPDATES_RETENTION_HOURS.
+LIVE_UPDATES_POLL_INTERVAL = float(os.environ.get('LIVE_UPDATES_POLL_INTERVAL', '1.0'))
+# Seconds between keep-alive comments on an idle stream
+LIVE_UPDATES_HEARTBEAT = 15
+LIVE_UPDATES_RETENTION_HOURS = 24
+
+# Sessions are signed cookies with a server-side revocation list; see
+# accounts/sessions.py. Page views read and write no session table; sign-out
+# stores the cookie's id, which every process reads within
+# SESSION_REVOCATION_REFRESH seconds. "manage.py purge_sessions" deletes
+# revocations and database sessions that have expired, in batches of
+# SESSION_PURGE_BATCH_SIZE rows. DJANGO_SESSION_ENGINE selects another engine,
+# e.g. django.contrib.sessions.backends.db.
+SESSION_ENGINE = os.environ.get('DJANGO_SESSION_ENGINE', 'accounts.sessions')
+SESSION_REVOCATION_REFRESH = 5
+SESSION_PURGE_BATCH_SIZE = 1000
+
+# Bulk actions on the support dashboard post one field per selected request
+DATA_UPLOAD_MAX_NUMBER_FIELDS = 10000
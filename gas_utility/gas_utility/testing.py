@@ -0,0 +1,167 @@
+"""
+Test helpers for keeping an eye on database cost.
+
+``query_budget`` works as a context manager or decorator and fails the test
+when the wrapped code runs more SQL queries, or spends more time in SQL, than
+allowed. The failure message groups the captured queries by pattern so
+repeated (N+1) queries stand out.
+"""
+import re
+from collections import Counter
+from functools import wraps
+
+from django.db import connections
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST = re.compile(r'\bIN \((?:\s*\?\s*,)*\s*\?\s*\)')
+
+
+def normalize_sql(sql):
+    """Replace literal values in ``sql`` with ``?`` so repeated queries share one pattern."""
+    sql = _STRING_LITERAL.sub('?', sql)
+    sql = _NUMBER_LITERAL.sub('?', sql)
+    return _IN_LIST.sub('IN (...)', sql)
+
+
+class QueryBudget:
+    """
+    Assert an upper bound on SQL queries and total SQL time.
+
+    Usable as ``with query_budget(5):`` or as a ``@query_budget(5)`` decorator.
+    After the block exits, ``queries`` holds the captured queries.
+    """
+
+    def __init__(self, max_queries, max_time=None, using='default'):
+        self.max_queries = max_queries
+        self.max_time = max_time
+        self.using = using
+        self.queries = []
+
+    def __enter__(self):
+        self._context = CaptureQueriesContext(connections[self.using])
+        self._context.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._context.__exit__(exc_type, exc_value, traceback)
+        self.queries = self._context.captured_queries
+        if exc_type is None:
+            self.check()
+
+    def __call__(self, func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with QueryBudget(self.max_queries, self.max_time, self.using):
+                return func(*args, **kwargs)
+        return wrapper
+
+    @property
+    def total_time(self):
+        return sum(float(query['time']) for query in self.queries)
+
+    def check(self):
+        problems = []
+        if len(self.queries) > self.max_queries:
+            problems.append(f'{len(self.queries)} queries executed, budget is {self.max_queries}')
+        if self.max_time is not None and self.total_time > self.max_time:
+            problems.append(f'{self.total_time:.3f}s spent in SQL, budget is {self.max_time:.3f}s')
+        if problems:
+            raise AssertionError('; '.join(problems) + '\n' + self.report())
+
+    def report(self):
+        """Describe the captured queries, most repeated patterns first."""
+        patterns = Counter(normalize_sql(query['sql']) for query in self.queries)
+        lines = []
+        duplicates = [(pattern, count) for pattern, count in patterns.most_common() if count > 1]
+        if duplicates:
+            lines.append('Repeated query patterns:')
+            lines.extend(f'  {count}x {pattern}' for pattern, count in duplicates)
+        lines.append('Captured queries:')
+        lines.extend(
+            f"  {index}. [{float(query['time']):.3f}s] {query['sql']}"
+            for index, query in enumerate(self.queries, 1)
+        )
+        return '\n'.join(lines)
+
+
+def query_budget(max_queries, max_time=None, using='default'):
+    """Return a QueryBudget for use as a context manager or decorator."""
+    return QueryBudget(max_queries, max_time, using)
+
+
+@override_settings(
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+    # Read once in setUpClass, so no refresh query lands inside a query budget
+    SESSION_REVOCATION_REFRESH=3600,
+)
+class ServiceDataTestCase(TestCase):
+    """
+    TestCase seeded with a realistic mix of customers, support reps and requests.
+
+    There are more requests than any list page shows, so a view that issues a
+    query per row blows its budget. ``customer_user`` and ``staff_user`` cover
+    both roles; ``customer`` owns ``CUSTOMER_REQUESTS`` requests.
+    """
+    CUSTOMERS = 12
+    REPS = 4
+    CUSTOMER_REQUESTS = 25
+    REQUESTS_PER_OTHER_CUSTOMER = 4
+    PASSWORD = 'budget-pass-123'
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        from accounts.sessions import revocations
+        revocations.refresh(force=True)
+
+    @classmethod
+    def setUpTestData(cls):
+        from accounts.models import User, Customer, SupportRepresentative
+        from requests.models import ServiceRequest
+
+        cls.staff_user = User.objects.create_user(
+            username='staff', email='staff@example.com', password=cls.PASSWORD,
+            role='support_staff', is_staff=True, first_name='Sam', last_name='Staff'
+        )
+        cls.staff_rep = SupportRepresentative.objects.create(user=cls.staff_user, department='Field')
+        cls.reps = [cls.staff_rep] + [
+            SupportRepresentative.objects.create(user=User.objects.create_user(
+                username=f'rep{index}', email=f'rep{index}@example.com',
+                role='support_staff', first_name='Rep', last_name=str(index)
+            ))
+            for index in range(1, cls.REPS)
+        ]
+
+        cls.customers = []
+        for index in range(cls.CUSTOMERS):
+            user = User.objects.create_user(
+                username=f'customer{index}', email=f'customer{index}@example.com',
+                password=cls.PASSWORD if index == 0 else None,
+                first_name='Customer', last_name=str(index)
+            )
+            cls.customers.append(Customer.objects.create(user=user, phone_number='+919876543210'))
+        cls.customer = cls.customers[0]
+        cls.customer_user = cls.customer.user
+
+        statuses = [choice for choice, _ in ServiceRequest.STATUS_CHOICES]
+        priorities = [choice for choice, _ in ServiceRequest.PRIORITY_CHOICES]
+        service_types = [choice for choice, _ in ServiceRequest.SERVICE_TYPES]
+        counter = 0
+        for customer in cls.customers:
+            count = cls.CUSTOMER_REQUESTS if customer == cls.customer else cls.REQUESTS_PER_OTHER_CUSTOMER
+            for _ in range(count):
+                ServiceRequest.objects.create(
+                    customer=customer,
+                    service_type=service_types[counter % len(service_types)],
+                    description=f'Gas issue number {counter} reported near the meter',
+                    status=statuses[counter % len(statuses)],
+                    priority=priorities[counter % len(priorities)],
+                    assigned_to=cls.reps[counter % len(cls.reps)] if counter % 3 else None,
+                    notes='Initial triage done' if counter % 2 else None,
+                )
+                counter += 1
+        cls.customer_request = ServiceRequest.objects.filter(customer=cls.customer).first()
+        cls.other_request = ServiceRequest.objects.exclude(customer=cls.customer).first()
@@ -19,6 +19,8 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 from rest_framework.documentation import include_docs_urls
+from .metrics import metrics_view
+from .profiling import profile_download
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -27,6 +29,12 @@ urlpatterns = [
     
     # DRF authentication
     path('api-auth/', include('rest_framework.urls')),
+
+    # Prometheus metrics
+    path('metrics', metrics_view, name='metrics'),
+
+    # Profiles captured by gas_utility.profiling.ServerTimingMiddleware (staff only)
+    path('profiles/<str:name>/', profile_download, name='profile_download'),
     
     # # API documentation
     # path('api/docs/', include_docs_urls(title='Gas Utility API')),
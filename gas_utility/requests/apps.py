@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class RequestsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'requests'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from . import tasks  # noqa: F401
@@ -0,0 +1,282 @@
+"""
+Async versions of the read-heavy views. Under ASGI, gas_utility.asgi_urls routes to them.
+
+The service request API list, detail and statistics endpoints and the
+customer dashboard read through Django's async ORM. An ASGI server therefore
+does not hand each of these requests to a thread pool. Queries that don't
+depend on each other are awaited together with ``asyncio.gather``: a page
+and its row count, or the statistics counters and resolution times.
+Django 5.1 still runs the async ORM calls of one request in one worker
+thread, so the gathered queries reach the database one after the other.
+
+The async handlers serve JSON to users signed in with a session. Writes,
+HTTP Basic and API token authentication, the browsable API and cursor
+pagination are sent to the synchronous viewset, which runs in a worker thread.
+
+``support_dashboard_events`` streams live updates to the support dashboard;
+see requests.live.
+"""
+import asyncio
+import logging
+
+from asgiref.sync import sync_to_async
+from django.contrib import messages
+from django.contrib.auth.decorators import login_required
+from django.core.exceptions import ValidationError
+from django.core.paginator import EmptyPage, InvalidPage, Page, PageNotAnInteger, Paginator
+from django.http import Http404, HttpResponseForbidden, StreamingHttpResponse
+from django.shortcuts import redirect, render
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import status
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+
+from .conditional import Validators, alist_state, arequest_state, has_conditions
+from .live import event_stream, get_feed
+from .models import ServiceRequest, ServiceRequestCounter
+from .pagination import CountedPageNumberPagination
+from .serializers import ServiceRequestStatisticsSerializer
+from .views import ServiceRequestViewSet, filter_customer_requests, statistics_data
+
+logger = logging.getLogger(__name__)
+
+
+async def fetch_all(queryset):
+    """Evaluate ``queryset``, prefetches included, without blocking the event loop."""
+    return [obj async for obj in queryset]
+
+
+async def apage(paginator, number):
+    """
+    Async ``Paginator.page()`` for a paginator over a queryset (without orphans).
+
+    The row count and the page's rows are fetched together, and the count is
+    then cached on the paginator. ``number`` may be 'last'. Raises InvalidPage
+    like ``Paginator.page()``.
+    """
+    queryset = paginator.object_list
+    counted = 'count' in vars(paginator)
+    if number == 'last':
+        if not counted:
+            paginator.count = await queryset.acount()
+            counted = True
+        number = paginator.num_pages
+    try:
+        requested = int(number)
+    except (TypeError, ValueError):
+        requested = 0
+    if requested < 1:
+        # Raises PageNotAnInteger or EmptyPage before the count is needed
+        paginator.validate_number(number)
+
+    bottom = (requested - 1) * paginator.per_page
+    rows = queryset[bottom:bottom + paginator.per_page]
+    if counted:
+        object_list = await fetch_all(rows)
+    else:
+        paginator.count, object_list = await asyncio.gather(queryset.acount(), fetch_all(rows))
+    return Page(object_list, paginator.validate_number(requested), paginator)
+
+
+class AsyncPageNumberPagination(CountedPageNumberPagination):
+    """DRF page number pagination, with ``apaginate_queryset`` for async views."""
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+
+        paginator = self.django_paginator_class(queryset, page_size)
+        page_number = request.query_params.get(self.page_query_param) or 1
+        try:
+            self.page = await apage(paginator, 'last' if page_number in self.last_page_strings else page_number)
+        except InvalidPage as exc:
+            msg = self.invalid_page_message.format(page_number=page_number, message=str(exc))
+            raise NotFound(msg)
+
+        if paginator.num_pages > 1 and self.template is not None:
+            self.display_page_controls = True
+        self.request = request
+        return list(self.page)
+
+
+class AsyncServiceRequestViewSet(ServiceRequestViewSet):
+    """
+    ServiceRequestViewSet with async list, retrieve and statistics handlers.
+
+    For routes with an async handler, ``as_view()`` returns an async view. A
+    request the handler cannot serve is passed to the synchronous view.
+    """
+    pagination_class = AsyncPageNumberPagination
+
+    # action -> async handler
+    async_actions = {'list': 'alist', 'retrieve': 'aretrieve', 'statistics': 'astatistics'}
+
+    @classmethod
+    def as_view(cls, actions=None, **initkwargs):
+        sync_view = super().as_view(actions, **initkwargs)
+        if not any(action in cls.async_actions for action in actions.values()):
+            return sync_view
+        run_sync_view = sync_to_async(sync_view)
+
+        async def view(request, *args, **kwargs):
+            if actions.get(request.method.lower()) in cls.async_actions:
+                user = await request.auser()
+                if user.is_authenticated:
+                    # SessionAuthentication reads request.user; load it here rather than in a sync call
+                    request.user = user
+                    self = cls(**initkwargs)
+                    self.action_map = actions
+                    response = await self.adispatch(request, *args, **kwargs)
+                    if response is not None:
+                        return response
+            return await run_sync_view(request, *args, **kwargs)
+
+        view.cls = cls
+        view.initkwargs = initkwargs
+        view.actions = actions
+        return csrf_exempt(view)
+
+    async def adispatch(self, request, *args, **kwargs):
+        """
+        ``dispatch()`` for the async handlers. Returns None if the handler
+        declines the request, or if the client asked for something other than JSON.
+        """
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            self.initial(request, *args, **kwargs)
+            if request.accepted_renderer.format != 'json':
+                return None
+            response = await getattr(self, self.async_actions[self.action])(request, *args, **kwargs)
+            if response is None:
+                return None
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+    async def alist(self, request, *args, **kwargs):
+        if not isinstance(self.paginator, AsyncPageNumberPagination):
+            return None
+
+        queryset = self.filter_queryset(self.get_queryset())
+        count, latest = await alist_state(queryset)
+        validators = Validators.for_list(count, latest, request.accepted_renderer.format)
+        not_modified = validators.check(request)
+        if not_modified is not None:
+            return not_modified
+
+        self.paginator.known_count = count
+        page = await self.paginator.apaginate_queryset(queryset, request, view=self)
+        if page is None:
+            return validators.apply(Response(self.get_serializer(await fetch_all(queryset), many=True).data))
+        serializer = self.get_serializer(page, many=True)
+        return validators.apply(self.paginator.get_paginated_response(serializer.data))
+
+    async def aretrieve(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        lookup = {self.lookup_field: self.kwargs[self.lookup_url_kwarg or self.lookup_field]}
+        try:
+            if has_conditions(request):
+                state = await arequest_state(queryset, **lookup)
+                response = Validators.for_request(*state, request.accepted_renderer.format).check(request) if state else None
+                if response is not None:
+                    return response
+            instance = await queryset.aget(**lookup)
+        except (queryset.model.DoesNotExist, TypeError, ValueError, ValidationError):
+            raise Http404(f'No {queryset.model._meta.object_name} matches the given query.')
+
+        self.check_object_permissions(request, instance)
+        response = Response(self.get_serializer(instance).data)
+        return Validators.for_request(instance.pk, instance.updated_at, request.accepted_renderer.format).apply(response)
+
+    async def astatistics(self, request, *args, **kwargs):
+        if not (hasattr(request.user, 'role') and request.user.role == 'support_staff'):
+            return Response(
+                {"detail": "You don't have permission to access this data."},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        try:
+            breakdown, resolution = await asyncio.gather(
+                fetch_all(ServiceRequestCounter.objects.breakdown()),
+                ServiceRequest.objects.aresolution_stats()
+            )
+            serializer = ServiceRequestStatisticsSerializer(statistics_data(breakdown, resolution))
+            return Response(serializer.data)
+
+        except Exception as e:
+            logger.error(f"Error generating statistics: {str(e)}")
+            return Response(
+                {"error": "An error occurred while generating statistics"},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+
+@login_required
+async def dashboard(request):
+    """Async version of views.dashboard."""
+    user = await request.auser()
+    if hasattr(user, 'role') and user.role == 'support_staff':
+        return redirect('support_dashboard')
+    # The auth context processor reads request.user while the template renders
+    request.user = user
+
+    status_filter = request.GET.get('status', '')
+    service_type_filter = request.GET.get('service_type', '')
+    try:
+        customer = await request.profiles.aget_or_create_customer()
+        paginator = Paginator(filter_customer_requests(customer, status_filter, service_type_filter), 10)
+
+        try:
+            requests = await apage(paginator, request.GET.get('page'))
+        except PageNotAnInteger:
+            requests = await apage(paginator, 1)
+        except EmptyPage:
+            requests = await apage(paginator, 'last')
+
+        status_choices = ServiceRequest.STATUS_CHOICES
+        service_type_choices = ServiceRequest.SERVICE_TYPES
+
+    except Exception as e:
+        logger.error(f"Error in dashboard view: {str(e)}")
+        messages.error(request, "An error occurred while loading your dashboard.")
+        requests = []
+        status_choices = []
+        service_type_choices = []
+
+    context = {
+        'requests': requests,
+        'status_filter': status_filter,
+        'service_type_filter': service_type_filter,
+        'status_choices': status_choices,
+        'service_type_choices': service_type_choices,
+    }
+
+    return render(request, 'dashboard.html', context)
+
+
+@login_required
+async def support_dashboard_events(request):
+    """Server-Sent Events stream of changes for the support dashboard."""
+    user = await request.auser()
+    if not (hasattr(user, 'role') and user.role == 'support_staff'):
+        return HttpResponseForbidden("You don't have permission to access this page.")
+
+    # Browsers send Last-Event-ID when they reconnect; the page passes ?after= on the first connection
+    try:
+        last_event_id = int(request.headers.get('Last-Event-ID') or request.GET.get('after', ''))
+    except ValueError:
+        last_event_id = None
+
+    response = StreamingHttpResponse(event_stream(get_feed(), last_event_id), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,405 @@
+"""
+Service request attachments: upload validation and content-addressed storage.
+
+Views that accept attachments stream their uploads through
+``AttachmentUploadHandler`` (see ``use_attachment_upload_handler``), which
+hashes each chunk as it arrives and stops buffering a file as soon as it is
+known to be too large or of a disallowed type. ``ContentAddressedStorage`` then stores
+every distinct file once, under its SHA-256, and keeps a reference count per
+file in ``AttachmentBlob`` so shared files are removed only when the last
+request using them goes away. The client's file name is kept on the request
+(``ServiceRequest.attachment_name``) and used when the file is served.
+
+``attachment_response`` serves a stored file with conditional GET and
+single byte-range support, or hands it to the web server with
+X-Sendfile / X-Accel-Redirect. Under ASGI the file is read a block at a time
+as the body is sent, rather than read whole before sending.
+"""
+import hashlib
+import mimetypes
+import os
+import posixpath
+import re
+from tempfile import NamedTemporaryFile, SpooledTemporaryFile
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, StopFutureHandlers
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe
+
+from .streaming import is_asgi, streaming_content
+
+MAX_ATTACHMENT_SIZE = 5 * 1024 * 1024  # 5 MB
+# Bytes read from a stored file at a time when streaming it under ASGI
+FILE_BLOCK_SIZE = 64 * 1024
+ALLOWED_ATTACHMENT_EXTENSIONS = ['pdf', 'jpg', 'jpeg', 'png', 'doc', 'docx']
+
+
+def attachment_extension(name):
+    """Return the lower-cased extension of ``name``, without the dot."""
+    return name.rsplit('.', 1)[-1].lower() if '.' in name else ''
+
+
+def attachment_name_error(name):
+    """Return why a file called ``name`` cannot be attached, or None."""
+    if attachment_extension(name) not in ALLOWED_ATTACHMENT_EXTENSIONS:
+        return f"Only {', '.join(ALLOWED_ATTACHMENT_EXTENSIONS)} files are allowed"
+    return None
+
+
+def attachment_size_error(size):
+    """Return why a file of ``size`` bytes cannot be attached, or None."""
+    if size > MAX_ATTACHMENT_SIZE:
+        return "File size must be under 5MB"
+    return None
+
+
+def validate_attachment(attached_file):
+    """Raise ValidationError if ``attached_file`` was rejected while uploading or breaks the limits."""
+    error = (
+        getattr(attached_file, 'upload_error', None)
+        or attachment_size_error(attached_file.size)
+        or attachment_name_error(attached_file.name)
+    )
+    if error:
+        raise ValidationError(error)
+
+
+class HashedUploadedFile(UploadedFile):
+    """An uploaded file whose SHA-256 was computed while it streamed in."""
+
+    def __init__(self, file, name, content_type, size, charset, content_type_extra=None, content_hash=None):
+        super().__init__(file, name, content_type, size, charset, content_type_extra)
+        self.content_hash = content_hash
+
+
+class RejectedUploadedFile(UploadedFile):
+    """
+    Placeholder for an upload that was dropped mid-stream.
+
+    None of its content is kept; ``upload_error`` says why it was rejected and
+    ``size`` is the number of bytes received before that.
+    """
+
+    def __init__(self, name, content_type, size, charset, upload_error):
+        super().__init__(SpooledTemporaryFile(max_size=0), name, content_type, size, charset)
+        self.upload_error = upload_error
+
+
+class AttachmentUploadHandler(FileUploadHandler):
+    """
+    Stream uploaded files into a spooled temporary file while hashing them.
+
+    Small files stay in memory (up to FILE_UPLOAD_MAX_MEMORY_SIZE), larger ones
+    spill to disk, so Django's memory and temporary-file handlers behind this
+    one are stopped for every file. Once a file is known to be too large or of
+    a disallowed type, the rest of it is read from the request and discarded
+    instead of buffered.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.received = 0
+        self.digest = hashlib.sha256()
+        self.upload_error = attachment_name_error(self.file_name)
+        if not self.upload_error and self.content_length is not None:
+            self.upload_error = attachment_size_error(self.content_length)
+        self.file = None if self.upload_error else SpooledTemporaryFile(
+            max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE,
+            dir=settings.FILE_UPLOAD_TEMP_DIR
+        )
+        raise StopFutureHandlers()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if not self.upload_error:
+            self.upload_error = attachment_size_error(self.received)
+            if self.upload_error:
+                self.file.close()
+                self.file = None
+            else:
+                self.digest.update(raw_data)
+                self.file.write(raw_data)
+        return None
+
+    def file_complete(self, file_size):
+        if self.upload_error:
+            return RejectedUploadedFile(
+                self.file_name, self.content_type, self.received, self.charset, self.upload_error
+            )
+        self.file.seek(0)
+        return HashedUploadedFile(
+            self.file, self.file_name, self.content_type, file_size, self.charset,
+            self.content_type_extra, content_hash=self.digest.hexdigest()
+        )
+
+    def upload_interrupted(self):
+        if getattr(self, 'file', None) is not None:
+            self.file.close()
+
+
+def use_attachment_upload_handler(request):
+    """
+    Stream the files uploaded with ``request`` through AttachmentUploadHandler.
+
+    Call it before anything reads the request body. Only the views that accept
+    attachments do, so other uploads (the admin, for one) keep Django's handlers.
+    """
+    request.upload_handlers.insert(0, AttachmentUploadHandler(request))
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    File system storage that keeps one copy of each distinct file.
+
+    A saved file is named ``<upload_to>/<hash[:2]>/<hash>.<ext>`` after the
+    SHA-256 of its content, so saving identical content again reuses the stored
+    file. Every save adds a reference and every delete drops one; the file is
+    removed once no references remain.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        # Equal names mean equal content, so an existing file is reused, not renamed
+        return name
+
+    def _save(self, name, content):
+        directory = posixpath.dirname(name)
+        extension = attachment_extension(name)
+        content_hash = getattr(content, 'content_hash', None)
+
+        if content_hash is None or not self.exists(self.hashed_name(directory, content_hash, extension)):
+            content_hash = self._write(directory, extension, content)
+        name = self.hashed_name(directory, content_hash, extension)
+        self.add_reference(name, content.size)
+        return name
+
+    def _write(self, directory, extension, content):
+        """Stream ``content`` to disk while hashing it and return its hash."""
+        os.makedirs(self.path(directory), exist_ok=True)
+        digest = hashlib.sha256()
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        with NamedTemporaryFile(dir=self.path(directory), prefix='.upload-', delete=False) as temporary:
+            try:
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    temporary.write(chunk)
+            except BaseException:
+                os.unlink(temporary.name)
+                raise
+
+        content_hash = digest.hexdigest()
+        full_path = self.path(self.hashed_name(directory, content_hash, extension))
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        if self.file_permissions_mode is not None:
+            os.chmod(temporary.name, self.file_permissions_mode)
+        # Concurrent writers of the same content replace each other atomically
+        os.replace(temporary.name, full_path)
+        return content_hash
+
+    @staticmethod
+    def hashed_name(directory, content_hash, extension):
+        filename = f'{content_hash}.{extension}' if extension else content_hash
+        return posixpath.join(directory, content_hash[:2], filename)
+
+    def add_reference(self, name, size):
+        from .models import AttachmentBlob
+
+        with transaction.atomic():
+            if AttachmentBlob.objects.filter(name=name).update(ref_count=F('ref_count') + 1):
+                return
+            try:
+                with transaction.atomic():
+                    AttachmentBlob.objects.create(name=name, size=size, ref_count=1)
+            except IntegrityError:
+                # Another upload of the same content created the row first
+                AttachmentBlob.objects.filter(name=name).update(ref_count=F('ref_count') + 1)
+
+    def delete(self, name):
+        """
+        Drop one reference to ``name`` and remove the file once none remain.
+
+        The file is removed by a background job queued in the same transaction,
+        so a rollback keeps it and the caller does not wait for the file system.
+        Files saved before content addressing have no reference row and are left alone.
+        """
+        from . import jobs
+        from .models import AttachmentBlob
+
+        with transaction.atomic():
+            AttachmentBlob.objects.filter(name=name).update(ref_count=F('ref_count') - 1)
+            released, _ = AttachmentBlob.objects.filter(name=name, ref_count__lte=0).delete()
+            if released:
+                jobs.enqueue('requests.delete_attachment_file', {'name': name})
+
+    def delete_unreferenced(self, name):
+        """Remove the file ``name`` unless it has been referenced again."""
+        from .models import AttachmentBlob
+
+        # The same content may have been uploaded again since the last reference went away
+        if not AttachmentBlob.objects.filter(name=name).exists():
+            super().delete(name)
+
+
+attachment_storage = ContentAddressedStorage()
+
+
+def get_attachment_storage():
+    """Storage for ServiceRequest.attached_file (a callable keeps it out of migrations)."""
+    return attachment_storage
+
+
+CONTENT_HASH_NAME = re.compile(r'^[0-9a-f]{64}$')
+BYTE_RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def attachment_etag(name, stat):
+    """
+    Return a strong ETag for the stored file.
+
+    Content-addressed names already are the hash of the content; files stored
+    before content addressing fall back to their size and modification time.
+    """
+    stem = posixpath.splitext(posixpath.basename(name))[0]
+    if CONTENT_HASH_NAME.match(stem):
+        return f'"{stem}"'
+    return f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+
+
+def parse_byte_range(header, size):
+    """
+    Return the inclusive (start, end) of a single ``bytes=`` range, or None when
+    the header is absent or not a single byte range (the whole file is served).
+
+    Raises ValueError for a range that lies outside the file.
+    """
+    match = BYTE_RANGE.match(header or '')
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if not length:
+            raise ValueError(header)
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError(header)
+    return start, end
+
+
+class FileRange:
+    """Read at most ``length`` bytes of ``file`` from its current position."""
+
+    def __init__(self, file, length):
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def read_file(path, start, length, block_size=FILE_BLOCK_SIZE):
+    """Yield ``length`` bytes of the file at ``path`` from ``start``; the file is opened on first use."""
+    with open(path, 'rb') as file:
+        file.seek(start)
+        while length > 0:
+            block = file.read(min(block_size, length))
+            if not block:
+                break
+            length -= len(block)
+            yield block
+
+
+def attachment_response(request, field_file, filename=None):
+    """
+    Return a response serving ``field_file`` to ``request``.
+
+    ``filename`` is the name offered to the client; stored names are content
+    hashes, so callers pass the name the file was uploaded with.
+
+    Conditional requests (If-None-Match, If-Modified-Since and friends) are
+    answered with 304/412 without opening the file. When
+    ATTACHMENT_SENDFILE_HEADER is set, the web server is told to send the file
+    itself; otherwise it is streamed with FileResponse, honouring a single
+    byte range.
+    """
+    storage = field_file.storage
+    path = storage.path(field_file.name)
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        raise Http404("Attachment not found.")
+
+    etag = attachment_etag(field_file.name, stat)
+    last_modified = int(stat.st_mtime)
+    filename = filename or posixpath.basename(field_file.name)
+    content_type = mimetypes.guess_type(field_file.name)[0] or 'application/octet-stream'
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = _file_response(request, field_file.name, path, stat.st_size, etag, last_modified, content_type)
+        response.headers['Content-Disposition'] = content_disposition_header(False, filename)
+
+    response.headers['ETag'] = etag
+    response.headers['Last-Modified'] = http_date(last_modified)
+    # Revalidate every time so permission checks still run; unchanged files cost a 304
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def _file_response(request, name, path, size, etag, last_modified, content_type):
+    sendfile_header = getattr(settings, 'ATTACHMENT_SENDFILE_HEADER', None)
+    if sendfile_header == 'X-Accel-Redirect':
+        response = HttpResponse(content_type=content_type)
+        response.headers['X-Accel-Redirect'] = settings.ATTACHMENT_ACCEL_REDIRECT_PREFIX + name
+        return response
+    if sendfile_header:
+        response = HttpResponse(content_type=content_type)
+        response.headers[sendfile_header] = path
+        return response
+
+    byte_range = None
+    if_range = request.headers.get('If-Range')
+    if not if_range or if_range == etag or parse_http_date_safe(if_range) == last_modified:
+        try:
+            byte_range = parse_byte_range(request.headers.get('Range'), size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response.headers['Content-Range'] = f'bytes */{size}'
+            return response
+
+    start, end = byte_range if byte_range is not None else (0, size - 1)
+    status = 200 if byte_range is None else 206
+    if is_asgi(request):
+        # FileResponse reads its file synchronously, and ASGI would buffer all of it before sending
+        response = StreamingHttpResponse(
+            streaming_content(request, read_file(path, start, end - start + 1)),
+            status=status, content_type=content_type
+        )
+    else:
+        file = open(path, 'rb')
+        file.seek(start)
+        response = FileResponse(
+            file if byte_range is None else FileRange(file, end - start + 1), status=status, content_type=content_type
+        )
+    response.headers['Content-Length'] = end - start + 1
+    if byte_range is not None:
+        response.headers['Content-Range'] = f'bytes {start}-{end}/{size}'
+    response.headers['Accept-Ranges'] = 'bytes'
+    return response
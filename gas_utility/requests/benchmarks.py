@@ -0,0 +1,212 @@
+"""
+Latency and SQL benchmarks of the main pages and API endpoints.
+
+``manage.py benchmark_endpoints`` requests each endpoint repeatedly through
+Django's test client, so the full middleware and view stack runs but no
+network or web server is involved. For every endpoint it reports latency
+percentiles, SQL queries and SQL time per request, and throughput. Results
+are saved as JSON so runs from different commits can be compared.
+
+Queries are captured with the database debug cursor, which adds a little
+overhead to every query; compare runs with each other rather than with
+production latencies.
+"""
+import json
+import platform
+import random
+import statistics
+import subprocess
+import time
+
+import django
+from django.conf import settings
+from django.db import connection
+from django.db.models import Max, Min
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.models import Customer, SupportRepresentative, User
+from .models import ServiceRequest, ServiceRequestEvent
+
+# Metrics shown when comparing two runs; lower is better for all of them
+COMPARED_METRICS = ('p50_ms', 'p95_ms', 'p99_ms', 'queries_per_request')
+
+
+class BenchmarkError(Exception):
+    """An endpoint answered with something other than 200 OK."""
+
+
+class Endpoint:
+    """A benchmarked URL and the role of the user requesting it."""
+
+    def __init__(self, name, role, url):
+        self.name = name
+        self.role = role
+        # Called with a service request id, for endpoints that show one request
+        self.url = url
+
+
+ENDPOINTS = [
+    Endpoint('dashboard', 'customer', lambda request_id: reverse('dashboard')),
+    Endpoint('support_dashboard', 'staff', lambda request_id: reverse('support_dashboard')),
+    Endpoint(
+        'support_request_detail', 'staff', lambda request_id: reverse('support_request_detail', args=[request_id])
+    ),
+    Endpoint('statistics', 'staff', lambda request_id: reverse('servicerequest-statistics')),
+    Endpoint('api_list', 'staff', lambda request_id: reverse('servicerequest-list')),
+    Endpoint('api_detail', 'staff', lambda request_id: reverse('servicerequest-detail', args=[request_id])),
+]
+
+
+def percentile_summary(samples):
+    """Return p50, p95 and p99 of at least two samples."""
+    cuts = statistics.quantiles(samples, n=100, method='inclusive')
+    return cuts[49], cuts[94], cuts[98]
+
+
+def sample_request_ids(count, seed=0):
+    """Pick up to ``count`` existing service request ids, spread over the whole table."""
+    bounds = ServiceRequest.objects.aggregate(low=Min('id'), high=Max('id'))
+    if bounds['low'] is None:
+        return []
+    generator = random.Random(seed)
+    candidates = {generator.randint(bounds['low'], bounds['high']) for _ in range(count * 2)}
+    request_ids = sorted(ServiceRequest.objects.filter(id__in=candidates).values_list('id', flat=True)[:count])
+    return request_ids or [bounds['low']]
+
+
+def benchmark_users(customer=None, staff=None):
+    """
+    Return the users the benchmarks sign in as, by role: the support staff
+    user and customer with the given usernames, or by default the first
+    representative and the customer with the most requests.
+    """
+    if staff:
+        staff_user = User.objects.filter(username=staff, role='support_staff').first()
+    else:
+        representative = SupportRepresentative.objects.select_related('user').order_by('id').first()
+        staff_user = representative.user if representative else None
+    if customer:
+        customer = Customer.objects.select_related('user').filter(user__username=customer).first()
+    else:
+        customer = Customer.objects.select_related('user').order_by('-last_request_seq', 'id').first()
+    if staff_user is None or customer is None:
+        raise BenchmarkError(
+            'Benchmarks need a support representative, a customer and service requests; '
+            'see manage.py generate_service_data.'
+        )
+    return {'customer': customer.user, 'staff': staff_user}
+
+
+def git_commit():
+    """Return the checked out commit, or None outside a git checkout."""
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], cwd=settings.BASE_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class BenchmarkRunner:
+    """
+    Request each endpoint ``warmup + iterations`` times and summarise the measured iterations.
+
+    Requests are sent one after another, so throughput is that of a single client.
+    """
+
+    def __init__(self, users, request_ids, iterations=50, warmup=5):
+        self.request_ids = request_ids
+        self.iterations = iterations
+        self.warmup = warmup
+        # Any configured host name, so requests pass ALLOWED_HOSTS validation
+        host = next((host.lstrip('.') for host in settings.ALLOWED_HOSTS if host != '*'), 'localhost')
+        self.clients = {}
+        for role, user in users.items():
+            self.clients[role] = Client(SERVER_NAME=host)
+            self.clients[role].force_login(user)
+
+    def measure(self, endpoint):
+        client = self.clients[endpoint.role]
+        latencies, query_counts, sql_times = [], [], []
+        for index in range(self.warmup + self.iterations):
+            url = endpoint.url(self.request_ids[index % len(self.request_ids)])
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                response = client.get(url, secure=True)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+                elapsed = time.perf_counter() - started
+            if response.status_code != 200:
+                raise BenchmarkError(f'{endpoint.name}: GET {url} returned {response.status_code}')
+            if index >= self.warmup:
+                latencies.append(elapsed * 1000)
+                query_counts.append(len(captured.captured_queries))
+                sql_times.append(sum(float(query['time']) for query in captured.captured_queries) * 1000)
+
+        p50, p95, p99 = percentile_summary(latencies)
+        return {
+            'url': endpoint.url(self.request_ids[0]),
+            'role': endpoint.role,
+            'p50_ms': round(p50, 2),
+            'p95_ms': round(p95, 2),
+            'p99_ms': round(p99, 2),
+            'mean_ms': round(statistics.fmean(latencies), 2),
+            'max_ms': round(max(latencies), 2),
+            'queries_per_request': round(statistics.fmean(query_counts), 1),
+            'max_queries': max(query_counts),
+            'sql_ms_per_request': round(statistics.fmean(sql_times), 2),
+            'throughput_rps': round(len(latencies) / (sum(latencies) / 1000), 1),
+        }
+
+    def run(self, endpoints=ENDPOINTS, on_endpoint=None):
+        """Benchmark ``endpoints`` and return the results as a JSON-serialisable dict."""
+        results = {}
+        for endpoint in endpoints:
+            results[endpoint.name] = self.measure(endpoint)
+            if on_endpoint:
+                on_endpoint(endpoint.name, results[endpoint.name])
+        return {
+            'commit': git_commit(),
+            'recorded_at': timezone.now().isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'dataset': {
+                'customers': Customer.objects.count(),
+                'service_requests': ServiceRequest.objects.count(),
+                'service_request_events': ServiceRequestEvent.objects.count(),
+            },
+            'iterations': self.iterations,
+            'warmup': self.warmup,
+            'endpoints': results,
+        }
+
+
+def compare(baseline, results):
+    """
+    Yield (endpoint, metric, before, after, relative change) for endpoints in both runs.
+
+    The relative change is None when the baseline value is zero.
+    """
+    for name, measured in results['endpoints'].items():
+        before = baseline.get('endpoints', {}).get(name)
+        if before is None:
+            continue
+        for metric in COMPARED_METRICS:
+            if metric in before:
+                change = (measured[metric] - before[metric]) / before[metric] if before[metric] else None
+                yield name, metric, before[metric], measured[metric], change
+
+
+def load_results(path):
+    with open(path, encoding='utf-8') as handle:
+        return json.load(handle)
+
+
+def save_results(results, path):
+    with open(path, 'w', encoding='utf-8') as handle:
+        json.dump(results, handle, indent=2)
+        handle.write('\n')
@@ -0,0 +1,103 @@
+"""
+Conditional requests for the service request API.
+
+Validators are built from data the database already has, so checking them
+costs one small query instead of loading and serializing the rows:
+
+- a service request's ETag and Last-Modified come from its ``updated_at``;
+- a list's ETag comes from the row count and the latest ``updated_at``
+  under the request's filters. A deleted row lowers the count, and every
+  other write stamps ``updated_at`` (see ServiceRequestQuerySet.apply_changes).
+  The page number paginator reuses the count;
+- keyset (cursor) pages are never counted, so their ETag is a digest of the
+  loaded page's ids, ``updated_at`` values and links. A 304 still saves
+  serializing the page.
+
+A GET whose If-None-Match (or If-Modified-Since) still matches gets a 304
+without the serializer running. PUT and PATCH honour If-Match, so a client
+can refuse to overwrite a change it has not seen.
+
+Lists send no Last-Modified: deleting a row does not advance the latest
+``updated_at``. The validators cover the request's own columns. A change to
+related rows alone, such as a customer renaming themselves, does not
+change them.
+"""
+import hashlib
+
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from rest_framework import status
+from rest_framework.response import Response
+
+
+class Validators:
+    """The ETag and, for single requests, the Last-Modified time of an API response."""
+
+    def __init__(self, etag, last_modified=None):
+        self.etag = etag
+        self.last_modified = last_modified
+
+    @classmethod
+    def for_request(cls, pk, updated_at, format):
+        return cls(f'"{pk}.{updated_at:%Y%m%d%H%M%S%f}.{format}"', updated_at)
+
+    @classmethod
+    def for_list(cls, count, latest, format):
+        stamp = f'{latest:%Y%m%d%H%M%S%f}' if latest else '0'
+        return cls(f'"{count}.{stamp}.{format}"')
+
+    @classmethod
+    def for_page(cls, rows, links, format):
+        digest = hashlib.sha1(repr(([(row.pk, row.updated_at) for row in rows or []], links)).encode())
+        return cls(f'"{digest.hexdigest()}.{format}"')
+
+    def check(self, request):
+        """
+        Return the 304 or 412 response that the request's conditional headers call
+        for, or None when the request should go ahead.
+        """
+        last_modified = int(self.last_modified.timestamp()) if self.last_modified else None
+        response = get_conditional_response(request, etag=self.etag, last_modified=last_modified)
+        if response is None:
+            return None
+        if response.status_code == status.HTTP_412_PRECONDITION_FAILED:
+            response = Response(
+                {"detail": "The service request has changed since you last fetched it."},
+                status=status.HTTP_412_PRECONDITION_FAILED
+            )
+        return self.apply(response)
+
+    def apply(self, response):
+        """Add the validators to ``response``; clients must revalidate before reusing it."""
+        response['ETag'] = self.etag
+        if self.last_modified:
+            response['Last-Modified'] = http_date(self.last_modified.timestamp())
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+
+def list_state(queryset):
+    """Return (row count, latest updated_at) of ``queryset`` in one aggregate query."""
+    row = queryset.order_by().aggregate(count=Count('pk'), latest=Max('updated_at'))
+    return row['count'], row['latest']
+
+
+async def alist_state(queryset):
+    row = await queryset.order_by().aaggregate(count=Count('pk'), latest=Max('updated_at'))
+    return row['count'], row['latest']
+
+
+def request_state(queryset, **lookup):
+    """Return (pk, updated_at) of the service request matching ``lookup``, or None."""
+    return queryset.prefetch_related(None).filter(**lookup).values_list('pk', 'updated_at').first()
+
+
+async def arequest_state(queryset, **lookup):
+    return await queryset.prefetch_related(None).filter(**lookup).values_list('pk', 'updated_at').afirst()
+
+
+def has_conditions(request):
+    return any(header in request.headers for header in (
+        'If-Match', 'If-None-Match', 'If-Modified-Since', 'If-Unmodified-Since',
+    ))
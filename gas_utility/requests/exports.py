@@ -0,0 +1,116 @@
+"""
+Streaming CSV and NDJSON exports of service requests.
+
+Rows are read with ``.values()`` through a chunked iterator (a server-side
+cursor on PostgreSQL) and encoded a batch at a time, so memory use does not
+grow with the size of the export. Under ASGI the encoded batches are handed
+over through an async iterator (see requests.streaming), which Django does
+not buffer.
+"""
+import csv
+import io
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+from .streaming import streaming_content
+
+# Rows fetched from the database per round trip
+EXPORT_CHUNK_SIZE = 2000
+# Rows encoded before a piece of the response is sent
+EXPORT_FLUSH_ROWS = 500
+
+# Exported model fields, followed by related columns (column name -> lookup)
+EXPORT_FIELDS = [
+    'id', 'seq', 'service_type', 'status', 'priority', 'description',
+    'created_at', 'updated_at', 'resolved_at',
+]
+EXPORT_RELATED = {
+    'customer_username': F('customer__user__username'),
+    'customer_email': F('customer__user__email'),
+    'assigned_to_username': F('assigned_to__user__username'),
+}
+EXPORT_COLUMNS = EXPORT_FIELDS + list(EXPORT_RELATED)
+
+# Spreadsheet applications run cells starting with these as formulas
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+class CSVRenderer(BaseRenderer):
+    """Selects CSV exports (``?format=csv``); renders only error responses."""
+    media_type = 'text/csv'
+    format = 'csv'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for key, value in (data or {}).items():
+            writer.writerow([key, value])
+        return buffer.getvalue().encode(self.charset)
+
+
+class NDJSONRenderer(JSONRenderer):
+    """Selects NDJSON exports (``?format=ndjson``); errors render as one JSON line."""
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+
+
+def export_rows(queryset):
+    """Return an iterator of export rows (dicts) for ``queryset``, read in chunks."""
+    return queryset.values(*EXPORT_FIELDS, **EXPORT_RELATED).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+
+def csv_cell(value):
+    if value is None:
+        return ''
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def iter_csv(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    for index, row in enumerate(rows, 1):
+        writer.writerow([csv_cell(value) for value in row.values()])
+        if index % EXPORT_FLUSH_ROWS == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def iter_ndjson(rows):
+    encoder = DjangoJSONEncoder(ensure_ascii=False, separators=(',', ':'))
+    lines = []
+    for row in rows:
+        lines.append(encoder.encode(row))
+        if len(lines) == EXPORT_FLUSH_ROWS:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+EXPORT_FORMATS = {
+    'csv': (iter_csv, CSVRenderer.media_type),
+    'ndjson': (iter_ndjson, NDJSONRenderer.media_type),
+}
+
+
+def export_response(request, queryset, export_format):
+    """Return a StreamingHttpResponse answering ``request`` with ``queryset`` exported as ``export_format``."""
+    encode, media_type = EXPORT_FORMATS[export_format]
+    response = StreamingHttpResponse(
+        streaming_content(request, encode(export_rows(queryset))), content_type=f'{media_type}; charset=utf-8'
+    )
+    filename = f"service-requests-{timezone.now().strftime('%Y%m%d-%H%M%S')}.{export_format}"
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
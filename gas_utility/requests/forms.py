@@ -1,5 +1,6 @@
 from django import forms
 from accounts.models import User, Customer
+from .attachments import validate_attachment
 from .models import ServiceRequest
 from django.core.validators import RegexValidator
 
@@ -106,47 +107,40 @@ class ServiceRequestForm(forms.ModelForm):
         }
     
     def clean_attached_file(self):
-        """Validate file size and type."""
+        """Validate file size and type (oversized uploads are already cut off while streaming)."""
         attached_file = self.cleaned_data.get('attached_file')
         if attached_file:
-            # Check file size (5MB limit)
-            if attached_file.size > 5 * 1024 * 1024:
-                raise forms.ValidationError("File size must be under 5MB")
-            
-            # Check file extension
-            allowed_extensions = ['pdf', 'jpg', 'jpeg', 'png', 'doc', 'docx']
-            file_ext = attached_file.name.split('.')[-1].lower()
-            if file_ext not in allowed_extensions:
-                raise forms.ValidationError(
-                    f"Only {', '.join(allowed_extensions)} files are allowed"
-                )
-        
+            validate_attachment(attached_file)
         return attached_file
 
 # Support Staff Update Form
 class ServiceRequestUpdateForm(forms.ModelForm):
     """Form for support staff to update service requests."""
+    # Not a model field: a new note is added to the request's event timeline
+    notes = forms.CharField(
+        required=False,
+        widget=forms.Textarea(attrs={
+            'class': 'form-control',
+            'rows': 4,
+            'placeholder': 'Add a note about this request'
+        })
+    )
+    
     class Meta:
         model = ServiceRequest
-        fields = ['status', 'priority', 'notes', 'assigned_to']
+        fields = ['status', 'priority', 'assigned_to']
         widgets = {
             'status': forms.Select(attrs={'class': 'form-control'}),
             'priority': forms.Select(attrs={'class': 'form-control'}),
-            'notes': forms.Textarea(attrs={
-                'class': 'form-control',
-                'rows': 4,
-                'placeholder': 'Add notes about this request'
-            }),
             'assigned_to': forms.Select(attrs={'class': 'form-control'})
         }
     
     def __init__(self, *args, **kwargs):
-        """Initialize form with custom notes field behavior."""
+        """Initialize form with custom assignment field behavior."""
         super().__init__(*args, **kwargs)
         
         # Make assigned_to field optional
         self.fields['assigned_to'].required = False
         
-        # If the instance has existing notes, show them in the placeholder
-        if self.instance and self.instance.pk and self.instance.notes:
-            self.fields['notes'].widget.attrs['placeholder'] = 'Add to existing notes'
+        # Option labels use the rep's username, so load users with the reps
+        self.fields['assigned_to'].queryset = self.fields['assigned_to'].queryset.select_related('user')
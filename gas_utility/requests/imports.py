@@ -0,0 +1,336 @@
+"""
+Bulk loading of customers and service requests from CSV or JSON Lines files.
+
+Used by ``manage.py import_service_data`` to migrate data out of the legacy
+ticketing system. Input is read one record at a time and written with
+``bulk_create``, one chunk of records per transaction. The same transaction
+advances the import's ImportCheckpoint, so an interrupted import resumes
+right after the last committed chunk.
+
+Password hashing is slow by design; customer passwords are hashed on a
+process pool, overlapping with the insert of the previous chunk.
+"""
+import csv
+import json
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+from itertools import islice
+from multiprocessing import get_context
+
+import django
+from django.contrib.auth.hashers import get_hasher, make_password
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from accounts.models import Customer, SupportRepresentative, User
+from .models import ImportCheckpoint, ServiceRequest, ServiceRequestEvent
+
+# Rows per INSERT statement
+DEFAULT_BATCH_SIZE = 1000
+# Records per transaction, and so per checkpoint
+DEFAULT_CHUNK_SIZE = 10000
+
+INPUT_FORMATS = ('csv', 'jsonl')
+
+
+class ImportRecordError(ValueError):
+    """An input record that cannot be imported; it is reported and skipped."""
+
+
+def read_records(path, input_format):
+    """
+    Yield the records of a CSV file (with a header row) or a JSON Lines file as dicts.
+
+    A JSON line that does not hold an object is yielded as an ImportRecordError,
+    so it is counted as a failed record instead of stopping the import.
+    """
+    with open(path, newline='', encoding='utf-8-sig') as stream:
+        if input_format == 'csv':
+            yield from csv.DictReader(stream)
+            return
+        for line in stream:
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as error:
+                yield ImportRecordError(f"Invalid JSON: {error}")
+                continue
+            yield record if isinstance(record, dict) else ImportRecordError("Expected a JSON object")
+
+
+def field_value(record, key, model, field_name=None, required=False):
+    """Return ``record[key]`` as a stripped string, checked against the model field's length."""
+    value = record.get(key)
+    value = '' if value is None else str(value).strip()
+    if required and not value:
+        raise ImportRecordError(f"{key} is required")
+    max_length = model._meta.get_field(field_name or key).max_length
+    if max_length and len(value) > max_length:
+        raise ImportRecordError(f"{key} is longer than {max_length} characters")
+    return value
+
+
+def choice_value(record, key, choices, default=None):
+    value = str(record.get(key) or '').strip() or default
+    if value not in {choice for choice, label in choices}:
+        raise ImportRecordError(f"{key} {value!r} is not one of the allowed values")
+    return value
+
+
+def parse_timestamp(value):
+    """Parse an ISO 8601 timestamp; naive values are taken to be in the current time zone."""
+    if not value:
+        return None
+    try:
+        parsed = parse_datetime(str(value).strip())
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        raise ImportRecordError(f"Invalid timestamp {value!r}")
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+@contextmanager
+def explicit_timestamps(model, *field_names):
+    """
+    Make bulk_create keep the values set on instances for auto_now/auto_now_add fields.
+
+    Changes the field definitions for the duration of the block, so it is only
+    meant for single-purpose processes such as the import command.
+    """
+    fields = [model._meta.get_field(name) for name in field_names]
+    saved = [(field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, (auto_now, auto_now_add) in zip(fields, saved):
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class Importer:
+    """
+    Reads records in chunks and writes each chunk, with the checkpoint, in one transaction.
+
+    Subclasses implement ``import_chunk(rows, prepared)``, where ``rows`` holds
+    (position, record) pairs and ``prepared`` is what ``prepare(rows)``
+    returned. ``prepare`` is called for the next chunk before the current one
+    is written, so slow work started there runs alongside the inserts.
+    """
+
+    def __init__(self, checkpoint_name, batch_size=DEFAULT_BATCH_SIZE, chunk_size=DEFAULT_CHUNK_SIZE,
+                 on_chunk=None, on_error=None):
+        self.checkpoint_name = checkpoint_name
+        self.batch_size = batch_size
+        self.chunk_size = chunk_size
+        self.on_chunk = on_chunk
+        self.on_error = on_error
+        self.start_position = self.position = 0
+        self.created = self.skipped = self.failed = 0
+
+    @property
+    def processed(self):
+        """Records dealt with by this run, resumed records excluded."""
+        return self.position - self.start_position
+
+    def run(self, records):
+        """Import ``records``, starting after the checkpointed position; return the final position."""
+        checkpoint, created = ImportCheckpoint.objects.get_or_create(name=self.checkpoint_name)
+        self.start_position = self.position = checkpoint.position
+        numbered = enumerate(islice(records, checkpoint.position, None), checkpoint.position + 1)
+
+        pending = None
+        for chunk in iter(lambda: list(islice(numbered, self.chunk_size)), []):
+            rows = [(position, record) for position, record in chunk if not isinstance(record, Exception)]
+            upcoming = (chunk, rows, self.prepare(rows))
+            if pending:
+                self.commit(checkpoint, *pending)
+            pending = upcoming
+        if pending:
+            self.commit(checkpoint, *pending)
+        return self.position
+
+    def commit(self, checkpoint, chunk, rows, prepared):
+        with transaction.atomic():
+            for position, record in chunk:
+                if isinstance(record, Exception):
+                    self.reject(position, record)
+            self.import_chunk(rows, prepared)
+            checkpoint.position = chunk[-1][0]
+            checkpoint.save(update_fields=['position', 'updated_at'])
+        self.position = checkpoint.position
+        if self.on_chunk:
+            self.on_chunk(self)
+
+    def reject(self, position, error):
+        self.failed += 1
+        if self.on_error:
+            self.on_error(position, str(error))
+
+    def prepare(self, rows):
+        return None
+
+    def import_chunk(self, rows, prepared):
+        raise NotImplementedError
+
+
+class CustomerImporter(Importer):
+    """
+    Create a customer User and its Customer profile for each record.
+
+    Fields: username (required), email, first_name, last_name, password,
+    phone_number, address and date_joined. Records whose username already
+    exists are skipped; accounts without a password get an unusable one.
+    Passwords are hashed on ``hash_workers`` processes, or inline when it is 0.
+    """
+
+    def __init__(self, *args, hash_workers=0, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.hash_workers = hash_workers
+        self.executor = None
+
+    def run(self, records):
+        if not self.hash_workers:
+            return super().run(records)
+        # Fresh interpreters, so no database connection is shared with the parent
+        with ProcessPoolExecutor(
+            max_workers=self.hash_workers, mp_context=get_context('spawn'), initializer=django.setup
+        ) as self.executor:
+            return super().run(records)
+
+    def prepare(self, rows):
+        passwords = [str(record.get('password') or '') for position, record in rows]
+        plain = [password for password in passwords if password]
+        if self.executor:
+            # The hasher goes along so workers hash exactly as this process would.
+            # Executor.map submits everything now; results are collected in import_chunk.
+            hashes = self.executor.map(
+                partial(make_password, hasher=get_hasher()), plain,
+                chunksize=max(1, len(plain) // (self.hash_workers * 4))
+            )
+        else:
+            hashes = map(make_password, plain)
+        return passwords, hashes
+
+    def import_chunk(self, rows, prepared):
+        passwords, hashes = prepared
+        usernames = {str(record.get('username') or '').strip() for position, record in rows}
+        existing = set(User.objects.filter(username__in=usernames).values_list('username', flat=True))
+
+        users, profiles = [], []
+        for (position, record), password in zip(rows, passwords):
+            # Taken before any check so the hashes stay in step with the records
+            password = next(hashes) if password else make_password(None)
+            try:
+                username = field_value(record, 'username', User, required=True)
+                if username in existing:
+                    self.skipped += 1
+                    continue
+                User.username_validator(username)
+                user = User(
+                    username=username,
+                    email=field_value(record, 'email', User),
+                    first_name=field_value(record, 'first_name', User),
+                    last_name=field_value(record, 'last_name', User),
+                    password=password,
+                    role='customer',
+                    date_joined=parse_timestamp(record.get('date_joined')) or timezone.now(),
+                )
+                profile = Customer(
+                    phone_number=field_value(record, 'phone_number', Customer) or None,
+                    address=field_value(record, 'address', Customer) or None,
+                )
+            except ValidationError as error:
+                self.reject(position, ImportRecordError(' '.join(error.messages)))
+                continue
+            except ImportRecordError as error:
+                self.reject(position, error)
+                continue
+            existing.add(username)
+            users.append(user)
+            profiles.append(profile)
+
+        User.objects.bulk_create(users, batch_size=self.batch_size)
+        for user, profile in zip(users, profiles):
+            profile.user = user
+        Customer.objects.bulk_create(profiles, batch_size=self.batch_size)
+        self.created += len(users)
+
+
+class ServiceRequestImporter(Importer):
+    """
+    Create a ServiceRequest for each record, for a customer imported earlier.
+
+    Fields: customer (the customer's username) and description (both required),
+    service_type, status, priority, created_at, updated_at, resolved_at,
+    assigned_to (a support representative's username) and notes, which becomes
+    the first note on the request's timeline. Legacy timestamps are kept.
+    """
+
+    def run(self, records):
+        self.representatives = dict(SupportRepresentative.objects.values_list('user__username', 'id'))
+        return super().run(records)
+
+    def import_chunk(self, rows, prepared):
+        usernames = {str(record.get('customer') or '').strip() for position, record in rows}
+        customers = dict(Customer.objects.filter(user__username__in=usernames).values_list('user__username', 'id'))
+
+        service_requests, notes = [], []
+        now = timezone.now()
+        for position, record in rows:
+            try:
+                service_requests.append(self.build(record, customers, now))
+            except ImportRecordError as error:
+                self.reject(position, error)
+                continue
+            notes.append(str(record.get('notes') or '').strip())
+
+        with explicit_timestamps(ServiceRequest, 'created_at', 'updated_at'):
+            ServiceRequest.objects.bulk_create(service_requests, batch_size=self.batch_size)
+        ServiceRequestEvent.objects.bulk_create([
+            ServiceRequestEvent(
+                service_request=service_request, kind=ServiceRequestEvent.NOTE,
+                body=note, created_at=service_request.created_at
+            )
+            for service_request, note in zip(service_requests, notes) if note
+        ], batch_size=self.batch_size)
+        self.created += len(service_requests)
+
+    def build(self, record, customers, now):
+        username = field_value(record, 'customer', User, 'username', required=True)
+        if username not in customers:
+            raise ImportRecordError(f"Unknown customer {username!r}")
+        representative = field_value(record, 'assigned_to', User, 'username')
+        if representative and representative not in self.representatives:
+            raise ImportRecordError(f"Unknown support representative {representative!r}")
+
+        created_at = parse_timestamp(record.get('created_at')) or now
+        updated_at = parse_timestamp(record.get('updated_at')) or created_at
+        service_request = ServiceRequest(
+            customer_id=customers[username],
+            service_type=choice_value(record, 'service_type', ServiceRequest.SERVICE_TYPES),
+            description=field_value(record, 'description', ServiceRequest, required=True),
+            status=choice_value(record, 'status', ServiceRequest.STATUS_CHOICES, 'Pending'),
+            priority=choice_value(record, 'priority', ServiceRequest.PRIORITY_CHOICES, 'Medium'),
+            created_at=created_at,
+            updated_at=updated_at,
+            resolved_at=parse_timestamp(record.get('resolved_at')),
+            assigned_to_id=self.representatives.get(representative),
+        )
+        if service_request.status == 'Resolved' and not service_request.resolved_at:
+            service_request.resolved_at = updated_at
+        service_request.sync_resolved_at()
+        return service_request
+
+
+IMPORTERS = {
+    'customers': CustomerImporter,
+    'requests': ServiceRequestImporter,
+}
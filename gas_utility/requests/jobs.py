@@ -0,0 +1,264 @@
+"""
+A small background job queue stored in the project database.
+
+Register a function with ``@task`` and queue it with ``enqueue(name, payload)``,
+or several at once with ``enqueue_many(name, payloads)``. Job rows are written
+in the caller's transaction, so workers only see them once that transaction
+commits. ``manage.py run_jobs`` claims due jobs and runs them on a thread or
+process pool.
+
+A claimed job is leased to its worker for the task's ``timeout`` (its
+visibility timeout); if the worker dies, the lease expires and another
+worker picks the job up. Failures are retried with exponential backoff
+until ``max_attempts`` is reached. A task's ``concurrency`` caps how many of
+its jobs run at once; the cap is checked when jobs are claimed.
+"""
+import logging
+import os
+import random
+import socket
+import threading
+import traceback
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from datetime import timedelta
+from multiprocessing import get_context
+
+import django
+from django.db import close_old_connections, connections
+from django.db.models import Case, Count, DateTimeField, F, Value, When
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# Default lease length of a claimed job, in seconds
+DEFAULT_TIMEOUT = 300
+# Longest delay between retries, in seconds
+MAX_BACKOFF = 3600
+# Candidates read per free slot when claiming, so concurrency-limited tasks can be skipped
+CLAIM_LOOKAHEAD = 4
+
+
+class Task:
+    """A registered job handler and its retry and concurrency options."""
+
+    def __init__(self, name, func, max_attempts=5, timeout=DEFAULT_TIMEOUT, backoff=10, concurrency=None, queue='default'):
+        self.name = name
+        self.func = func
+        self.max_attempts = max_attempts
+        self.timeout = timeout
+        self.backoff = backoff
+        self.concurrency = concurrency
+        self.queue = queue
+
+    def retry_delay(self, attempts):
+        """Seconds to wait before the next attempt: exponential with 10% jitter."""
+        delay = min(self.backoff * 2 ** (attempts - 1), MAX_BACKOFF)
+        return delay * random.uniform(1, 1.1)
+
+
+registry = {}
+
+
+def task(name, **options):
+    """
+    Register the decorated function as the handler for jobs called ``name``.
+
+    The function is called with the job's payload as keyword arguments. Options:
+    ``max_attempts``, ``timeout`` (lease length in seconds), ``backoff`` (first
+    retry delay in seconds), ``concurrency`` and ``queue``.
+    """
+    def decorator(func):
+        registry[name] = Task(name, func, **options)
+        return func
+    return decorator
+
+
+def enqueue(name, payload=None, delay=None, using=None):
+    """Queue a job for the task ``name`` and return it; ``delay`` is in seconds."""
+    from .models import Job
+
+    registered = registry[name]
+    run_at = timezone.now()
+    if delay:
+        run_at += timedelta(seconds=delay)
+    return Job.objects.using(using).create(
+        task=name, payload=payload or {}, queue=registered.queue, run_at=run_at
+    )
+
+
+def enqueue_many(name, payloads, using=None):
+    """Queue one job per payload for the task ``name`` with a single INSERT and return them."""
+    from .models import Job
+
+    registered = registry[name]
+    run_at = timezone.now()
+    return Job.objects.using(using).bulk_create([
+        Job(task=name, payload=payload, queue=registered.queue, run_at=run_at) for payload in payloads
+    ])
+
+
+def claim(worker, limit, queues=None):
+    """
+    Lease up to ``limit`` due jobs to ``worker`` and return (claim token, job ids).
+
+    Candidates are reserved with a conditional UPDATE tagged with a fresh claim
+    token, so two workers racing for the same job cannot both get it.
+    """
+    from .models import Job
+
+    now = timezone.now()
+    due = Job.objects.due(now)
+    if queues:
+        due = due.filter(queue__in=queues)
+
+    limits = {name: registered.concurrency for name, registered in registry.items() if registered.concurrency}
+    running = {}
+    if limits:
+        running = dict(
+            Job.objects.leased(now).filter(task__in=limits)
+            .values_list('task').annotate(count=Count('id')).values_list('task', 'count')
+        )
+
+    selected = []
+    for job_id, name in due.order_by('run_at', 'id').values_list('id', 'task')[:limit * CLAIM_LOOKAHEAD]:
+        if name in limits:
+            if running.get(name, 0) >= limits[name]:
+                continue
+            running[name] = running.get(name, 0) + 1
+        selected.append(job_id)
+        if len(selected) == limit:
+            break
+    if not selected:
+        return None, []
+
+    token = f'{worker}:{uuid.uuid4().hex}'[-100:]
+    lease_ends = Case(
+        *[
+            When(task=name, then=Value(now + timedelta(seconds=registered.timeout)))
+            for name, registered in registry.items()
+        ],
+        default=Value(now + timedelta(seconds=DEFAULT_TIMEOUT)),
+        output_field=DateTimeField()
+    )
+    Job.objects.due(now).filter(id__in=selected).update(
+        status=Job.RUNNING, locked_by=token, locked_until=lease_ends, attempts=F('attempts') + 1
+    )
+    return token, list(Job.objects.filter(locked_by=token).values_list('id', flat=True))
+
+
+def execute(job_id, token):
+    """
+    Run one claimed job and record the outcome.
+
+    Succeeded jobs are deleted; failed ones are rescheduled or, after the last
+    attempt, marked failed. Nothing is recorded if the lease was lost to
+    another worker in the meantime.
+    """
+    from .models import Job
+
+    job = Job.objects.filter(id=job_id, locked_by=token).first()
+    if job is None:
+        return
+    registered = registry.get(job.task)
+    try:
+        if registered is None:
+            raise LookupError(f"No task registered as {job.task!r}")
+        if job.attempts > registered.max_attempts:
+            raise RuntimeError(f"Lease expired after the last of {registered.max_attempts} attempts")
+        registered.func(**job.payload)
+    except Exception:
+        error = traceback.format_exc()
+        logger.warning("Job %s (%s) failed on attempt %s", job.id, job.task, job.attempts, exc_info=True)
+        now = timezone.now()
+        changes = {'locked_by': '', 'locked_until': None, 'last_error': error}
+        if registered is None or job.attempts >= registered.max_attempts:
+            changes.update(status=Job.FAILED, finished_at=now)
+        else:
+            changes.update(
+                status=Job.QUEUED,
+                run_at=now + timedelta(seconds=registered.retry_delay(job.attempts))
+            )
+        Job.objects.filter(id=job.id, locked_by=token).update(**changes)
+    else:
+        Job.objects.filter(id=job.id, locked_by=token).delete()
+
+
+def _execute_in_pool(job_id, token):
+    # Like a request cycle: drop connections that broke or outlived CONN_MAX_AGE
+    close_old_connections()
+    try:
+        execute(job_id, token)
+    finally:
+        close_old_connections()
+
+
+def run_due_jobs(worker='inline', limit=100, queues=None):
+    """Claim and run due jobs one by one in the calling thread; return how many ran."""
+    token, job_ids = claim(worker, limit, queues)
+    for job_id in job_ids:
+        execute(job_id, token)
+    return len(job_ids)
+
+
+def _setup_process():
+    django.setup()
+
+
+class Worker:
+    """
+    Claim due jobs and run them on a pool of ``concurrency`` threads or processes.
+
+    The loop claims only as many jobs as there are free slots, so jobs stay in
+    the queue (and available to other workers) until this worker can start them.
+    """
+
+    def __init__(self, concurrency=4, pool='thread', queues=None, poll_interval=1.0, name=None):
+        self.concurrency = concurrency
+        self.pool = pool
+        self.queues = queues
+        self.poll_interval = poll_interval
+        self.name = name or f'{socket.gethostname()}:{os.getpid()}'
+        self.stopping = threading.Event()
+
+    def make_executor(self):
+        if self.pool == 'process':
+            # Fresh interpreters, so no database connection is shared with the parent
+            return ProcessPoolExecutor(
+                max_workers=self.concurrency, mp_context=get_context('spawn'), initializer=_setup_process
+            )
+        return ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='job')
+
+    def stop(self):
+        """Stop claiming new jobs; running ones are allowed to finish."""
+        self.stopping.set()
+
+    def run(self, burst=False):
+        """Process jobs until stopped, or with ``burst`` until the queue is empty. Return how many ran."""
+        processed = 0
+        pending = set()
+        with self.make_executor() as executor:
+            while not self.stopping.is_set():
+                free = self.concurrency - len(pending)
+                if free:
+                    token, job_ids = claim(self.name, free, self.queues)
+                    for job_id in job_ids:
+                        pending.add(executor.submit(_execute_in_pool, job_id, token))
+
+                if not pending:
+                    if burst:
+                        break
+                    self.stopping.wait(self.poll_interval)
+                    continue
+
+                # With free slots, wake up regularly to claim newly due jobs
+                timeout = self.poll_interval if len(pending) < self.concurrency else None
+                done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    processed += 1
+                    if future.exception() is not None:
+                        logger.error("Job runner crashed", exc_info=future.exception())
+            wait(pending)
+            processed += len(pending)
+        connections.close_all()
+        return processed
@@ -0,0 +1,286 @@
+"""
+Live updates for the support dashboard, streamed as Server-Sent Events.
+
+Every write that creates or deletes a service request, changes its status or
+reassigns it also appends a ServiceRequestChange row, in the same
+transaction. Each server process runs one ChangeFeed per event loop. While
+at least one dashboard is connected, the feed reads the rows added since its
+last read once every LIVE_UPDATES_POLL_INTERVAL seconds. That is one indexed
+query however many dashboards are open. New changes are turned into events
+once, and the same encoded text is queued for every open stream. Ids are
+allocated when a row is inserted, so on PostgreSQL a change can become
+visible after one with a higher id; the feed keeps looking for the ids a
+read skipped over for LATE_COMMIT_WINDOW seconds. An idle
+stream is a parked coroutine that sends a comment every
+LIVE_UPDATES_HEARTBEAT seconds, so proxies keep the connection open.
+
+Streams need ASGI, where an open connection does not hold a worker thread.
+Only gas_utility.asgi_urls routes the stream. Under WSGI the dashboard is
+rendered without live updates.
+"""
+import asyncio
+import contextvars
+import json
+import logging
+import time
+import weakref
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections
+from django.db.models import Q
+from django.template.defaultfilters import date as format_date
+from django.utils import timezone
+
+from .models import ServiceRequest, ServiceRequestChange, ServiceRequestCounter
+
+logger = logging.getLogger(__name__)
+
+# Changes read at once; when more are waiting, dashboards reload instead
+READ_LIMIT = 200
+# Batches of events queued for a stream whose client is not reading; then it is told to reload
+STREAM_BACKLOG = 100
+# Seconds between prunes of old changes by each process's feed
+PRUNE_INTERVAL = 3600
+# Seconds a change id skipped by a read is looked for again, in case its transaction commits late
+LATE_COMMIT_WINDOW = 60
+# Changes that alter the status totals shown on the dashboard
+TOTALS_CHANGES = {
+    ServiceRequestChange.CREATED, ServiceRequestChange.STATUS,
+    ServiceRequestChange.DELETED, ServiceRequestChange.BULK,
+}
+
+
+def encode_event(event, data, event_id=None):
+    """Return one event in the text/event-stream format."""
+    lines = [] if event_id is None else [f'id: {event_id}']
+    lines.append(f'event: {event}')
+    lines.append(f"data: {json.dumps(data, separators=(',', ':'))}")
+    return '\n'.join(lines) + '\n\n'
+
+
+def request_data(service_request, changes):
+    """The fields of a support dashboard row, as the template renders them."""
+    user = service_request.customer.user
+    assignee = service_request.assigned_to
+    return {
+        'id': service_request.id,
+        'changes': changes,
+        'status': service_request.status,
+        'priority': service_request.priority,
+        'service_type': service_request.service_type,
+        'customer': f'{user.first_name} {user.last_name}'.strip() or user.username,
+        'assigned_to': assignee.get_full_name() if assignee else None,
+        'created': format_date(service_request.created_at, 'M d, Y H:i'),
+    }
+
+
+def totals_event():
+    totals = ServiceRequestCounter.objects.status_totals()
+    return encode_event('totals', {
+        'total': sum(totals.values()),
+        'pending': totals['Pending'],
+        'in_progress': totals['In Progress'],
+        'resolved': totals['Resolved'],
+    })
+
+
+def read_changes(after, until=None, missing=None):
+    """
+    Return the events for the changes after id ``after`` (and up to ``until``)
+    as one string, and the id of the last change they cover.
+
+    Changes to the same request are merged into one 'request' event with the
+    request's current fields, or a 'deleted' event if it no longer exists; all
+    rows are loaded with one query. A bulk change, or more than READ_LIMIT
+    changes, becomes a single 'reload' event.
+
+    ``missing`` maps the ids earlier reads skipped over (not committed yet, or
+    rolled back) to the time.monotonic() after which they are given up on. The
+    changes among them that have turned up are read too and removed, and the
+    ids this read skips are added. A reload covers them all, so it empties it.
+    """
+    condition = Q(id__gt=after)
+    if missing:
+        now = time.monotonic()
+        for change_id in [change_id for change_id, deadline in missing.items() if deadline < now]:
+            del missing[change_id]
+        condition |= Q(id__in=list(missing))
+    changes = ServiceRequestChange.objects.filter(condition).order_by('id')
+    if until is not None:
+        changes = changes.filter(id__lte=until)
+    rows = list(changes.values_list('id', 'service_request_id', 'kind')[:READ_LIMIT + 1])
+    if not rows:
+        return '', after
+
+    kinds = {kind for change_id, request_id, kind in rows}
+    if len(rows) > READ_LIMIT or ServiceRequestChange.BULK in kinds:
+        if missing is not None:
+            missing.clear()
+        if len(rows) > READ_LIMIT:
+            last = until if until is not None else ServiceRequestChange.objects.latest_id()
+        else:
+            last = max(rows[-1][0], after)
+        return encode_event('reload', {}, last) + totals_event(), last
+    position = max(rows[-1][0], after)
+    if missing is not None:
+        track_missing(missing, after, position, [row[0] for row in rows])
+
+    # request id -> [id of its last change, kinds of change]
+    merged = {}
+    for change_id, request_id, kind in rows:
+        entry = merged.setdefault(request_id, [change_id, []])
+        entry[0] = change_id
+        if kind not in entry[1]:
+            entry[1].append(kind)
+    service_requests = ServiceRequest.objects.with_related().in_bulk(merged)
+
+    events = []
+    for request_id, (change_id, request_kinds) in sorted(merged.items(), key=lambda item: item[1][0]):
+        service_request = service_requests.get(request_id)
+        if service_request is None:
+            events.append(encode_event('deleted', {'id': request_id}, change_id))
+        else:
+            events.append(encode_event('request', request_data(service_request, request_kinds), change_id))
+    if kinds & TOTALS_CHANGES:
+        events.append(totals_event())
+    return ''.join(events), position
+
+
+def track_missing(missing, after, position, read_ids):
+    """
+    Update ``missing`` after a read that moved from ``after`` to ``position``.
+
+    Ids that turned up are removed; ids between the two that did not are
+    added with a LATE_COMMIT_WINDOW deadline. A wider gap than READ_LIMIT
+    ids (a rolled-back bulk insert, say) is not tracked.
+    """
+    read_ids = set(read_ids)
+    for change_id in read_ids & missing.keys():
+        del missing[change_id]
+    skipped = position - after - len([change_id for change_id in read_ids if change_id > after])
+    if 0 < skipped <= READ_LIMIT:
+        deadline = time.monotonic() + LATE_COMMIT_WINDOW
+        for change_id in range(after + 1, position):
+            if change_id not in read_ids:
+                missing[change_id] = deadline
+
+
+def poll(after, missing, prune_before=None):
+    """read_changes() for the feed, which runs outside any request."""
+    # Like a request cycle: drop connections that broke or outlived CONN_MAX_AGE
+    close_old_connections()
+    try:
+        if prune_before is not None:
+            ServiceRequestChange.objects.prune(prune_before)
+        return read_changes(after, missing=missing)
+    finally:
+        close_old_connections()
+
+
+class ChangeFeed:
+    """
+    Reads new changes while streams are subscribed and queues the events for each of them.
+
+    One feed serves every stream on an event loop; see get_feed(). The poller
+    stops when the last stream unsubscribes, and the next subscriber starts
+    it again from the newest change.
+    """
+
+    def __init__(self):
+        self.streams = set()
+        # Id of the last change read, while the poller runs
+        self.position = None
+        # Ids below the position that were not visible yet -> when to give up on them
+        self.missing = {}
+        self.task = None
+        self.next_prune = 0
+
+    async def subscribe(self):
+        """Return a new stream's queue and the id of the last change already read for it."""
+        if self.position is None:
+            latest = await sync_to_async(ServiceRequestChange.objects.latest_id)()
+            if self.position is None:
+                self.position = latest
+        queue = asyncio.Queue(maxsize=STREAM_BACKLOG)
+        self.streams.add(queue)
+        if self.task is None:
+            # The poller outlives the request that starts it, so it gets a context of its own
+            self.task = asyncio.get_running_loop().create_task(self.run(), context=contextvars.Context())
+        return queue, self.position
+
+    def unsubscribe(self, queue):
+        self.streams.discard(queue)
+
+    async def run(self):
+        try:
+            while self.streams:
+                await asyncio.sleep(settings.LIVE_UPDATES_POLL_INTERVAL)
+                try:
+                    events, self.position = await sync_to_async(poll)(
+                        self.position, self.missing, self.prune_before()
+                    )
+                except DatabaseError:
+                    logger.exception('Could not read service request changes')
+                    continue
+                if events:
+                    self.publish(events)
+        finally:
+            self.task = None
+            self.position = None
+            self.missing = {}
+
+    def publish(self, events):
+        for queue in self.streams:
+            try:
+                queue.put_nowait(events)
+            except asyncio.QueueFull:
+                # Replace the backlog: the client reloads rather than replaying it
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(encode_event('reload', {}, self.position))
+
+    def prune_before(self):
+        """Return the cutoff for deleting old changes when a prune is due, else None."""
+        now = time.monotonic()
+        if now < self.next_prune:
+            return None
+        self.next_prune = now + PRUNE_INTERVAL
+        return timezone.now() - timedelta(hours=settings.LIVE_UPDATES_RETENTION_HOURS)
+
+
+_feeds = weakref.WeakKeyDictionary()
+
+
+def get_feed():
+    """Return the ChangeFeed of the running event loop."""
+    loop = asyncio.get_running_loop()
+    if loop not in _feeds:
+        _feeds[loop] = ChangeFeed()
+    return _feeds[loop]
+
+
+async def event_stream(feed, last_event_id=None):
+    """
+    Yield the text of a dashboard's event stream until the client disconnects.
+
+    A client that reconnects with the id of the last event it saw (or that
+    passes the position its page was rendered at) first gets the changes it
+    missed.
+    """
+    queue, position = await feed.subscribe()
+    heartbeat = settings.LIVE_UPDATES_HEARTBEAT
+    try:
+        yield f'retry: {int(settings.LIVE_UPDATES_POLL_INTERVAL * 1000) + 2000}\n\n'
+        if last_event_id is not None and last_event_id < position:
+            events, position = await sync_to_async(read_changes)(last_event_id, position)
+            if events:
+                yield events
+        while True:
+            try:
+                yield await asyncio.wait_for(queue.get(), heartbeat)
+            except asyncio.TimeoutError:
+                yield ': keep-alive\n\n'
+    finally:
+        feed.unsubscribe(queue)
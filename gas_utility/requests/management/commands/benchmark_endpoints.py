@@ -0,0 +1,68 @@
+from django.core.management.base import BaseCommand, CommandError
+from requests.benchmarks import (
+    ENDPOINTS, BenchmarkError, BenchmarkRunner, benchmark_users, compare, load_results, sample_request_ids, save_results
+)
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark the dashboards, request detail page, statistics and API list through the test client; '
+        'report p50/p95/p99 latency, queries per request and throughput'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50, help='Measured requests per endpoint')
+        parser.add_argument('--warmup', type=int, default=5, help='Unmeasured requests per endpoint first')
+        parser.add_argument(
+            '--endpoint', action='append', choices=[endpoint.name for endpoint in ENDPOINTS],
+            help='Benchmark only this endpoint (repeatable)'
+        )
+        parser.add_argument('--customer', type=str, help='Customer username (default: the one with most requests)')
+        parser.add_argument('--staff', type=str, help='Support staff username (default: the first representative)')
+        parser.add_argument('--seed', type=int, default=0, help='Seed for choosing the request detail pages')
+        parser.add_argument('--output', type=str, help='Write the results to this JSON file')
+        parser.add_argument('--compare', type=str, help='Show changes against results saved by an earlier run')
+
+    def handle(self, *args, **kwargs):
+        if kwargs['iterations'] < 2 or kwargs['warmup'] < 0:
+            raise CommandError('--iterations must be at least 2 and --warmup not negative.')
+        baseline = load_results(kwargs['compare']) if kwargs['compare'] else None
+        selected = kwargs['endpoint']
+        endpoints = [endpoint for endpoint in ENDPOINTS if not selected or endpoint.name in selected]
+
+        request_ids = sample_request_ids(kwargs['iterations'], kwargs['seed'])
+        try:
+            users = benchmark_users(kwargs['customer'], kwargs['staff'])
+        except BenchmarkError as error:
+            raise CommandError(str(error))
+        if not request_ids:
+            raise CommandError('There are no service requests; see manage.py generate_service_data.')
+
+        def report(name, stats):
+            self.stdout.write(
+                f"{name:<24} p50 {stats['p50_ms']:>8.1f} ms  p95 {stats['p95_ms']:>8.1f} ms  "
+                f"p99 {stats['p99_ms']:>8.1f} ms  {stats['queries_per_request']:>5.1f} queries  "
+                f"{stats['throughput_rps']:>7.1f} req/s"
+            )
+
+        runner = BenchmarkRunner(
+            users, request_ids,
+            iterations=kwargs['iterations'], warmup=kwargs['warmup']
+        )
+        try:
+            results = runner.run(endpoints, on_endpoint=report)
+        except BenchmarkError as error:
+            raise CommandError(str(error))
+
+        if baseline:
+            self.stdout.write(f"\nCompared with {baseline.get('commit') or kwargs['compare']}:")
+            for name, metric, before, after, change in compare(baseline, results):
+                line = f'{name:<24} {metric:<20} {before:>9} -> {after:>9}'
+                if change is None:
+                    self.stdout.write(line)
+                elif change > 0.1:
+                    self.stdout.write(self.style.WARNING(f'{line}  {change:+.0%}'))
+                else:
+                    self.stdout.write(f'{line}  {change:+.0%}')
+        if kwargs['output']:
+            save_results(results, kwargs['output'])
+            self.stdout.write(self.style.SUCCESS(f"Saved results to {kwargs['output']}."))
@@ -0,0 +1,85 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from requests.benchmarks import ENDPOINTS, BenchmarkError, benchmark_users, sample_request_ids, save_results
+from requests.server_benchmarks import SERVERS, ServerBenchmark, compare_servers
+
+# Endpoints with an async version under ASGI
+DEFAULT_ENDPOINTS = ('dashboard', 'api_list', 'api_detail', 'statistics')
+
+class Command(BaseCommand):
+    help = (
+        'Start the application under gunicorn (WSGI) and uvicorn (ASGI) and compare throughput and latency '
+        'of the dashboard and API endpoints at several levels of concurrency'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--server', action='append', choices=[server.name for server in SERVERS],
+            help='Benchmark only this server (repeatable)'
+        )
+        parser.add_argument(
+            '--endpoint', action='append', choices=[endpoint.name for endpoint in ENDPOINTS],
+            help=f"Benchmark this endpoint (repeatable; default: {', '.join(DEFAULT_ENDPOINTS)})"
+        )
+        parser.add_argument(
+            '--concurrency', action='append', type=int,
+            help='Concurrent clients (repeatable; default: 1, 10 and 50)'
+        )
+        parser.add_argument('--duration', type=float, default=10.0, help='Seconds of load per endpoint and concurrency')
+        parser.add_argument('--warmup', type=float, default=2.0, help='Seconds of unmeasured load per endpoint first')
+        parser.add_argument('--workers', type=int, default=1, help='Worker processes of each server')
+        parser.add_argument('--threads', type=int, default=8, help='Threads per gunicorn worker')
+        parser.add_argument('--customer', type=str, help='Customer username (default: the one with most requests)')
+        parser.add_argument('--staff', type=str, help='Support staff username (default: the first representative)')
+        parser.add_argument('--seed', type=int, default=0, help='Seed for choosing the request detail pages')
+        parser.add_argument('--output', type=str, help='Write the results to this JSON file')
+
+    def handle(self, *args, **kwargs):
+        concurrency = kwargs['concurrency'] or [1, 10, 50]
+        if min(concurrency) < 1 or kwargs['duration'] <= 0 or kwargs['warmup'] < 0:
+            raise CommandError('--concurrency and --duration must be positive and --warmup not negative.')
+        if kwargs['workers'] < 1 or kwargs['threads'] < 1:
+            raise CommandError('--workers and --threads must be positive.')
+        if settings.SECURE_SSL_REDIRECT:
+            raise CommandError('SECURE_SSL_REDIRECT would redirect the plain HTTP benchmark requests; set DJANGO_DEBUG=True.')
+
+        selected_servers = kwargs['server']
+        servers = [server for server in SERVERS if not selected_servers or server.name in selected_servers]
+        selected = kwargs['endpoint'] or DEFAULT_ENDPOINTS
+        endpoints = [endpoint for endpoint in ENDPOINTS if endpoint.name in selected]
+
+        request_ids = sample_request_ids(100, kwargs['seed'])
+        try:
+            users = benchmark_users(kwargs['customer'], kwargs['staff'])
+        except BenchmarkError as error:
+            raise CommandError(str(error))
+        if not request_ids:
+            raise CommandError('There are no service requests; see manage.py generate_service_data.')
+
+        def report(server, name, clients, stats):
+            line = (
+                f"{server:<5} {name:<24} {clients:>4} clients  {stats['throughput_rps']:>8.1f} req/s  "
+                f"p50 {stats['p50_ms']:>8.1f} ms  p95 {stats['p95_ms']:>8.1f} ms  p99 {stats['p99_ms']:>8.1f} ms"
+            )
+            if stats['failures']:
+                self.stdout.write(self.style.WARNING(f"{line}  {stats['failures']} failed"))
+            else:
+                self.stdout.write(line)
+
+        benchmark = ServerBenchmark(
+            users, request_ids, concurrency=concurrency, duration=kwargs['duration'], warmup=kwargs['warmup'],
+            workers=kwargs['workers'], threads=kwargs['threads']
+        )
+        try:
+            results = benchmark.run(servers, endpoints, on_result=report)
+        except BenchmarkError as error:
+            raise CommandError(str(error))
+
+        comparison = list(compare_servers(results))
+        if comparison:
+            self.stdout.write('\nASGI throughput compared with WSGI:')
+            for name, clients, before, after, change in comparison:
+                self.stdout.write(f'{name:<24} {clients:>4} clients  {before:>8.1f} -> {after:>8.1f} req/s  {change:+.0%}')
+        if kwargs['output']:
+            save_results(results, kwargs['output'])
+            self.stdout.write(self.style.SUCCESS(f"Saved results to {kwargs['output']}."))
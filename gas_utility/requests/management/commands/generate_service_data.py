@@ -0,0 +1,56 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from accounts.models import Customer, SupportRepresentative
+from requests.sample_data import SampleDataGenerator
+
+class Command(BaseCommand):
+    help = (
+        'Generate seeded synthetic customers, support representatives and service requests '
+        'with realistic status, priority and service type distributions (for benchmarking)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--customers', type=int, default=1000, help='Customers to create')
+        parser.add_argument('--reps', type=int, default=20, help='Support representatives to create')
+        parser.add_argument('--requests', type=int, default=20000, help='Service requests to create')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed; the same seed gives the same data')
+        parser.add_argument('--days', type=int, default=365, help='Spread request creation times over this many days')
+        parser.add_argument('--prefix', type=str, default='sample', help='Username prefix of generated accounts')
+        parser.add_argument('--password', type=str, default='sample-pass-123', help='Password of every generated account')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows per bulk insert and transaction')
+
+    def handle(self, *args, **kwargs):
+        if min(kwargs['customers'], kwargs['reps'], kwargs['requests']) < 0 or kwargs['batch_size'] < 1 or kwargs['days'] < 1:
+            raise CommandError('Counts must not be negative; --batch-size and --days must be positive.')
+
+        generator = SampleDataGenerator(
+            seed=kwargs['seed'], prefix=kwargs['prefix'], password=kwargs['password'],
+            days=kwargs['days'], batch_size=kwargs['batch_size']
+        )
+        started = time.monotonic()
+
+        def progress(kind, total):
+            def report(done):
+                self.stdout.write(f'{kind}: {done}/{total} ({done / max(time.monotonic() - started, 1e-6):.0f} rows/s)')
+            return report
+
+        generator.create_representatives(kwargs['reps'])
+        self.stdout.write(f"Created {kwargs['reps']} support representatives.")
+        customer_ids = generator.create_customers(kwargs['customers'], progress('customers', kwargs['customers']))
+
+        if kwargs['requests']:
+            if not customer_ids:
+                customer_ids = list(Customer.objects.values_list('pk', flat=True))
+            if not customer_ids:
+                raise CommandError('There are no customers to create service requests for; use --customers.')
+            started = time.monotonic()
+            generator.create_requests(
+                kwargs['requests'], customer_ids, list(SupportRepresentative.objects.all()),
+                progress('service requests', kwargs['requests'])
+            )
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Generated {kwargs['customers']} customers, {kwargs['reps']} support representatives and "
+            f"{kwargs['requests']} service requests (seed {kwargs['seed']})."
+        ))
@@ -0,0 +1,24 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from requests.models import ServiceRequestChange
+
+class Command(BaseCommand):
+    help = (
+        'Delete old entries of the service request change feed that drives the live support dashboard. '
+        'Feeds of open dashboards prune it too; run this from cron where no ASGI server runs.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--hours', type=float, default=settings.LIVE_UPDATES_RETENTION_HOURS,
+            help='Keep changes from the last this many hours (default: LIVE_UPDATES_RETENTION_HOURS)'
+        )
+
+    def handle(self, *args, **kwargs):
+        if kwargs['hours'] < 0:
+            raise CommandError('--hours must not be negative.')
+        deleted = ServiceRequestChange.objects.prune(timezone.now() - timedelta(hours=kwargs['hours']))
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} service request changes.'))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+from requests.models import ServiceRequestCounter
+
+class Command(BaseCommand):
+    help = 'Verify the materialized service request counters and rebuild them if they drifted'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help='Only verify; exit with an error if counters are wrong')
+        parser.add_argument('--force', action='store_true', help='Rebuild even if the counters verify cleanly')
+
+    def handle(self, *args, **kwargs):
+        mismatches = ServiceRequestCounter.objects.verify()
+        
+        for (status, priority, service_type), (stored, actual) in sorted(mismatches.items()):
+            self.stdout.write(self.style.WARNING(
+                f'{status} / {priority} / {service_type}: stored {stored}, actual {actual}'
+            ))
+        
+        if kwargs['check']:
+            if mismatches:
+                raise CommandError(f'{len(mismatches)} service request counters are out of date.')
+            self.stdout.write(self.style.SUCCESS('Service request counters are up to date.'))
+            return
+        
+        if not mismatches and not kwargs['force']:
+            self.stdout.write(self.style.SUCCESS('Service request counters are up to date; nothing to rebuild.'))
+            return
+        
+        ServiceRequestCounter.objects.rebuild()
+        self.stdout.write(self.style.SUCCESS('Successfully rebuilt service request counters.'))
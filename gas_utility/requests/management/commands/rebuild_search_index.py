@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+from requests import search
+
+class Command(BaseCommand):
+    help = 'Recreate the full-text search triggers and reindex every service request'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default', help='Database alias to rebuild the index on')
+
+    def handle(self, *args, **kwargs):
+        connection = connections[kwargs['database']]
+        
+        if not search.is_supported(connection):
+            self.stdout.write(self.style.WARNING(
+                f'Full-text search is not available on {connection.vendor}; searches use icontains.'
+            ))
+            return
+        
+        with transaction.atomic(using=connection.alias):
+            search.install(connection)
+            search.rebuild(connection)
+        
+        self.stdout.write(self.style.SUCCESS('Successfully rebuilt the service request search index.'))
@@ -0,0 +1,33 @@
+import signal
+
+from django.core.management.base import BaseCommand
+from requests.jobs import Worker
+
+class Command(BaseCommand):
+    help = 'Run queued background jobs on a thread or process pool'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=4, help='Number of jobs to run at once (default: 4)')
+        parser.add_argument('--pool', choices=['thread', 'process'], default='thread', help='Run jobs in threads or in processes')
+        parser.add_argument('--queue', action='append', dest='queues', help='Only run jobs from this queue (repeatable)')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds between checks for due jobs when idle')
+        parser.add_argument('--burst', action='store_true', help='Exit once no jobs are due instead of waiting for more')
+
+    def handle(self, *args, **kwargs):
+        worker = Worker(
+            concurrency=kwargs['concurrency'],
+            pool=kwargs['pool'],
+            queues=kwargs['queues'],
+            poll_interval=kwargs['poll_interval'],
+        )
+        
+        # Finish the running jobs before exiting on Ctrl+C or a service stop
+        def stop(signum, frame):
+            self.stdout.write(self.style.WARNING('Stopping after the running jobs finish...'))
+            worker.stop()
+        signal.signal(signal.SIGINT, stop)
+        signal.signal(signal.SIGTERM, stop)
+        
+        self.stdout.write(f'Worker {worker.name} running up to {worker.concurrency} jobs on a {worker.pool} pool.')
+        processed = worker.run(burst=kwargs['burst'])
+        self.stdout.write(self.style.SUCCESS(f'Processed {processed} jobs.'))
@@ -0,0 +1,42 @@
+# Generated by Django 5.1.7 on 2026-10-18 12:10
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def populate_counters(apps, schema_editor):
+    ServiceRequest = apps.get_model('requests', 'ServiceRequest')
+    ServiceRequestCounter = apps.get_model('requests', 'ServiceRequestCounter')
+    db_alias = schema_editor.connection.alias
+    rows = ServiceRequest.objects.using(db_alias).order_by().values(
+        'status', 'priority', 'service_type'
+    ).annotate(count=Count('id'))
+    ServiceRequestCounter.objects.using(db_alias).bulk_create([
+        ServiceRequestCounter(**row) for row in rows
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('requests', '0004_remove_customer_user_alter_servicerequest_customer_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ServiceRequestCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('Pending', 'Pending'), ('In Progress', 'In Progress'), ('Resolved', 'Resolved')], max_length=20)),
+                ('priority', models.CharField(choices=[('Low', 'Low'), ('Medium', 'Medium'), ('High', 'High'), ('Urgent', 'Urgent')], max_length=20)),
+                ('service_type', models.CharField(choices=[('New Connection', 'New Connection'), ('Billing Issue', 'Billing Issue'), ('Gas Leak', 'Gas Leak'), ('Meter Problem', 'Meter Problem'), ('Other', 'Other')], max_length=100)),
+                ('count', models.IntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Service Request Counter',
+                'verbose_name_plural': 'Service Request Counters',
+                'constraints': [models.UniqueConstraint(fields=('status', 'priority', 'service_type'), name='unique_request_counter_key')],
+            },
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+from django.db import migrations
+
+from requests import search
+
+
+def create_search_index(apps, schema_editor):
+    search.install(schema_editor.connection)
+    search.rebuild(schema_editor.connection)
+
+
+def drop_search_index(apps, schema_editor):
+    search.uninstall(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_alter_user_options_user_created_at_user_updated_at_and_more'),
+        ('requests', '0005_servicerequestcounter'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
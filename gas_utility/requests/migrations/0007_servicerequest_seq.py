@@ -0,0 +1,41 @@
+# Generated by Django 5.1.7 on 2026-10-18 15:02
+
+from django.db import migrations, models
+from django.db.models import F, Max, OuterRef, Subquery, Window
+from django.db.models.functions import Coalesce, RowNumber
+
+
+def number_existing_requests(apps, schema_editor):
+    """Number each customer's requests 1..n in creation order and record n on the customer."""
+    ServiceRequest = apps.get_model('requests', 'ServiceRequest')
+    Customer = apps.get_model('accounts', 'Customer')
+    db_alias = schema_editor.connection.alias
+
+    numbers = list(ServiceRequest.objects.using(db_alias).annotate(
+        number=Window(RowNumber(), partition_by=F('customer_id'), order_by=(F('created_at').asc(), F('id').asc()))
+    ).values_list('id', 'number'))
+    ServiceRequest.objects.using(db_alias).bulk_update(
+        [ServiceRequest(id=pk, seq=number) for pk, number in numbers], ['seq'], batch_size=500
+    )
+
+    last_seq = ServiceRequest.objects.using(db_alias).filter(customer=OuterRef('pk')).order_by().values(
+        'customer'
+    ).annotate(last=Max('seq')).values('last')
+    Customer.objects.using(db_alias).update(last_request_seq=Coalesce(Subquery(last_seq), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_customer_last_request_seq'),
+        ('requests', '0006_servicerequest_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='servicerequest',
+            name='seq',
+            field=models.PositiveIntegerField(editable=False, help_text='Per-customer request number, allocated when the request is created', null=True),
+        ),
+        migrations.RunPython(number_existing_requests, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.7 on 2026-10-18 15:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_customer_last_request_seq'),
+        ('requests', '0007_servicerequest_seq'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='servicerequest',
+            name='seq',
+            field=models.PositiveIntegerField(editable=False, help_text='Per-customer request number, allocated when the request is created'),
+        ),
+        migrations.AddConstraint(
+            model_name='servicerequest',
+            constraint=models.UniqueConstraint(fields=('customer', 'seq'), name='unique_customer_request_seq'),
+        ),
+    ]
@@ -0,0 +1,160 @@
+# Generated by Django 5.1.7 on 2026-10-18 16:10
+
+import re
+from datetime import datetime, timezone
+from itertools import groupby
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+# Notes used to be appended as "<YYYY-mm-dd HH:MM:SS> - <username>:\n<text>" (UTC),
+# separated by blank lines; status changes were entries of their own
+NOTE_HEADER = re.compile(r'^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}) - (\S+?):[ \t]*$', re.MULTILINE)
+STATUS_CHANGE = re.compile(r'^Status changed from (.+) to (.+)$')
+BATCH_SIZE = 1000
+# Header name of entries whose author is unknown, when they cannot lead the blob
+UNKNOWN_AUTHOR = '(unknown)'
+
+
+def parse_notes(notes, default_time):
+    """
+    Yield (created_at, username, text) for every entry of a notes blob.
+
+    Text before the first header (notes written without one) is attributed to
+    nobody at ``default_time``.
+    """
+    headers = list(NOTE_HEADER.finditer(notes))
+    leading = notes[:headers[0].start()] if headers else notes
+    if leading.strip():
+        yield default_time, None, leading.strip()
+    for index, header in enumerate(headers):
+        end = headers[index + 1].start() if index + 1 < len(headers) else len(notes)
+        text = notes[header.end():end].strip()
+        if text:
+            created_at = datetime.strptime(header.group(1), '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
+            yield created_at, header.group(2), text
+
+
+def format_notes(entries):
+    """Return the notes blob parse_notes() reads back as ``entries`` of (created_at, username, text)."""
+    blocks = []
+    for created_at, username, text in entries:
+        if username is None and not blocks:
+            blocks.append(text)
+        else:
+            stamp = created_at.astimezone(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+            blocks.append(f'{stamp} - {username or UNKNOWN_AUTHOR}:\n{text}')
+    return '\n\n'.join(blocks)
+
+
+def parse_notes_into_events(apps, schema_editor):
+    """
+    Turn every notes blob into note and status events and clear it.
+
+    The search index covers the notes column and the note events, so a blob
+    left in place would be indexed, and ranked, twice.
+    """
+    ServiceRequest = apps.get_model('requests', 'ServiceRequest')
+    ServiceRequestEvent = apps.get_model('requests', 'ServiceRequestEvent')
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    db_alias = schema_editor.connection.alias
+
+    def flush(pending, migrated):
+        usernames = {username for username, event in pending if username}
+        user_ids = dict(User.objects.using(db_alias).filter(username__in=usernames).values_list('username', 'id'))
+        events = []
+        for username, event in pending:
+            event.author_id = user_ids.get(username)
+            events.append(event)
+        ServiceRequestEvent.objects.using(db_alias).bulk_create(events)
+        ServiceRequest.objects.using(db_alias).filter(id__in=migrated).update(notes=None)
+
+    rows = ServiceRequest.objects.using(db_alias).exclude(notes__isnull=True).exclude(notes='').order_by('id')
+    pending = []
+    migrated = []
+    for request_id, notes, created_at in rows.values_list('id', 'notes', 'created_at'):
+        for event_time, username, text in parse_notes(notes, created_at):
+            status = STATUS_CHANGE.match(text)
+            if status:
+                event = ServiceRequestEvent(
+                    service_request_id=request_id, kind='status', created_at=event_time,
+                    old_value=status.group(1), new_value=status.group(2)
+                )
+            else:
+                event = ServiceRequestEvent(service_request_id=request_id, kind='note', created_at=event_time, body=text)
+            pending.append((username, event))
+        migrated.append(request_id)
+        if len(pending) >= BATCH_SIZE or len(migrated) >= BATCH_SIZE:
+            flush(pending, migrated)
+            pending = []
+            migrated = []
+    if migrated:
+        flush(pending, migrated)
+
+
+def write_events_into_notes(apps, schema_editor):
+    """Write the note and status events back into the notes blobs, after any text they hold."""
+    ServiceRequest = apps.get_model('requests', 'ServiceRequest')
+    ServiceRequestEvent = apps.get_model('requests', 'ServiceRequestEvent')
+    db_alias = schema_editor.connection.alias
+
+    def flush(blobs):
+        existing = dict(
+            ServiceRequest.objects.using(db_alias).filter(id__in=blobs)
+            .exclude(notes__isnull=True).exclude(notes='').values_list('id', 'notes')
+        )
+        ServiceRequest.objects.using(db_alias).bulk_update([
+            ServiceRequest(id=request_id, notes='\n\n'.join(filter(None, [existing.get(request_id), blob])))
+            for request_id, blob in blobs.items()
+        ], ['notes'])
+
+    events = ServiceRequestEvent.objects.using(db_alias).filter(kind__in=['note', 'status']).order_by(
+        'service_request_id', 'created_at', 'id'
+    ).values_list('service_request_id', 'kind', 'body', 'old_value', 'new_value', 'created_at', 'author__username')
+    blobs = {}
+    for request_id, rows in groupby(events.iterator(), key=lambda row: row[0]):
+        blobs[request_id] = format_notes(
+            (created_at, username, body if kind == 'note' else f'Status changed from {old_value} to {new_value}')
+            for _, kind, body, old_value, new_value, created_at, username in rows
+        )
+        if len(blobs) >= BATCH_SIZE:
+            flush(blobs)
+            blobs = {}
+    if blobs:
+        flush(blobs)
+
+
+class Migration(migrations.Migration):
+
+    # Notes move from the notes column to note events while the search triggers are suspended
+    rebuild_search_index = True
+
+    dependencies = [
+        ('requests', '0008_alter_servicerequest_seq_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ServiceRequestEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('note', 'Note'), ('status', 'Status change'), ('assignment', 'Assignment change')], max_length=20)),
+                ('body', models.TextField(blank=True, help_text='Note text')),
+                ('old_value', models.CharField(blank=True, max_length=255)),
+                ('new_value', models.CharField(blank=True, max_length=255)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('author', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('service_request', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='events', to='requests.servicerequest')),
+            ],
+            options={
+                'verbose_name': 'Service Request Event',
+                'verbose_name_plural': 'Service Request Events',
+                'ordering': ['-created_at', '-id'],
+                'indexes': [models.Index(fields=['service_request', '-created_at', '-id'], name='requests_se_service_c12abc_idx')],
+            },
+        ),
+        migrations.RunPython(parse_notes_into_events, write_events_into_notes),
+    ]
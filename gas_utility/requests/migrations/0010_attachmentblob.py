@@ -0,0 +1,33 @@
+# Generated by Django 5.1.7 on 2026-10-18 12:37
+
+import requests.attachments
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('requests', '0009_servicerequestevent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AttachmentBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(help_text='Storage name, derived from the content hash', max_length=255, unique=True)),
+                ('size', models.PositiveBigIntegerField()),
+                ('ref_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Attachment Blob',
+                'verbose_name_plural': 'Attachment Blobs',
+            },
+        ),
+        migrations.AlterField(
+            model_name='servicerequest',
+            name='attached_file',
+            field=models.FileField(blank=True, help_text='Supporting documentation or images', null=True, storage=requests.attachments.get_attachment_storage, upload_to='service_requests/'),
+        ),
+    ]
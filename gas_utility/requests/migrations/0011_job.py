@@ -0,0 +1,36 @@
+# Generated by Django 5.1.7 on 2026-10-18 12:41
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('requests', '0010_attachmentblob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('task', models.CharField(help_text='Registered task name', max_length=100)),
+                ('payload', models.JSONField(blank=True, default=dict)),
+                ('queue', models.CharField(default='default', max_length=50)),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('failed', 'Failed')], default='queued', max_length=10)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('run_at', models.DateTimeField(default=django.utils.timezone.now, help_text='Earliest time the job may run')),
+                ('locked_by', models.CharField(blank=True, help_text='Claim token of the worker holding the lease', max_length=100)),
+                ('locked_until', models.DateTimeField(blank=True, null=True)),
+                ('last_error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Job',
+                'verbose_name_plural': 'Jobs',
+                'indexes': [models.Index(fields=['status', 'run_at'], name='requests_jo_status_f64126_idx'), models.Index(fields=['status', 'locked_until'], name='requests_jo_status_5f2c9c_idx'), models.Index(fields=['locked_by'], name='requests_jo_locked__816091_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.1.7 on 2026-10-18 13:21
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('requests', '0012_importcheckpoint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ServiceRequestChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('service_request_id', models.BigIntegerField(blank=True, help_text='Empty for bulk changes', null=True)),
+                ('kind', models.CharField(choices=[('created', 'Created'), ('status', 'Status change'), ('assignment', 'Assignment change'), ('deleted', 'Deleted'), ('bulk', 'Bulk change')], max_length=20)),
+                ('created_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'Service Request Change',
+                'verbose_name_plural': 'Service Request Changes',
+            },
+        ),
+    ]
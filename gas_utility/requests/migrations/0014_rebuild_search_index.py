@@ -0,0 +1,17 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """
+    Reindex every service request once: 0009 added note events to the indexed
+    notes and created them from the legacy notes while the triggers were
+    suspended. The post_migrate handler runs the rebuild.
+    """
+
+    rebuild_search_index = True
+
+    dependencies = [
+        ('requests', '0013_servicerequestchange'),
+    ]
+
+    operations = []
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-18 14:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('requests', '0014_rebuild_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='servicerequest',
+            name='attachment_name',
+            field=models.CharField(blank=True, editable=False, help_text='Name the attached file was uploaded with (stored files are named by content hash)', max_length=255),
+        ),
+    ]
@@ -1,7 +1,274 @@
-from django.db import models
+import posixpath
+from collections import Counter, defaultdict
+
+from asgiref.sync import sync_to_async
+from django.db import models, transaction
+from django.db.models import Avg, Case, Count, DurationField, ExpressionWrapper, F, Min, Prefetch, Q, Sum, Value, When, Window
+from django.db.models.functions import Coalesce, CumeDist
 from django.conf import settings
 from django.utils import timezone
 from accounts.models import Customer, SupportRepresentative
+from . import jobs
+from .attachments import get_attachment_storage
+
+# Fields that make up the key of a ServiceRequestCounter row
+COUNTER_FIELDS = ('status', 'priority', 'service_type')
+# Customers whose sequence numbers are reserved by one statement in bulk_create
+SEQ_ALLOCATION_BATCH = 500
+# Fields whose changes are recorded for live dashboards, and the ServiceRequestChange kind of each
+LIVE_FIELDS = {'status': 'status', 'assigned_to': 'assignment', 'assigned_to_id': 'assignment'}
+# Writes touching more requests than this are recorded as one bulk change
+CHANGE_FEED_ROW_LIMIT = 100
+
+
+def allocate_request_seqs(customer_id, count=1, using=None):
+    """
+    Reserve ``count`` consecutive request sequence numbers for a customer and return the first.
+
+    The customer row's counter is bumped before it is read, so the row stays
+    locked until the surrounding transaction ends and concurrent inserts for the
+    same customer get distinct numbers. Must run inside that transaction.
+    """
+    customers = Customer.objects.using(using).filter(pk=customer_id)
+    customers.update(last_request_seq=F('last_request_seq') + count)
+    return customers.values_list('last_request_seq', flat=True).get() - count + 1
+
+
+def allocate_request_seq_blocks(counts, using=None):
+    """
+    Reserve sequence numbers for several customers at once.
+
+    ``counts`` maps customer ids to how many numbers each needs; returns a dict
+    mapping each customer id to the first number of its block. Customers are
+    handled in id order, SEQ_ALLOCATION_BATCH per UPDATE and SELECT, and stay
+    locked until the surrounding transaction ends, as with allocate_request_seqs.
+    """
+    first_seqs = {}
+    customer_ids = sorted(counts)
+    for start in range(0, len(customer_ids), SEQ_ALLOCATION_BATCH):
+        batch = customer_ids[start:start + SEQ_ALLOCATION_BATCH]
+        customers = Customer.objects.using(using).filter(pk__in=batch)
+        customers.update(last_request_seq=F('last_request_seq') + Case(
+            *[When(pk=customer_id, then=Value(counts[customer_id])) for customer_id in batch]
+        ))
+        for customer_id, last_seq in customers.values_list('pk', 'last_request_seq'):
+            first_seqs[customer_id] = last_seq - counts[customer_id] + 1
+    return first_seqs
+
+
+def queue_status_notifications(changes, using=None):
+    """
+    Queue the customer email for each (request id, old status, new status) in
+    ``changes``, with one INSERT. The job worker sends them once the
+    surrounding transaction commits.
+    """
+    jobs.enqueue_many('requests.notify_status_change', [
+        {'request_id': pk, 'old_status': old_status, 'new_status': new_status}
+        for pk, old_status, new_status in changes if old_status != new_status
+    ], using=using)
+
+
+def _counter_key(row):
+    """Return the (status, priority, service_type) key of a dict-like row."""
+    return tuple(row[field] for field in COUNTER_FIELDS)
+
+
+class ServiceRequestQuerySet(models.QuerySet):
+    """
+    QuerySet with aggregate helpers used by dashboards and the statistics API.
+
+    Bulk writes (update, delete, bulk_create) keep ServiceRequestCounter in
+    step and record ServiceRequestChange rows within the same transaction.
+    """
+
+    def update(self, **kwargs):
+        counted = bool(set(COUNTER_FIELDS) & kwargs.keys())
+        changes = sorted({kind for field, kind in LIVE_FIELDS.items() if field in kwargs})
+        if not counted and not changes:
+            return super().update(**kwargs)
+
+        with transaction.atomic(using=self.db):
+            literal = not any(
+                hasattr(kwargs[field], 'resolve_expression') for field in COUNTER_FIELDS if field in kwargs
+            )
+            # Read before the update, which may change which rows the filter matches
+            pks = list(self.values_list('pk', flat=True)) if changes or not literal else []
+            if not counted:
+                rows = super().update(**kwargs)
+                deltas = {}
+            elif literal:
+                # The new key of every group is known up front, so one GROUP BY is enough
+                before = list(self.status_breakdown())
+                rows = super().update(**kwargs)
+                deltas = Counter()
+                for row in before:
+                    deltas[_counter_key(row)] -= row['count']
+                    deltas[_counter_key({**row, **kwargs})] += row['count']
+            else:
+                # Expressions (e.g. bulk_update's CASE) are resolved per row; compare before and after
+                affected = self.model.objects.filter(pk__in=pks)
+                deltas = Counter()
+                for row in affected.status_breakdown():
+                    deltas[_counter_key(row)] -= row['count']
+                rows = super().update(**kwargs)
+                for row in affected.status_breakdown():
+                    deltas[_counter_key(row)] += row['count']
+            ServiceRequestCounter.objects.adjust(deltas)
+            ServiceRequestChange.objects.db_manager(self.db).record(changes, pks)
+        return rows
+
+    update.alters_data = True
+
+    def delete(self):
+        with transaction.atomic(using=self.db):
+            deltas = Counter()
+            for row in self.status_breakdown():
+                deltas[_counter_key(row)] -= row['count']
+            pks = list(self.values_list('pk', flat=True))
+            result = super().delete()
+            ServiceRequestCounter.objects.adjust(deltas)
+            ServiceRequestChange.objects.db_manager(self.db).record([ServiceRequestChange.DELETED], pks)
+        return result
+
+    delete.alters_data = True
+    delete.queryset_only = True
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        with transaction.atomic(using=self.db):
+            # One block of sequence numbers per customer, reserved in customer order
+            unnumbered = defaultdict(list)
+            for obj in objs:
+                if obj.seq is None:
+                    unnumbered[obj.customer_id].append(obj)
+            first_seqs = allocate_request_seq_blocks(
+                {customer_id: len(batch) for customer_id, batch in unnumbered.items()}, using=self.db
+            )
+            for customer_id, batch in unnumbered.items():
+                for offset, obj in enumerate(batch):
+                    obj.seq = first_seqs[customer_id] + offset
+
+            objs = super().bulk_create(objs, *args, **kwargs)
+            if kwargs.get('ignore_conflicts') or kwargs.get('update_conflicts'):
+                # Which rows were actually written is unknown; recount instead
+                ServiceRequestCounter.objects.rebuild()
+            else:
+                ServiceRequestCounter.objects.adjust(Counter(obj.counter_key() for obj in objs))
+            ServiceRequestChange.objects.db_manager(self.db).record(
+                [ServiceRequestChange.CREATED], [obj.pk for obj in objs]
+            )
+        return objs
+
+    def status_breakdown(self):
+        """
+        Return request counts grouped by (status, priority, service_type).
+
+        A single GROUP BY query; the result has at most one row per choice
+        combination, so callers can fold it into any headline number cheaply.
+        """
+        return self.order_by().values('status', 'priority', 'service_type').annotate(count=Count('id'))
+
+    def apply_changes(self, author=None, **values):
+        """
+        update() that follows the rules of ServiceRequest.save(), returning the number of rows changed.
+
+        updated_at is stamped, and when the status changes resolved_at is kept
+        or set to now for resolved requests and cleared for any other status.
+        Status and assignment changes are added to the timeline of each request,
+        credited to ``author``, and customers are notified of status changes;
+        each with one INSERT in the transaction of the UPDATE.
+        """
+        now = timezone.now()
+        values.setdefault('updated_at', now)
+        if 'status' in values:
+            if values['status'] == 'Resolved':
+                values['resolved_at'] = Coalesce(F('resolved_at'), Value(now))
+            else:
+                values['resolved_at'] = None
+        if not {'status', 'assigned_to', 'assigned_to_id'} & values.keys():
+            return self.update(**values)
+
+        with transaction.atomic(using=self.db):
+            before = list(self.order_by().values_list('pk', 'status', 'assigned_to_id'))
+            rows = self.update(**values)
+            ServiceRequestEvent.objects.db_manager(self.db).record_bulk_update(before, values, author)
+            if 'status' in values:
+                queue_status_notifications(
+                    [(pk, old_status, values['status']) for pk, old_status, old_assigned_to_id in before],
+                    using=self.db
+                )
+        return rows
+
+    apply_changes.alters_data = True
+
+    def set_status(self, status, author=None):
+        """Change the status of every request in one UPDATE."""
+        return self.apply_changes(author=author, status=status)
+
+    set_status.alters_data = True
+
+    def assign(self, support_rep, author=None):
+        """Assign every request to ``support_rep`` (or unassign with None) in one UPDATE."""
+        return self.apply_changes(author=author, assigned_to=support_rep)
+
+    assign.alters_data = True
+
+    def with_related(self):
+        """
+        Join the customer and assignee users that request listings render on every
+        row, and leave out the legacy notes text, which no page renders.
+        """
+        return self.select_related('customer__user', 'assigned_to__user').defer('notes')
+
+    def with_serializer_related(self, columns=None, relations=('customer', 'assigned_to')):
+        """
+        Load everything ServiceRequestSerializer renders: customer users are joined and
+        assignees are prefetched in one query with their active request counts.
+
+        For sparse fieldsets, ``columns`` limits the loaded model fields with
+        ``.only()`` and ``relations`` names the nested details to load.
+        """
+        queryset = self if columns is None else self.only(*columns)
+        if 'customer' in relations:
+            queryset = queryset.select_related('customer__user')
+        if 'assigned_to' in relations:
+            queryset = queryset.prefetch_related(
+                Prefetch(
+                    'assigned_to',
+                    queryset=SupportRepresentative.objects.select_related('user').with_active_requests_count()
+                )
+            )
+        return queryset
+
+    def search(self, text):
+        """Full-text search ranked by relevance; see requests.search."""
+        from . import search
+        return search.filter_queryset(self, text)
+
+    def resolution_stats(self):
+        """
+        Return average, median and 90th percentile resolution time as timedeltas.
+
+        Everything is computed in a single query: CUME_DIST() ranks the resolved
+        requests by duration and the percentiles are the smallest durations whose
+        rank reaches 0.5 and 0.9 (nearest-rank method). Works on SQLite and PostgreSQL.
+        """
+        duration = ExpressionWrapper(F('resolved_at') - F('created_at'), output_field=DurationField())
+        return self.order_by().filter(
+            status='Resolved',
+            resolved_at__isnull=False
+        ).annotate(
+            duration=duration,
+            rank=Window(CumeDist(), order_by=F('duration').asc())
+        ).aggregate(
+            avg=Avg('duration'),
+            p50=Min('duration', filter=Q(rank__gte=0.5)),
+            p90=Min('duration', filter=Q(rank__gte=0.9))
+        )
+
+    async def aresolution_stats(self):
+        return await sync_to_async(self.resolution_stats)()
+
 
 class ServiceRequest(models.Model):
     """
@@ -35,6 +302,10 @@ class ServiceRequest(models.Model):
         on_delete=models.CASCADE,
         related_name='service_requests'
     )
+    seq = models.PositiveIntegerField(
+        editable=False,
+        help_text="Per-customer request number, allocated when the request is created"
+    )
     service_type = models.CharField(
         max_length=100,
         choices=SERVICE_TYPES,
@@ -43,10 +314,17 @@ class ServiceRequest(models.Model):
     description = models.TextField(help_text="Detailed description of the issue")
     attached_file = models.FileField(
         upload_to='service_requests/', 
+        storage=get_attachment_storage,
         blank=True, 
         null=True,
         help_text="Supporting documentation or images"
     )
+    attachment_name = models.CharField(
+        max_length=255,
+        blank=True,
+        editable=False,
+        help_text="Name the attached file was uploaded with (stored files are named by content hash)"
+    )
     status = models.CharField(
         max_length=20, 
         choices=STATUS_CHOICES, 
@@ -75,6 +353,8 @@ class ServiceRequest(models.Model):
         related_name='assigned_requests'
     )
 
+    objects = ServiceRequestQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Service Request"
         verbose_name_plural = "Service Requests"
@@ -84,20 +364,477 @@ class ServiceRequest(models.Model):
             models.Index(fields=['status', 'created_at']),
             models.Index(fields=['priority', 'status']),
         ]
+        constraints = [
+            models.UniqueConstraint(fields=['customer', 'seq'], name='unique_customer_request_seq'),
+        ]
 
     def __str__(self):
         return f"{self.service_type} - {self.status}"
     
     def save(self, *args, **kwargs):
         """Override save to automatically set resolved_at timestamp."""
+        self.sync_resolved_at()
+        self.sync_attachment_name()
+
+        update_fields = kwargs.get('update_fields')
+        watched = {*COUNTER_FIELDS, *LIVE_FIELDS}
+        if update_fields is not None and not watched & set(update_fields):
+            super().save(*args, **kwargs)
+            return
+
+        using = kwargs.get('using')
+        with transaction.atomic(using=using):
+            if self._state.adding and self.seq is None:
+                self.seq = allocate_request_seqs(self.customer_id, using=using)
+            stored = None if self._state.adding else self._stored_row()
+            super().save(*args, **kwargs)
+            old_key = _counter_key(stored) if stored else None
+            new_key = self.counter_key()
+            if old_key != new_key:
+                deltas = Counter({new_key: 1})
+                if old_key is not None:
+                    deltas[old_key] -= 1
+                ServiceRequestCounter.objects.adjust(deltas)
+
+            if stored is None:
+                changes = [ServiceRequestChange.CREATED]
+            else:
+                changes = [
+                    kind for kind, changed in [
+                        (ServiceRequestChange.STATUS, stored['status'] != self.status),
+                        (ServiceRequestChange.ASSIGNMENT, stored['assigned_to_id'] != self.assigned_to_id),
+                    ] if changed
+                ]
+            ServiceRequestChange.objects.db_manager(using).record(changes, [self.pk])
+
+    def sync_resolved_at(self):
+        """Stamp resolved_at when the request becomes Resolved and clear it otherwise."""
         if self.status == 'Resolved' and not self.resolved_at:
             self.resolved_at = timezone.now()
         elif self.status != 'Resolved':
             self.resolved_at = None
-        super().save(*args, **kwargs)
+
+    def sync_attachment_name(self):
+        """Remember the client's name for a newly attached file and forget it once the file is gone."""
+        if not self.attached_file:
+            self.attachment_name = ''
+        elif not self.attached_file._committed:
+            self.attachment_name = posixpath.basename(self.attached_file.name)[:255]
+
+    def delete(self, *args, **kwargs):
+        """Override delete to decrement the matching ServiceRequestCounter row and record the deletion."""
+        using = kwargs.get('using')
+        with transaction.atomic(using=using):
+            stored = self._stored_row()
+            pk = self.pk
+            result = super().delete(*args, **kwargs)
+            if stored is not None:
+                ServiceRequestCounter.objects.adjust({_counter_key(stored): -1})
+                ServiceRequestChange.objects.db_manager(using).record([ServiceRequestChange.DELETED], [pk])
+        return result
+
+    def counter_key(self):
+        """Return the ServiceRequestCounter key for the current field values."""
+        return (self.status, self.priority, self.service_type)
+
+    def _stored_row(self):
+        """Return the stored counter fields and assignee, locking the row, or None if it does not exist."""
+        return type(self)._base_manager.select_for_update().filter(pk=self.pk).values(
+            *COUNTER_FIELDS, 'assigned_to_id'
+        ).first()
     
     def get_days_open(self):
         """Return the number of days this request has been open."""
         if self.resolved_at:
             return (self.resolved_at - self.created_at).days
         return (timezone.now() - self.created_at).days
+
+
+class ServiceRequestCounterManager(models.Manager):
+    """Manager for reading and maintaining the materialized request counters."""
+
+    def adjust(self, deltas):
+        """
+        Apply a mapping of (status, priority, service_type) -> delta.
+
+        Existing counters are locked in key order, so concurrent writers wait on
+        each other in the same sequence, and changed with a single UPDATE however
+        many keys are involved. Must run inside the transaction that changed the
+        requests.
+        """
+        deltas = {key: delta for key, delta in deltas.items() if delta}
+        if not deltas:
+            return
+        if len(deltas) == 1:
+            # Single-row writes: one UPDATE, no lock-ordering concerns
+            [(key, delta)] = deltas.items()
+            if self.filter(**dict(zip(COUNTER_FIELDS, key))).update(count=F('count') + delta):
+                return
+        keys = Q()
+        for key in deltas:
+            keys |= Q(**dict(zip(COUNTER_FIELDS, key)))
+        existing = {
+            _counter_key(row): row['pk']
+            for row in self.select_for_update().filter(keys).order_by(*COUNTER_FIELDS).values('pk', *COUNTER_FIELDS)
+        }
+        if existing:
+            self.filter(pk__in=existing.values()).update(count=F('count') + Case(
+                *[When(pk=pk, then=Value(deltas[key])) for key, pk in existing.items()],
+                default=Value(0),
+            ))
+        for key in sorted(deltas.keys() - existing.keys()):
+            counter, created = self.get_or_create(**dict(zip(COUNTER_FIELDS, key)), defaults={'count': deltas[key]})
+            if not created:
+                self.filter(pk=counter.pk).update(count=F('count') + deltas[key])
+
+    def breakdown(self):
+        """Return non-empty counters shaped like ServiceRequestQuerySet.status_breakdown()."""
+        return self.exclude(count=0).values(*COUNTER_FIELDS, 'count')
+
+    def status_totals(self):
+        """Return a Counter of request totals by status, read from the counters table."""
+        totals = Counter()
+        for row in self.values('status').annotate(total=Sum('count')).order_by():
+            totals[row['status']] = row['total']
+        return totals
+
+    def rebuild(self):
+        """Recount every counter from the service requests table."""
+        with transaction.atomic(using=self.db):
+            # Lock existing counters so concurrent adjustments wait for the rebuild
+            list(self.select_for_update().values_list('pk', flat=True))
+            self.all().delete()
+            self.bulk_create([
+                self.model(count=row['count'], **{field: row[field] for field in COUNTER_FIELDS})
+                for row in ServiceRequest.objects.status_breakdown()
+            ])
+
+    def verify(self):
+        """Return {key: (stored, actual)} for every counter that disagrees with the requests table."""
+        stored = Counter({_counter_key(row): row['count'] for row in self.values(*COUNTER_FIELDS, 'count')})
+        actual = Counter({_counter_key(row): row['count'] for row in ServiceRequest.objects.status_breakdown()})
+        return {
+            key: (stored[key], actual[key])
+            for key in set(stored) | set(actual)
+            if stored[key] != actual[key]
+        }
+
+
+class ServiceRequestCounter(models.Model):
+    """
+    Materialized count of service requests per (status, priority, service_type).
+
+    Maintained transactionally by ServiceRequest and ServiceRequestQuerySet writes so
+    that dashboards can read headline numbers without scanning the requests table.
+    Run ``manage.py rebuild_request_counters`` to verify or rebuild it.
+    """
+    status = models.CharField(max_length=20, choices=ServiceRequest.STATUS_CHOICES)
+    priority = models.CharField(max_length=20, choices=ServiceRequest.PRIORITY_CHOICES)
+    service_type = models.CharField(max_length=100, choices=ServiceRequest.SERVICE_TYPES)
+    count = models.IntegerField(default=0)
+
+    objects = ServiceRequestCounterManager()
+
+    class Meta:
+        verbose_name = "Service Request Counter"
+        verbose_name_plural = "Service Request Counters"
+        constraints = [
+            models.UniqueConstraint(fields=['status', 'priority', 'service_type'], name='unique_request_counter_key'),
+        ]
+
+    def __str__(self):
+        return f"{self.status} / {self.priority} / {self.service_type}: {self.count}"
+
+
+class ServiceRequestEventManager(models.Manager):
+    """Manager for appending to and reading service request timelines."""
+
+    def record_update(self, service_request, author, old_status, old_assigned_to, note=''):
+        """
+        Append the events for one update of ``service_request``: the note, if any, and
+        its status and assignment changes compared to the given old values.
+
+        All events go in with one INSERT. Returns the created events.
+        """
+        events = []
+        if note:
+            events.append(self.model(
+                service_request=service_request, kind=self.model.NOTE, author=author, body=note
+            ))
+        if service_request.status != old_status:
+            events.append(self.model(
+                service_request=service_request, kind=self.model.STATUS, author=author,
+                old_value=old_status or '', new_value=service_request.status
+            ))
+        if service_request.assigned_to_id != getattr(old_assigned_to, 'pk', None):
+            events.append(self.model(
+                service_request=service_request, kind=self.model.ASSIGNMENT, author=author,
+                old_value=old_assigned_to.get_full_name() if old_assigned_to else '',
+                new_value=service_request.assigned_to.get_full_name() if service_request.assigned_to else ''
+            ))
+        return self.bulk_create(events)
+
+    def record_bulk_update(self, before, values, author=None):
+        """
+        Append the status and assignment events of a queryset update with one INSERT.
+
+        ``before`` holds (pk, status, assigned_to_id) of each updated request as it
+        was, and ``values`` the fields the update set. Returns the created events.
+        """
+        new_status = values.get('status')
+        if 'assigned_to' in values:
+            new_assigned_to_id = getattr(values['assigned_to'], 'pk', values['assigned_to'])
+        else:
+            new_assigned_to_id = values.get('assigned_to_id')
+        assigning = 'assigned_to' in values or 'assigned_to_id' in values
+
+        # Names of the representatives the events mention, in one query
+        names = {}
+        if assigning:
+            rep_ids = {assigned_to_id for pk, status, assigned_to_id in before if assigned_to_id != new_assigned_to_id}
+            if rep_ids:
+                reps = SupportRepresentative.objects.using(self.db).select_related('user').in_bulk(
+                    (rep_ids | {new_assigned_to_id}) - {None}
+                )
+                names = {pk: rep.get_full_name() for pk, rep in reps.items()}
+
+        events = []
+        for pk, status, assigned_to_id in before:
+            if 'status' in values and status != new_status:
+                events.append(self.model(
+                    service_request_id=pk, kind=self.model.STATUS, author=author,
+                    old_value=status or '', new_value=new_status
+                ))
+            if assigning and assigned_to_id != new_assigned_to_id:
+                events.append(self.model(
+                    service_request_id=pk, kind=self.model.ASSIGNMENT, author=author,
+                    old_value=names.get(assigned_to_id, ''), new_value=names.get(new_assigned_to_id, '')
+                ))
+        return self.bulk_create(events)
+
+    def timeline(self, service_request):
+        """Return the events of ``service_request``, newest first, with their authors."""
+        return self.filter(service_request=service_request).select_related('author').order_by('-created_at', '-id')
+
+
+class ServiceRequestEvent(models.Model):
+    """
+    One entry in a service request's timeline: a note, a status change or an
+    assignment change.
+
+    Events are append-only. Each is written with a single INSERT and never
+    updated, so adding to a long history costs the same as adding to a short one.
+    """
+    NOTE = 'note'
+    STATUS = 'status'
+    ASSIGNMENT = 'assignment'
+    KIND_CHOICES = [
+        (NOTE, 'Note'),
+        (STATUS, 'Status change'),
+        (ASSIGNMENT, 'Assignment change'),
+    ]
+
+    service_request = models.ForeignKey(
+        ServiceRequest,
+        on_delete=models.CASCADE,
+        related_name='events'
+    )
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    author = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+'
+    )
+    body = models.TextField(blank=True, help_text="Note text")
+    old_value = models.CharField(max_length=255, blank=True)
+    new_value = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    objects = ServiceRequestEventManager()
+
+    class Meta:
+        verbose_name = "Service Request Event"
+        verbose_name_plural = "Service Request Events"
+        ordering = ['-created_at', '-id']
+        indexes = [
+            models.Index(fields=['service_request', '-created_at', '-id']),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} on request {self.service_request_id}"
+
+    def save(self, *args, **kwargs):
+        """Insert the event; existing events cannot be changed."""
+        if not self._state.adding:
+            raise ValueError("Service request events are append-only and cannot be updated.")
+        super().save(*args, **kwargs)
+
+
+class ServiceRequestChangeManager(models.Manager):
+    """Manager for appending to and reading the live change feed."""
+
+    def record(self, kinds, request_ids):
+        """
+        Record a change of each kind to each of the requests, in one INSERT.
+
+        More than CHANGE_FEED_ROW_LIMIT requests are recorded as a single bulk
+        change: dashboards reload rather than patch that many rows. Must run
+        inside the transaction that changed the requests.
+        """
+        request_ids = [pk for pk in request_ids if pk is not None]
+        if not kinds or not request_ids:
+            return
+        if len(request_ids) > CHANGE_FEED_ROW_LIMIT:
+            self.create(kind=self.model.BULK)
+        else:
+            self.bulk_create([
+                self.model(service_request_id=pk, kind=kind) for pk in request_ids for kind in kinds
+            ])
+
+    def latest_id(self):
+        """Return the id of the newest change, or 0 if there is none."""
+        return self.order_by('-id').values_list('id', flat=True).first() or 0
+
+    def prune(self, before):
+        """Delete changes recorded before ``before``; returns how many were deleted."""
+        deleted, by_model = self.filter(created_at__lt=before).delete()
+        return deleted
+
+
+class ServiceRequestChange(models.Model):
+    """
+    A change to a service request that open dashboards should show: the request
+    was created, changed status, was reassigned or was deleted.
+
+    Rows are appended by the ServiceRequest write paths and read in id order by
+    requests.live, which streams them to support dashboards. The request id is
+    not a foreign key, so deletions can be recorded too. Old rows are pruned
+    after LIVE_UPDATES_RETENTION_HOURS.
+    """
+    CREATED = 'created'
+    STATUS = 'status'
+    ASSIGNMENT = 'assignment'
+    DELETED = 'deleted'
+    BULK = 'bulk'
+    KIND_CHOICES = [
+        (CREATED, 'Created'),
+        (STATUS, 'Status change'),
+        (ASSIGNMENT, 'Assignment change'),
+        (DELETED, 'Deleted'),
+        (BULK, 'Bulk change'),
+    ]
+
+    service_request_id = models.BigIntegerField(null=True, blank=True, help_text="Empty for bulk changes")
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    objects = ServiceRequestChangeManager()
+
+    class Meta:
+        verbose_name = "Service Request Change"
+        verbose_name_plural = "Service Request Changes"
+
+    def __str__(self):
+        if self.service_request_id is None:
+            return self.get_kind_display()
+        return f"{self.get_kind_display()} of request {self.service_request_id}"
+
+
+class AttachmentBlob(models.Model):
+    """
+    A stored attachment file and the number of service requests that use it.
+
+    Attachments are stored once per distinct content (see requests.attachments);
+    the file is deleted when ``ref_count`` drops to zero.
+    """
+    name = models.CharField(max_length=255, unique=True, help_text="Storage name, derived from the content hash")
+    size = models.PositiveBigIntegerField()
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Attachment Blob"
+        verbose_name_plural = "Attachment Blobs"
+
+    def __str__(self):
+        return f"{self.name} ({self.ref_count} references)"
+
+
+class JobQuerySet(models.QuerySet):
+    """Queries over the background job queue (see requests.jobs)."""
+
+    def due(self, now):
+        """Jobs a worker may claim: queued and due, or running with an expired lease."""
+        return self.filter(
+            Q(status=Job.QUEUED, run_at__lte=now) | Q(status=Job.RUNNING, locked_until__lt=now)
+        )
+
+    def leased(self, now):
+        """Jobs currently held by a live worker."""
+        return self.filter(status=Job.RUNNING, locked_until__gte=now)
+
+
+class Job(models.Model):
+    """
+    A unit of background work waiting for, or being run by, ``manage.py run_jobs``.
+
+    A running job is leased to one worker until ``locked_until``; if the worker
+    disappears the lease expires and the job becomes due again. Jobs are deleted
+    when they succeed and kept with ``last_error`` when they fail for good.
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (FAILED, 'Failed'),
+    ]
+
+    task = models.CharField(max_length=100, help_text="Registered task name")
+    payload = models.JSONField(default=dict, blank=True)
+    queue = models.CharField(max_length=50, default='default')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    run_at = models.DateTimeField(default=timezone.now, help_text="Earliest time the job may run")
+    locked_by = models.CharField(max_length=100, blank=True, help_text="Claim token of the worker holding the lease")
+    locked_until = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    objects = JobQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = "Job"
+        verbose_name_plural = "Jobs"
+        indexes = [
+            models.Index(fields=['status', 'run_at']),
+            models.Index(fields=['status', 'locked_until']),
+            models.Index(fields=['locked_by']),
+        ]
+
+    def __str__(self):
+        return f"{self.task} ({self.get_status_display()}, attempt {self.attempts})"
+
+
+class ImportCheckpoint(models.Model):
+    """
+    How far a ``manage.py import_service_data`` run has got through its input.
+
+    ``position`` counts the input records already dealt with. It is updated in
+    the same transaction as the rows it covers, so a resumed import neither
+    skips nor repeats a record.
+    """
+    name = models.CharField(max_length=255, unique=True, help_text="Record type and input file of the import")
+    position = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Import Checkpoint"
+        verbose_name_plural = "Import Checkpoints"
+
+    def __str__(self):
+        return f"{self.name} at record {self.position}"
@@ -0,0 +1,199 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.paginator import Paginator
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination, _positive_int
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class CountedPageNumberPagination(PageNumberPagination):
+    """
+    DRF page number pagination that can reuse a row count the view already has.
+
+    When the view sets ``known_count`` before paginating (the list ETag counts
+    the filtered rows; see requests.conditional), the page needs no COUNT(*)
+    of its own.
+    """
+    known_count = None
+
+    def django_paginator_class(self, object_list, per_page):
+        paginator = Paginator(object_list, per_page)
+        if self.known_count is not None:
+            paginator.count = self.known_count
+        return paginator
+
+
+class KeysetCursorPagination(BasePagination):
+    """
+    Keyset (seek) pagination over a composite ordering.
+
+    Unlike DRF's CursorPagination, which only seeks on the first ordering field
+    and falls back to OFFSET for duplicates, the cursor stores the value of every
+    ordering column plus the primary key. Each page is a single indexed range
+    scan with no OFFSET and no COUNT(*), however deep the client pages.
+
+    The requested ordering is extended with ``tiebreak_ordering`` so that rows are
+    totally ordered; ordering fields must be non-nullable model fields.
+    """
+    cursor_query_param = 'cursor'
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = ('-created_at',)
+    tiebreak_ordering = ('-created_at', '-id')
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+
+        position, reverse = self.decode_cursor(request, queryset.model)
+        ordering = self._reverse_ordering(self.ordering) if reverse else self.ordering
+
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(self._seek_filter(ordering, position))
+
+        # Fetch one extra row to find out whether there is a following page
+        results = list(queryset[:self.page_size + 1])
+        self.page = results[:self.page_size]
+        has_following = len(results) > self.page_size
+
+        if reverse:
+            self.page.reverse()
+            self.has_next = True
+            self.has_previous = has_following
+        else:
+            self.has_next = has_following
+            self.has_previous = position is not None
+
+        return self.page
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        if self.page_size_query_param:
+            try:
+                return _positive_int(
+                    request.query_params[self.page_size_query_param],
+                    strict=True,
+                    cutoff=self.max_page_size
+                )
+            except (KeyError, ValueError):
+                pass
+        return self.page_size
+
+    def get_ordering(self, request, queryset, view):
+        """
+        Return the client's ordering (via the view's OrderingFilter) extended with
+        the tiebreak fields that are not already part of it.
+        """
+        ordering = list(self.ordering)
+        for backend in getattr(view, 'filter_backends', []):
+            if hasattr(backend, 'get_ordering'):
+                ordering = list(backend().get_ordering(request, queryset, view) or ordering)
+                break
+
+        for field in ordering:
+            if '__' in field or field.lstrip('-') in ('?', 'pk'):
+                raise NotFound(f"Cursor pagination does not support ordering by '{field}'.")
+
+        used = {field.lstrip('-') for field in ordering}
+        for field in self.tiebreak_ordering:
+            if field.lstrip('-') not in used:
+                ordering.append(field)
+                used.add(field.lstrip('-'))
+        return tuple(ordering)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def decode_cursor(self, request, model):
+        """Return (position, reverse) for the request's cursor, or (None, False) on the first page."""
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+
+        try:
+            payload = json.loads(urlsafe_b64decode(encoded.encode('ascii')))
+            values = payload['p']
+            if len(values) != len(self.ordering):
+                raise ValueError
+            position = [
+                model._meta.get_field(field.lstrip('-')).to_python(value)
+                for field, value in zip(self.ordering, values)
+            ]
+            return position, bool(payload.get('r'))
+        except (TypeError, ValueError, KeyError, DjangoValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, instance, reverse):
+        values = []
+        for field in self.ordering:
+            value = getattr(instance, field.lstrip('-'))
+            values.append(value.isoformat() if hasattr(value, 'isoformat') else value)
+        payload = {'p': values}
+        if reverse:
+            payload['r'] = 1
+        encoded = urlsafe_b64encode(json.dumps(payload, separators=(',', ':')).encode('ascii')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    @staticmethod
+    def _reverse_ordering(ordering):
+        return tuple(field[1:] if field.startswith('-') else f'-{field}' for field in ordering)
+
+    @staticmethod
+    def _seek_filter(ordering, position):
+        """
+        Build the row-value comparison ``(a, b, id) > (x, y, z)`` for a mixed-direction
+        ordering as ``a >= x AND (a > x OR (a = x AND (b > y OR ...)))``.
+
+        The leading bound on the first column lets the database use it as an
+        index range instead of scanning from the start.
+        """
+        fields = [field.lstrip('-') for field in ordering]
+        lookups = ['lt' if field.startswith('-') else 'gt' for field in ordering]
+
+        seek = Q()
+        for index in reversed(range(len(fields))):
+            strict = Q(**{f'{fields[index]}__{lookups[index]}': position[index]})
+            if index == len(fields) - 1:
+                seek = strict
+            else:
+                seek = strict | (Q(**{fields[index]: position[index]}) & seek)
+
+        bound = Q(**{f'{fields[0]}__{lookups[0]}e': position[0]})
+        return bound & seek
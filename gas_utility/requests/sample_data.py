@@ -0,0 +1,208 @@
+"""
+Seeded synthetic customers, support representatives and service requests.
+
+``manage.py generate_service_data`` uses this to fill a database with
+production-sized data for ``manage.py benchmark_endpoints``. A given seed
+always produces the same rows. The distributions follow the live system:
+most requests end up resolved, gas leaks are urgent, a few customers file
+many requests, and resolution times have a long tail.
+"""
+import random
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.utils import timezone
+
+from accounts.models import Customer, SupportRepresentative, User
+from .imports import explicit_timestamps
+from .models import ServiceRequest, ServiceRequestEvent
+
+STATUS_WEIGHTS = {'Resolved': 70, 'In Progress': 18, 'Pending': 12}
+SERVICE_TYPE_WEIGHTS = {
+    'Billing Issue': 35, 'Meter Problem': 25, 'New Connection': 20, 'Other': 12, 'Gas Leak': 8,
+}
+PRIORITY_WEIGHTS = {'Low': 25, 'Medium': 50, 'High': 20, 'Urgent': 5}
+# Priority mix for service types that differ from PRIORITY_WEIGHTS
+SERVICE_TYPE_PRIORITY_WEIGHTS = {
+    'Gas Leak': {'Medium': 5, 'High': 35, 'Urgent': 60},
+    'New Connection': {'Low': 50, 'Medium': 45, 'High': 5},
+}
+# Share of pending requests that nobody has picked up yet
+UNASSIGNED_PENDING_RATE = 0.7
+# Share of requests with notes on their timeline, and the most notes one gets
+NOTE_RATE = 0.3
+MAX_NOTES = 3
+# Median hours until a request is resolved; log-normal, so some take weeks
+MEDIAN_RESOLUTION_HOURS = 20
+
+DEPARTMENTS = ['Field', 'Billing', 'Metering', 'Emergency', 'Connections']
+FIRST_NAMES = ['Asha', 'Ravi', 'Priya', 'Arjun', 'Meera', 'Vikram', 'Anita', 'Karan', 'Sunita', 'Rahul', 'Divya', 'Manoj']
+LAST_NAMES = ['Sharma', 'Patel', 'Iyer', 'Reddy', 'Nair', 'Gupta', 'Singh', 'Das', 'Mehta', 'Kulkarni', 'Rao', 'Joshi']
+STREETS = ['MG Road', 'Station Road', 'Park Street', 'Lake View', 'Temple Lane', 'Hill Road', 'Market Street']
+DESCRIPTIONS = {
+    'Billing Issue': [
+        'My bill for last month is much higher than usual.',
+        'I was charged twice for the same billing period.',
+        'The meter reading on my bill does not match the meter.',
+    ],
+    'Meter Problem': [
+        'The meter display is blank.',
+        'The meter is making a clicking noise.',
+        'The meter seal appears to be broken.',
+    ],
+    'New Connection': [
+        'Requesting a new gas connection for a newly built house.',
+        'We moved in and need the connection activated.',
+        'Please connect the kitchen in the extension to the supply.',
+    ],
+    'Gas Leak': [
+        'Strong smell of gas near the meter.',
+        'Hissing sound from the pipe outside the kitchen.',
+        'Gas smell in the basement since this morning.',
+    ],
+    'Other': [
+        'Requesting a safety inspection of the appliances.',
+        'The pipe along the outer wall needs repainting.',
+        'Need to move the meter during renovation.',
+    ],
+}
+NOTES = [
+    'Called the customer to confirm the details.',
+    'Engineer visit scheduled.',
+    'Engineer on site.',
+    'Waiting for parts.',
+    'Customer not at home, visit rescheduled.',
+    'Issue fixed and tested.',
+]
+
+
+def weighted(weights):
+    """Split a {choice: weight} dict into the two lists random.choices expects."""
+    return list(weights), list(weights.values())
+
+
+class SampleDataGenerator:
+    """
+    Create synthetic rows with ``bulk_create``, ``batch_size`` at a time.
+
+    All generated users share one password, hashed once, so generating many
+    accounts costs no more than generating one.
+    """
+
+    def __init__(self, seed=0, prefix='sample', password='sample-pass-123', days=365, batch_size=5000):
+        self.random = random.Random(seed)
+        self.prefix = prefix
+        self.password_hash = make_password(password)
+        self.days = days
+        self.batch_size = batch_size
+        self.now = timezone.now()
+
+    def make_users(self, kind, count, **fields):
+        """Return ``count`` unsaved users named ``<prefix>-<kind>-<n>``, numbered after existing ones."""
+        name_prefix = f'{self.prefix}-{kind}-'
+        start = User.objects.filter(username__startswith=name_prefix).count()
+        return [
+            User(
+                username=f'{name_prefix}{index}', email=f'{name_prefix}{index}@example.com',
+                first_name=self.random.choice(FIRST_NAMES), last_name=self.random.choice(LAST_NAMES),
+                password=self.password_hash, **fields
+            )
+            for index in range(start, start + count)
+        ]
+
+    @transaction.atomic
+    def create_representatives(self, count):
+        """Create ``count`` support representatives and return them."""
+        users = User.objects.bulk_create(
+            self.make_users('rep', count, role='support_staff', is_staff=True), batch_size=self.batch_size
+        )
+        return SupportRepresentative.objects.bulk_create([
+            SupportRepresentative(
+                user=user, department=self.random.choice(DEPARTMENTS), employee_id=f'EMP{user.pk:06d}'
+            )
+            for user in users
+        ], batch_size=self.batch_size)
+
+    def create_customers(self, count, on_batch=None):
+        """Create ``count`` customers and return their ids."""
+        customer_ids = []
+        for start in range(0, count, self.batch_size):
+            with transaction.atomic():
+                users = User.objects.bulk_create(self.make_users('customer', min(self.batch_size, count - start)))
+                customers = Customer.objects.bulk_create([
+                    Customer(
+                        user=user, phone_number=f'+9198{self.random.randrange(10 ** 8):08d}',
+                        address=f'{self.random.randrange(1, 400)} {self.random.choice(STREETS)}'
+                    )
+                    for user in users
+                ])
+            customer_ids.extend(customer.pk for customer in customers)
+            if on_batch:
+                on_batch(len(customer_ids))
+        return customer_ids
+
+    def create_requests(self, count, customer_ids, representatives, on_batch=None):
+        """
+        Create ``count`` service requests for the given customers, with their timeline notes.
+
+        A few customers file most requests (Pareto-distributed weights), and
+        busy representatives get more assignments than others.
+        """
+        customer_weights = [self.random.paretovariate(1.2) for _ in customer_ids]
+        rep_weights = [self.random.paretovariate(3) for _ in representatives]
+        created = 0
+        while created < count:
+            size = min(self.batch_size, count - created)
+            customers = self.random.choices(customer_ids, customer_weights, k=size)
+            service_requests = [self.make_request(customer_id, representatives, rep_weights) for customer_id in customers]
+            with transaction.atomic():
+                with explicit_timestamps(ServiceRequest, 'created_at', 'updated_at'):
+                    ServiceRequest.objects.bulk_create(service_requests)
+                ServiceRequestEvent.objects.bulk_create(
+                    [event for service_request in service_requests for event in self.make_notes(service_request)],
+                    batch_size=self.batch_size
+                )
+            created += size
+            if on_batch:
+                on_batch(created)
+        return created
+
+    def make_request(self, customer_id, representatives, rep_weights):
+        service_type = self.random.choices(*weighted(SERVICE_TYPE_WEIGHTS))[0]
+        priority_weights = SERVICE_TYPE_PRIORITY_WEIGHTS.get(service_type, PRIORITY_WEIGHTS)
+        status = self.random.choices(*weighted(STATUS_WEIGHTS))[0]
+        created_at = self.now - timedelta(seconds=self.random.uniform(0, self.days * 86400))
+        resolved_at = None
+
+        if status == 'Resolved':
+            hours = self.random.lognormvariate(0, 1.2) * MEDIAN_RESOLUTION_HOURS
+            resolved_at = min(created_at + timedelta(hours=hours), self.now)
+            updated_at = resolved_at
+        elif status == 'In Progress':
+            updated_at = created_at + (self.now - created_at) * self.random.random()
+        else:
+            updated_at = created_at
+
+        assigned_to = None
+        if representatives and not (status == 'Pending' and self.random.random() < UNASSIGNED_PENDING_RATE):
+            assigned_to = self.random.choices(representatives, rep_weights)[0]
+        return ServiceRequest(
+            customer_id=customer_id, service_type=service_type,
+            description=self.random.choice(DESCRIPTIONS[service_type]),
+            status=status, priority=self.random.choices(*weighted(priority_weights))[0],
+            created_at=created_at, updated_at=updated_at, resolved_at=resolved_at, assigned_to=assigned_to
+        )
+
+    def make_notes(self, service_request):
+        if service_request.assigned_to is None or self.random.random() >= NOTE_RATE:
+            return []
+        span = service_request.updated_at - service_request.created_at
+        times = sorted(service_request.created_at + span * self.random.random() for _ in range(self.random.randint(1, MAX_NOTES)))
+        return [
+            ServiceRequestEvent(
+                service_request=service_request, kind=ServiceRequestEvent.NOTE,
+                author_id=service_request.assigned_to.user_id, body=self.random.choice(NOTES), created_at=created_at
+            )
+            for created_at in times
+        ]
@@ -0,0 +1,452 @@
+"""
+Full-text search index for service requests.
+
+Each service request has one entry covering its description, notes (the
+legacy ``notes`` column plus its note events) and the customer's name,
+username and email. On SQLite the index is an FTS5 virtual
+table; on PostgreSQL it is a weighted tsvector table with a GIN index. In both
+cases database triggers keep the index in sync with every write path (model
+saves, bulk_create, queryset update/delete, cascades and user profile edits).
+
+Other database backends fall back to the original ``icontains`` search.
+"""
+import re
+
+from django.db import connections
+from django.db.models import FloatField, Q
+from django.db.models.expressions import RawSQL
+
+SEARCH_TABLE = 'requests_servicerequest_search'
+EVENT_TABLE = 'requests_servicerequestevent'
+
+# Used when the database has no full-text index
+FALLBACK_FIELDS = [
+    'customer__user__username',
+    'customer__user__email',
+    'customer__user__first_name',
+    'customer__user__last_name',
+    'description',
+]
+
+# Queries are reduced to at most this many word terms
+MAX_TERMS = 16
+
+# Text indexed as the notes of request ``{row}``
+SQLITE_NOTES = f"""
+    COALESCE({{row}}.notes, '') || COALESCE((
+        SELECT ' ' || group_concat(e.body, ' ') FROM {EVENT_TABLE} e
+        WHERE e.service_request_id = {{row}}.id AND e.kind = 'note'
+    ), '')
+""".strip()
+
+SQLITE_CREATE = [
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5(
+        description, notes, customer_name, username, email,
+        tokenize = 'porter unicode61'
+    )
+    """,
+]
+
+SQLITE_TRIGGERS = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_insert
+    AFTER INSERT ON requests_servicerequest BEGIN
+        INSERT INTO {SEARCH_TABLE} (rowid, description, notes, customer_name, username, email)
+        SELECT NEW.id, NEW.description, COALESCE(NEW.notes, ''),
+               TRIM(u.first_name || ' ' || u.last_name), u.username, u.email
+        FROM accounts_customer c JOIN accounts_user u ON u.id = c.user_id
+        WHERE c.id = NEW.customer_id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_update
+    AFTER UPDATE OF description, notes, customer_id ON requests_servicerequest
+    WHEN OLD.description IS NOT NEW.description
+      OR OLD.notes IS NOT NEW.notes
+      OR OLD.customer_id IS NOT NEW.customer_id
+    BEGIN
+        DELETE FROM {SEARCH_TABLE} WHERE rowid = OLD.id;
+        INSERT INTO {SEARCH_TABLE} (rowid, description, notes, customer_name, username, email)
+        SELECT NEW.id, NEW.description, {SQLITE_NOTES.format(row='NEW')},
+               TRIM(u.first_name || ' ' || u.last_name), u.username, u.email
+        FROM accounts_customer c JOIN accounts_user u ON u.id = c.user_id
+        WHERE c.id = NEW.customer_id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_delete
+    AFTER DELETE ON requests_servicerequest BEGIN
+        DELETE FROM {SEARCH_TABLE} WHERE rowid = OLD.id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_user_update
+    AFTER UPDATE OF first_name, last_name, username, email ON accounts_user
+    WHEN OLD.first_name IS NOT NEW.first_name
+      OR OLD.last_name IS NOT NEW.last_name
+      OR OLD.username IS NOT NEW.username
+      OR OLD.email IS NOT NEW.email
+    BEGIN
+        UPDATE {SEARCH_TABLE}
+        SET customer_name = TRIM(NEW.first_name || ' ' || NEW.last_name),
+            username = NEW.username,
+            email = NEW.email
+        WHERE rowid IN (
+            SELECT sr.id FROM requests_servicerequest sr
+            JOIN accounts_customer c ON c.id = sr.customer_id
+            WHERE c.user_id = NEW.id
+        );
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_customer_update
+    AFTER UPDATE OF user_id ON accounts_customer
+    WHEN OLD.user_id IS NOT NEW.user_id
+    BEGIN
+        UPDATE {SEARCH_TABLE}
+        SET customer_name = (SELECT TRIM(first_name || ' ' || last_name) FROM accounts_user WHERE id = NEW.user_id),
+            username = (SELECT username FROM accounts_user WHERE id = NEW.user_id),
+            email = (SELECT email FROM accounts_user WHERE id = NEW.user_id)
+        WHERE rowid IN (SELECT id FROM requests_servicerequest WHERE customer_id = NEW.id);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_event_insert
+    AFTER INSERT ON {EVENT_TABLE}
+    WHEN NEW.kind = 'note'
+    BEGIN
+        UPDATE {SEARCH_TABLE} SET notes = notes || ' ' || NEW.body
+        WHERE rowid = NEW.service_request_id;
+    END
+    """,
+]
+
+SQLITE_DROP_TRIGGERS = [
+    f"DROP TRIGGER IF EXISTS {SEARCH_TABLE}_insert",
+    f"DROP TRIGGER IF EXISTS {SEARCH_TABLE}_update",
+    f"DROP TRIGGER IF EXISTS {SEARCH_TABLE}_delete",
+    f"DROP TRIGGER IF EXISTS {SEARCH_TABLE}_user_update",
+    f"DROP TRIGGER IF EXISTS {SEARCH_TABLE}_customer_update",
+    f"DROP TRIGGER IF EXISTS {SEARCH_TABLE}_event_insert",
+]
+
+SQLITE_UNINSTALL = SQLITE_DROP_TRIGGERS + [
+    f"DROP TABLE IF EXISTS {SEARCH_TABLE}",
+]
+
+SQLITE_REBUILD = [
+    f"DELETE FROM {SEARCH_TABLE}",
+    f"""
+    INSERT INTO {SEARCH_TABLE} (rowid, description, notes, customer_name, username, email)
+    SELECT sr.id, sr.description, {SQLITE_NOTES.format(row='sr')},
+           TRIM(u.first_name || ' ' || u.last_name), u.username, u.email
+    FROM requests_servicerequest sr
+    JOIN accounts_customer c ON c.id = sr.customer_id
+    JOIN accounts_user u ON u.id = c.user_id
+    """,
+]
+
+# Customer identifiers weigh most, then the description, then staff notes
+POSTGRESQL_DOCUMENT = f"""
+    setweight(to_tsvector('english', concat_ws(' ', u.first_name, u.last_name, u.username, u.email)), 'A')
+    || setweight(to_tsvector('english', sr.description), 'B')
+    || setweight(to_tsvector('english', concat_ws(' ', sr.notes, (
+        SELECT string_agg(e.body, ' ') FROM {EVENT_TABLE} e
+        WHERE e.service_request_id = sr.id AND e.kind = 'note'
+    ))), 'C')
+"""
+
+POSTGRESQL_CREATE = [
+    f"""
+    CREATE TABLE IF NOT EXISTS {SEARCH_TABLE} (
+        rowid bigint PRIMARY KEY,
+        document tsvector NOT NULL
+    )
+    """,
+    f"CREATE INDEX IF NOT EXISTS {SEARCH_TABLE}_document ON {SEARCH_TABLE} USING GIN (document)",
+]
+
+POSTGRESQL_TRIGGERS = [
+    f"""
+    CREATE OR REPLACE FUNCTION {SEARCH_TABLE}_refresh(request_ids bigint[]) RETURNS void AS $$
+        INSERT INTO {SEARCH_TABLE} (rowid, document)
+        SELECT sr.id, {POSTGRESQL_DOCUMENT}
+        FROM requests_servicerequest sr
+        JOIN accounts_customer c ON c.id = sr.customer_id
+        JOIN accounts_user u ON u.id = c.user_id
+        WHERE sr.id = ANY(request_ids)
+        ON CONFLICT (rowid) DO UPDATE SET document = EXCLUDED.document;
+    $$ LANGUAGE sql
+    """,
+    f"""
+    CREATE OR REPLACE FUNCTION {SEARCH_TABLE}_request_trigger() RETURNS trigger AS $$
+    BEGIN
+        PERFORM {SEARCH_TABLE}_refresh(ARRAY[NEW.id]);
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    f"""
+    CREATE OR REPLACE FUNCTION {SEARCH_TABLE}_delete_trigger() RETURNS trigger AS $$
+    BEGIN
+        DELETE FROM {SEARCH_TABLE} WHERE rowid = OLD.id;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    f"""
+    CREATE OR REPLACE FUNCTION {SEARCH_TABLE}_customer_trigger() RETURNS trigger AS $$
+    BEGIN
+        PERFORM {SEARCH_TABLE}_refresh(ARRAY(
+            SELECT id FROM requests_servicerequest WHERE customer_id = NEW.id
+        ));
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    f"""
+    CREATE OR REPLACE FUNCTION {SEARCH_TABLE}_event_trigger() RETURNS trigger AS $$
+    BEGIN
+        PERFORM {SEARCH_TABLE}_refresh(ARRAY[NEW.service_request_id]);
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    f"""
+    CREATE OR REPLACE FUNCTION {SEARCH_TABLE}_user_trigger() RETURNS trigger AS $$
+    BEGIN
+        PERFORM {SEARCH_TABLE}_refresh(ARRAY(
+            SELECT sr.id FROM requests_servicerequest sr
+            JOIN accounts_customer c ON c.id = sr.customer_id
+            WHERE c.user_id = NEW.id
+        ));
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    f"DROP TRIGGER IF EXISTS {SEARCH_TABLE}_insert ON requests_servicerequest",
+    f"""
+    CREATE TRIGGER {SEARCH_TABLE}_insert
+    AFTER INSERT ON requests_servicerequest
+    FOR EACH ROW EXECUTE FUNCTION {SEARCH_TABLE}_request_trigger()
+    """,
+    f"DROP TRIGGER IF EXISTS {SEARCH_TABLE}_update ON requests_servicerequest",
+    f"""
+    CREATE TRIGGER {SEARCH_TABLE}_update
+    AFTER UPDATE OF description, notes, customer_id ON requests_servicerequest
+    FOR EACH ROW
+    WHEN (OLD.description IS DISTINCT FROM NEW.description
+          OR OLD.notes IS DISTINCT FROM NEW.notes
+          OR OLD.customer_id IS DISTINCT FROM NEW.customer_id)
+    EXECUTE FUNCTION {SEARCH_TABLE}_request_trigger()
+    """,
+    f"DROP TRIGGER IF EXISTS {SEARCH_TABLE}_delete ON requests_servicerequest",
+    f"""
+    CREATE TRIGGER {SEARCH_TABLE}_delete
+    AFTER DELETE ON requests_servicerequest
+    FOR EACH ROW EXECUTE FUNCTION {SEARCH_TABLE}_delete_trigger()
+    """,
+    f"DROP TRIGGER IF EXISTS {SEARCH_TABLE}_user_update ON accounts_user",
+    f"""
+    CREATE TRIGGER {SEARCH_TABLE}_user_update
+    AFTER UPDATE OF first_name, last_name, username, email ON accounts_user
+    FOR EACH ROW
+    WHEN (OLD.first_name IS DISTINCT FROM NEW.first_name
+          OR OLD.last_name IS DISTINCT FROM NEW.last_name
+          OR OLD.username IS DISTINCT FROM NEW.username
+          OR OLD.email IS DISTINCT FROM NEW.email)
+    EXECUTE FUNCTION {SEARCH_TABLE}_user_trigger()
+    """,
+    f"DROP TRIGGER IF EXISTS {SEARCH_TABLE}_customer_update ON accounts_customer",
+    f"""
+    CREATE TRIGGER {SEARCH_TABLE}_customer_update
+    AFTER UPDATE OF user_id ON accounts_customer
+    FOR EACH ROW
+    WHEN (OLD.user_id IS DISTINCT FROM NEW.user_id)
+    EXECUTE FUNCTION {SEARCH_TABLE}_customer_trigger()
+    """,
+    f"DROP TRIGGER IF EXISTS {SEARCH_TABLE}_event_insert ON {EVENT_TABLE}",
+    f"""
+    CREATE TRIGGER {SEARCH_TABLE}_event_insert
+    AFTER INSERT ON {EVENT_TABLE}
+    FOR EACH ROW
+    WHEN (NEW.kind = 'note')
+    EXECUTE FUNCTION {SEARCH_TABLE}_event_trigger()
+    """,
+]
+
+POSTGRESQL_UNINSTALL = [
+    f"DROP TRIGGER IF EXISTS {SEARCH_TABLE}_insert ON requests_servicerequest",
+    f"DROP TRIGGER IF EXISTS {SEARCH_TABLE}_update ON requests_servicerequest",
+    f"DROP TRIGGER IF EXISTS {SEARCH_TABLE}_delete ON requests_servicerequest",
+    f"DROP TRIGGER IF EXISTS {SEARCH_TABLE}_user_update ON accounts_user",
+    f"DROP TRIGGER IF EXISTS {SEARCH_TABLE}_customer_update ON accounts_customer",
+    f"DROP TRIGGER IF EXISTS {SEARCH_TABLE}_event_insert ON {EVENT_TABLE}",
+    f"DROP FUNCTION IF EXISTS {SEARCH_TABLE}_request_trigger()",
+    f"DROP FUNCTION IF EXISTS {SEARCH_TABLE}_delete_trigger()",
+    f"DROP FUNCTION IF EXISTS {SEARCH_TABLE}_customer_trigger()",
+    f"DROP FUNCTION IF EXISTS {SEARCH_TABLE}_event_trigger()",
+    f"DROP FUNCTION IF EXISTS {SEARCH_TABLE}_user_trigger()",
+    f"DROP FUNCTION IF EXISTS {SEARCH_TABLE}_refresh(bigint[])",
+    f"DROP TABLE IF EXISTS {SEARCH_TABLE}",
+]
+
+POSTGRESQL_REBUILD = [
+    f"TRUNCATE {SEARCH_TABLE}",
+    f"SELECT {SEARCH_TABLE}_refresh(ARRAY(SELECT id FROM requests_servicerequest))",
+]
+
+STATEMENTS = {
+    'sqlite': {
+        'create': SQLITE_CREATE, 'triggers': SQLITE_TRIGGERS, 'uninstall': SQLITE_UNINSTALL,
+        'rebuild': SQLITE_REBUILD, 'drop_triggers': SQLITE_DROP_TRIGGERS,
+    },
+    'postgresql': {
+        'create': POSTGRESQL_CREATE, 'triggers': POSTGRESQL_TRIGGERS, 'uninstall': POSTGRESQL_UNINSTALL,
+        'rebuild': POSTGRESQL_REBUILD,
+        # ALTER TABLE keeps PostgreSQL triggers in place
+        'drop_triggers': [],
+    },
+}
+
+# Tables the sync triggers are attached to or read from
+TRIGGER_APPS = ('accounts', 'requests')
+
+# Migrations set this attribute to True when they change indexed data while the
+# triggers are suspended, or change what is indexed; the index is then rebuilt
+# once the run ends
+REBUILD_ATTRIBUTE = 'rebuild_search_index'
+
+# Aliases of the connections whose migration run has suspended the triggers
+_suspended = set()
+
+
+def is_supported(connection):
+    """Return True if the connection's database has a full-text index implementation."""
+    return connection.vendor in STATEMENTS
+
+
+def is_installed(connection):
+    """Return True if the search index table exists on the connection."""
+    return is_supported(connection) and SEARCH_TABLE in connection.introspection.table_names()
+
+
+def _execute(connection, step):
+    with connection.cursor() as cursor:
+        for statement in STATEMENTS[connection.vendor][step]:
+            cursor.execute(statement)
+
+
+def _sources_exist(connection):
+    """Return True if every table the triggers read from exists (it may not while migrating)."""
+    return {'requests_servicerequest', EVENT_TABLE} <= set(connection.introspection.table_names())
+
+
+def install(connection):
+    """
+    Create the index table and sync triggers if they are missing. Safe to run repeatedly.
+
+    The triggers are left out while the source tables are missing, e.g. part
+    way through the initial migrations, and while a migration run has
+    suspended them; resume_triggers() adds them.
+    """
+    if not is_supported(connection):
+        return
+    _execute(connection, 'create')
+    if _sources_exist(connection) and connection.alias not in _suspended:
+        _execute(connection, 'triggers')
+
+
+def uninstall(connection):
+    """Drop the index table and its triggers."""
+    if is_supported(connection):
+        _execute(connection, 'uninstall')
+
+
+def suspend_triggers(connection):
+    """
+    Drop the sync triggers where schema changes would trip over them, leaving the
+    index table, and keep install() from adding them until resume_triggers().
+
+    SQLite rebuilds a table to alter it, and renaming the rebuilt table fails
+    while triggers on other tables still reference the old one.
+    """
+    if is_supported(connection):
+        _suspended.add(connection.alias)
+        _execute(connection, 'drop_triggers')
+
+
+def resume_triggers(connection):
+    """Put back the triggers suspended by suspend_triggers(), if the index exists."""
+    _suspended.discard(connection.alias)
+    if is_installed(connection):
+        install(connection)
+
+
+def plan_needs_rebuild(plan):
+    """Return True if a migration of ``plan`` declares that the index must be rebuilt."""
+    return any(getattr(migration, REBUILD_ATTRIBUTE, False) for migration, backwards in plan or [])
+
+
+def rebuild(connection):
+    """Repopulate the index from the service requests and events tables."""
+    if is_supported(connection) and _sources_exist(connection):
+        _execute(connection, 'rebuild')
+
+
+def parse_terms(text):
+    """Split user input into plain word terms, dropping any query syntax."""
+    return re.findall(r'\w+', text or '')[:MAX_TERMS]
+
+
+def filter_queryset(queryset, text):
+    """
+    Restrict ``queryset`` to requests matching every term of ``text`` (as prefixes).
+
+    Matching rows are annotated with ``search_rank`` (higher is more relevant) and
+    ordered by it, newest first among equal ranks. Callers may re-order afterwards.
+    """
+    terms = parse_terms(text)
+    if not terms:
+        # Nothing but punctuation cannot match anything; an empty query matches everything
+        return queryset.none() if (text or '').strip() else queryset
+
+    connection = connections[queryset.db]
+    if not is_supported(connection):
+        query = Q()
+        for term in terms:
+            term_query = Q()
+            for field in FALLBACK_FIELDS:
+                term_query |= Q(**{f'{field}__icontains': term})
+            query &= term_query
+        return queryset.filter(query).distinct()
+
+    table = queryset.model._meta.db_table
+    if connection.vendor == 'sqlite':
+        match = ' '.join(f'"{term}"*' for term in terms)
+        matching_ids = RawSQL(
+            f"SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s",
+            (match,)
+        )
+        # bm25() is lower-is-better; column weights follow the table's column order
+        rank = RawSQL(
+            f'SELECT -bm25({SEARCH_TABLE}, 2.0, 1.0, 4.0, 4.0, 4.0) FROM {SEARCH_TABLE} '
+            f'WHERE {SEARCH_TABLE} MATCH %s AND rowid = "{table}"."id"',
+            (match,),
+            output_field=FloatField()
+        )
+    else:
+        match = ' & '.join(f'{term}:*' for term in terms)
+        matching_ids = RawSQL(
+            f"SELECT rowid FROM {SEARCH_TABLE} WHERE document @@ to_tsquery('english', %s)",
+            (match,)
+        )
+        rank = RawSQL(
+            f"SELECT ts_rank(document, to_tsquery('english', %s)) FROM {SEARCH_TABLE} "
+            f'WHERE rowid = "{table}"."id"',
+            (match,),
+            output_field=FloatField()
+        )
+
+    return queryset.filter(id__in=matching_ids).annotate(search_rank=rank).order_by('-search_rank', '-created_at')
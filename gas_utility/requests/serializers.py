@@ -1,36 +1,245 @@
+from collections import defaultdict
+
+from django.db import transaction
 from rest_framework import serializers
-from .models import ServiceRequest
-from accounts.models import Customer, SupportRepresentative
+from gas_utility.profiling import TimedSerializerMixin
+from .attachments import validate_attachment
+from .models import ServiceRequest, ServiceRequestEvent, queue_status_notifications
+from accounts.models import SupportRepresentative
 from accounts.serializers import CustomerSerializer, SupportRepresentativeSerializer
 
 
-class ServiceRequestSerializer(serializers.ModelSerializer):
+class ServiceRequestSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Serializer for the ServiceRequest model."""
     
     customer_details = CustomerSerializer(source='customer', read_only=True)
     assigned_to_details = SupportRepresentativeSerializer(source='assigned_to', read_only=True)
     days_open = serializers.SerializerMethodField()
     
+    # Query parameters that narrow the representation (sparse fieldsets)
+    fields_query_param = 'fields'
+    expand_query_param = 'expand'
+    
+    # ``expand`` names and the nested field each one adds to a narrowed response
+    expandable_fields = {
+        'customer': 'customer_details',
+        'assigned_to': 'assigned_to_details',
+    }
+    
+    # Model fields read by serializer fields whose source is not a model field
+    source_columns = {
+        'days_open': ('created_at', 'resolved_at'),
+    }
+    
+    # Fields left out of list responses unless named in ``fields``: the legacy
+    # notes text can be long, and new notes go to the request's timeline
+    list_omitted_fields = ('notes',)
+    
     class Meta:
         model = ServiceRequest
         fields = [
-            'id', 'customer', 'customer_details', 'service_type', 'description',
+            'id', 'seq', 'customer', 'customer_details', 'service_type', 'description',
             'attached_file', 'status', 'priority', 'created_at', 'updated_at',
             'resolved_at', 'notes', 'assigned_to', 'assigned_to_details', 'days_open'
         ]
-        read_only_fields = ['id', 'created_at', 'updated_at', 'resolved_at']
+        read_only_fields = ['id', 'seq', 'created_at', 'updated_at', 'resolved_at']
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        listing = self.context.get('listing', False)
+        selected = self.requested_fields(request.query_params, listing) if request is not None else None
+        if selected is not None:
+            for name in set(self.fields) - selected:
+                self.fields.pop(name)
+    
+    @classmethod
+    def requested_fields(cls, query_params, listing=False):
+        """
+        Return the field names selected by the ``fields`` and ``expand`` query
+        parameters, or None when neither is given and the full representation applies.
+        
+        ``fields`` lists top-level fields; ``expand`` adds nested details. Without
+        ``fields``, ``expand`` narrows the response to the flat fields plus the
+        requested nested ones. Lists (``listing``) leave out ``list_omitted_fields``
+        unless ``fields`` names them.
+        """
+        def values(param):
+            return {
+                name.strip()
+                for value in query_params.getlist(param)
+                for name in value.split(',') if name.strip()
+            }
+        
+        fields, expand = values(cls.fields_query_param), values(cls.expand_query_param)
+        if not fields and not expand:
+            return set(cls.Meta.fields) - set(cls.list_omitted_fields) if listing else None
+        
+        unknown_fields = fields - set(cls.Meta.fields)
+        unknown_expand = expand - set(cls.expandable_fields)
+        errors = {}
+        if unknown_fields:
+            errors[cls.fields_query_param] = [f"Unknown field: '{name}'." for name in sorted(unknown_fields)]
+        if unknown_expand:
+            errors[cls.expand_query_param] = [f"Unknown expansion: '{name}'." for name in sorted(unknown_expand)]
+        if errors:
+            raise serializers.ValidationError(errors)
+        
+        if not fields:
+            omitted = set(cls.expandable_fields.values()) | set(cls.list_omitted_fields if listing else ())
+            fields = {name for name in cls.Meta.fields if name not in omitted}
+        return fields | {cls.expandable_fields[name] for name in expand}
+    
+    @classmethod
+    def query_fields(cls, selected):
+        """
+        Return (columns, relations) needed to render ``selected``: the model fields
+        to load with ``.only()`` and the expandable relations to join.
+        """
+        declared = cls._declared_fields
+        columns, relations = {'id'}, set()
+        for name in selected:
+            if name in cls.source_columns:
+                columns.update(cls.source_columns[name])
+            elif name in declared:
+                columns.add(declared[name].source)
+            else:
+                columns.add(name)
+        for relation, name in cls.expandable_fields.items():
+            if name in selected:
+                relations.add(relation)
+        return columns, relations
     
     def get_days_open(self, obj):
         """Get the number of days this request has been open."""
         return obj.get_days_open()
 
 
-class ServiceRequestCreateSerializer(serializers.ModelSerializer):
+class BatchPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    PrimaryKeyRelatedField that first looks the value up in ``preloaded``, a
+    dict of objects by pk filled in by ServiceRequestBatchSerializer, so a batch
+    does not query once per item.
+    """
+    preloaded = None
+    
+    def to_internal_value(self, data):
+        if self.preloaded is not None and not isinstance(data, bool):
+            try:
+                return self.preloaded[int(data)]
+            except (KeyError, TypeError, ValueError):
+                pass
+        return super().to_internal_value(data)
+
+
+class ServiceRequestBatchSerializer(serializers.ListSerializer):
+    """
+    List serializer that writes a batch of service requests with one
+    bulk_create, or with one UPDATE per distinct change.
+
+    For updates, ``instance`` is a dict of requests keyed by id and every item
+    names the request it changes with an ``id`` key.
+    """
+    update_batch_size = 500
+    
+    @staticmethod
+    def item_pk(data):
+        """Return the integer ``id`` of a batch item, or None if it has no valid id."""
+        pk = data.get('id') if isinstance(data, dict) else None
+        if isinstance(pk, bool) or not isinstance(pk, (int, str)) or not str(pk).isdigit():
+            return None
+        return int(pk)
+    
+    def to_internal_value(self, data):
+        # Instances matched by the items validated so far, by pk in request order
+        self.matched_instances = {}
+        if isinstance(data, list):
+            self.preload_related(data)
+        return super().to_internal_value(data)
+    
+    def preload_related(self, items):
+        """Fetch the objects referenced by every related field of the batch in one query per field."""
+        for field in self.child.fields.values():
+            if not isinstance(field, BatchPrimaryKeyRelatedField) or field.read_only:
+                continue
+            pks = set()
+            for item in items:
+                value = item.get(field.field_name) if isinstance(item, dict) else None
+                if isinstance(value, (int, str)) and not isinstance(value, bool) and str(value).isdigit():
+                    pks.add(int(value))
+            field.preloaded = field.get_queryset().in_bulk(pks) if pks else {}
+    
+    def run_child_validation(self, data):
+        if self.instance is None:
+            return super().run_child_validation(data)
+        
+        pk = self.item_pk(data)
+        if pk is None:
+            raise serializers.ValidationError({'id': ["A valid integer is required."]})
+        instance = self.instance.get(pk)
+        if instance is None:
+            raise serializers.ValidationError({'id': ["Not found."]})
+        if pk in self.matched_instances:
+            raise serializers.ValidationError({'id': ["Duplicate id in batch."]})
+        
+        self.child.instance = instance
+        self.child.initial_data = data
+        validated = super().run_child_validation(data)
+        self.matched_instances[pk] = instance
+        return validated
+    
+    def create(self, validated_data):
+        instances = []
+        for attrs in validated_data:
+            instance = self.child.Meta.model(**attrs)
+            # What ServiceRequest.save() would do; bulk_create bypasses it
+            instance.sync_resolved_at()
+            instance.sync_attachment_name()
+            instances.append(instance)
+        return self.child.Meta.model.objects.bulk_create(instances)
+    
+    def update(self, instance, validated_data):
+        instances = list(self.matched_instances.values())
+        model = self.child.Meta.model
+        request = self.context.get('request')
+        author = request.user if request is not None else None
+        
+        # Items making the same change share one UPDATE, which also records their
+        # status and assignment events; notes differ per item and are appended
+        # to the timelines with a single INSERT
+        changes = defaultdict(list)
+        notes = []
+        for obj, attrs in zip(instances, validated_data):
+            note = attrs.pop('notes', '')
+            if note:
+                notes.append(ServiceRequestEvent(
+                    service_request=obj, kind=ServiceRequestEvent.NOTE, author=author, body=note
+                ))
+            changes[tuple(sorted(attrs.items()))].append(obj.pk)
+            for attr, value in attrs.items():
+                setattr(obj, attr, value)
+        
+        for values, pks in changes.items():
+            for start in range(0, len(pks), self.update_batch_size):
+                model.objects.filter(pk__in=pks[start:start + self.update_batch_size]).apply_changes(
+                    author=author, **dict(values)
+                )
+        ServiceRequestEvent.objects.bulk_create(notes)
+        
+        for obj in instances:
+            obj.sync_resolved_at()
+        return instances
+
+
+class ServiceRequestCreateSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Serializer for creating a new ServiceRequest."""
     
+    serializer_related_field = BatchPrimaryKeyRelatedField
+    
     class Meta:
         model = ServiceRequest
-        fields = ['customer', 'service_type', 'description', 'attached_file', 'priority']
+        fields = ['id', 'customer', 'service_type', 'description', 'attached_file', 'priority']
+        list_serializer_class = ServiceRequestBatchSerializer
     
     def validate_customer(self, value):
         """Validate that the customer exists."""
@@ -38,23 +247,35 @@ class ServiceRequestCreateSerializer(serializers.ModelSerializer):
         if request and request.user.is_authenticated:
             # If user is a customer, they can only create requests for themselves
             if request.user.role == 'customer':
-                try:
-                    customer = Customer.objects.get(user=request.user)
-                    if value.id != customer.id:
-                        raise serializers.ValidationError(
-                            "You can only create service requests for yourself."
-                        )
-                except Customer.DoesNotExist:
+                # Batch creates resolve the customer once and pass it in
+                customer = self.context.get('customer') or request.profiles.customer
+                if customer is None:
                     raise serializers.ValidationError("Customer profile not found.")
+                if value.id != customer.id:
+                    raise serializers.ValidationError(
+                        "You can only create service requests for yourself."
+                    )
+        return value
+    
+    def validate_attached_file(self, value):
+        """Validate file size and type (oversized uploads are already cut off while streaming)."""
+        if value:
+            validate_attachment(value)
         return value
 
 
-class ServiceRequestUpdateSerializer(serializers.ModelSerializer):
+class ServiceRequestUpdateSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Serializer for updating a ServiceRequest."""
     
+    serializer_related_field = BatchPrimaryKeyRelatedField
+    
+    # Not the legacy notes column: a note is appended to the request's timeline
+    notes = serializers.CharField(write_only=True, required=False, allow_blank=True)
+    
     class Meta:
         model = ServiceRequest
-        fields = ['status', 'priority', 'notes', 'assigned_to']
+        fields = ['id', 'status', 'priority', 'notes', 'assigned_to']
+        list_serializer_class = ServiceRequestBatchSerializer
     
     def validate(self, data):
         """Validate the update based on user role."""
@@ -69,9 +290,21 @@ class ServiceRequestUpdateSerializer(serializers.ModelSerializer):
                             f"Only support staff can update the {field} field."
                         )
         return data
+    
+    def update(self, instance, validated_data):
+        """Save the changes and add them, with any note, to the request's timeline."""
+        note = validated_data.pop('notes', '')
+        request = self.context.get('request')
+        author = request.user if request is not None else None
+        old_status, old_assigned_to = instance.status, instance.assigned_to
+        with transaction.atomic():
+            instance = super().update(instance, validated_data)
+            ServiceRequestEvent.objects.record_update(instance, author, old_status, old_assigned_to, note=note)
+            queue_status_notifications([(instance.pk, old_status, instance.status)])
+        return instance
 
 
-class ServiceRequestStatisticsSerializer(serializers.Serializer):
+class ServiceRequestStatisticsSerializer(TimedSerializerMixin, serializers.Serializer):
     """Serializer for service request statistics."""
     
     total = serializers.IntegerField()
@@ -79,5 +312,7 @@ class ServiceRequestStatisticsSerializer(serializers.Serializer):
     in_progress = serializers.IntegerField()
     resolved = serializers.IntegerField()
     avg_resolution_days = serializers.FloatField(allow_null=True)
+    p50_resolution_days = serializers.FloatField(allow_null=True)
+    p90_resolution_days = serializers.FloatField(allow_null=True)
     by_service_type = serializers.ListField(child=serializers.DictField())
     by_priority = serializers.ListField(child=serializers.DictField())
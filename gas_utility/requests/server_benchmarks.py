@@ -0,0 +1,254 @@
+"""
+Concurrency benchmarks of the WSGI and ASGI deployments.
+
+``manage.py benchmark_servers`` starts the application on a local port under
+gunicorn (WSGI, ``gas_utility.wsgi``) and then under uvicorn (ASGI,
+``gas_utility.asgi``, which routes the read-heavy pages to the async views).
+Each endpoint is loaded by 1, 10, ... concurrent keep-alive clients for a
+fixed time. For every concurrency level the benchmark reports throughput,
+latency percentiles and failed requests.
+
+The servers inherit the command's environment, so they use the same settings
+and database. The load comes from threads in the command's process. On a
+small machine the clients compete with the server for CPU. Compare the two
+servers with each other, not with production numbers.
+"""
+import http.client
+import importlib.util
+import os
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+import django
+from django.conf import settings
+from django.db import connection
+from django.test import Client
+from django.utils import timezone
+
+from .benchmarks import BenchmarkError, git_commit, percentile_summary
+
+HOST = '127.0.0.1'
+# Seconds to wait for a server to accept requests
+STARTUP_TIMEOUT = 30
+
+
+class Server:
+    """A way to serve the application: the Python module that runs it and its command line."""
+
+    def __init__(self, name, module, arguments):
+        self.name = name
+        self.module = module
+        # Called with the port, worker processes and threads per worker
+        self.arguments = arguments
+
+    def command(self, port, workers, threads):
+        return [sys.executable, '-m', self.module, *self.arguments(port, workers, threads)]
+
+
+SERVERS = [
+    Server('wsgi', 'gunicorn', lambda port, workers, threads: [
+        'gas_utility.wsgi:application', '--bind', f'{HOST}:{port}', '--workers', str(workers),
+        '--worker-class', 'gthread', '--threads', str(threads), '--log-level', 'warning',
+    ]),
+    # One event loop per worker serves every connection, so there is no thread count
+    Server('asgi', 'uvicorn', lambda port, workers, threads: [
+        'gas_utility.asgi:application', '--host', HOST, '--port', str(port), '--workers', str(workers),
+        '--no-access-log', '--log-level', 'warning',
+    ]),
+]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind((HOST, 0))
+        return sock.getsockname()[1]
+
+
+class RunningServer:
+    """Context manager that starts ``server`` on a free port and stops it on exit."""
+
+    def __init__(self, server, workers, threads, environ=None):
+        if importlib.util.find_spec(server.module) is None:
+            raise BenchmarkError(f'{server.name}: {server.module} is not installed (pip install {server.module}).')
+        self.server = server
+        self.port = free_port()
+        self.command = server.command(self.port, workers, threads)
+        self.workers = workers
+        self.threads = threads
+        self.environ = {**os.environ, **(environ or {})}
+
+    def __enter__(self):
+        self.process = subprocess.Popen(
+            self.command, cwd=settings.BASE_DIR, env=self.environ,
+            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True
+        )
+        deadline = time.monotonic() + STARTUP_TIMEOUT
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise BenchmarkError(f'{self.server.name} exited on startup:\n{self.process.stderr.read()}')
+            try:
+                with socket.create_connection((HOST, self.port), timeout=1):
+                    return self
+            except OSError:
+                time.sleep(0.2)
+        self.stop()
+        raise BenchmarkError(f'{self.server.name} did not accept connections within {STARTUP_TIMEOUT} seconds.')
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def stop(self):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+
+
+def session_cookies(users):
+    """Sign each user in and return their ``Cookie`` header values, by role."""
+    cookies = {}
+    for role, user in users.items():
+        client = Client()
+        client.force_login(user)
+        session = client.cookies[settings.SESSION_COOKIE_NAME]
+        cookies[role] = f'{settings.SESSION_COOKIE_NAME}={session.value}'
+    return cookies
+
+
+class LoadClient(threading.Thread):
+    """Request ``paths`` in turn over one keep-alive connection until ``deadline``."""
+
+    def __init__(self, port, paths, cookie, deadline):
+        super().__init__(daemon=True)
+        self.port = port
+        self.paths = paths
+        self.cookie = cookie
+        self.deadline = deadline
+        self.latencies = []
+        self.failures = []
+
+    def run(self):
+        connection = http.client.HTTPConnection(HOST, self.port, timeout=60)
+        index = 0
+        while time.perf_counter() < self.deadline:
+            path = self.paths[index % len(self.paths)]
+            index += 1
+            started = time.perf_counter()
+            try:
+                connection.request('GET', path, headers={'Cookie': self.cookie})
+                response = connection.getresponse()
+                response.read()
+            except (OSError, http.client.HTTPException) as error:
+                self.failures.append(f'GET {path}: {error!r}')
+                connection.close()
+                continue
+            if response.status == 200:
+                self.latencies.append((time.perf_counter() - started) * 1000)
+            else:
+                self.failures.append(f'GET {path} returned {response.status}')
+        connection.close()
+
+
+class ServerBenchmark:
+    """
+    Load each endpoint on each server at each concurrency level for ``duration`` seconds.
+
+    ``warmup`` seconds of unmeasured load at the lowest concurrency come first,
+    so the server has imported everything and filled its caches. ``environ``
+    adds environment variables to the servers'.
+    """
+
+    def __init__(
+        self, users, request_ids, concurrency=(1, 10, 50), duration=10.0, warmup=2.0, workers=1, threads=8, environ=None
+    ):
+        self.cookies = session_cookies(users)
+        self.request_ids = request_ids
+        self.concurrency = sorted(concurrency)
+        self.duration = duration
+        self.warmup = warmup
+        self.workers = workers
+        self.threads = threads
+        self.environ = environ
+
+    def load(self, port, endpoint, clients, duration):
+        paths = [endpoint.url(request_id) for request_id in self.request_ids]
+        deadline = time.perf_counter() + duration
+        threads = [
+            # Clients start at different requests so they do not ask for the same row at once
+            LoadClient(port, paths[index:] + paths[:index], self.cookies[endpoint.role], deadline)
+            for index in range(clients)
+        ]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        latencies = [latency for thread in threads for latency in thread.latencies]
+        failures = [failure for thread in threads for failure in thread.failures]
+        if len(latencies) < 2:
+            raise BenchmarkError(
+                f'{endpoint.name}: fewer than two successful requests at concurrency {clients}'
+                + (f'; first failure: {failures[0]}' if failures else '')
+            )
+        p50, p95, p99 = percentile_summary(latencies)
+        return {
+            'requests': len(latencies),
+            'failures': len(failures),
+            'throughput_rps': round(len(latencies) / elapsed, 1),
+            'p50_ms': round(p50, 2),
+            'p95_ms': round(p95, 2),
+            'p99_ms': round(p99, 2),
+            'mean_ms': round(statistics.fmean(latencies), 2),
+        }
+
+    def run(self, servers, endpoints, on_result=None):
+        """Benchmark ``endpoints`` on ``servers`` and return the results as a JSON-serialisable dict."""
+        results = {}
+        for server in servers:
+            with RunningServer(server, self.workers, self.threads, self.environ) as running:
+                measured = {}
+                for endpoint in endpoints:
+                    if self.warmup:
+                        self.load(running.port, endpoint, self.concurrency[0], self.warmup)
+                    measured[endpoint.name] = {}
+                    for clients in self.concurrency:
+                        stats = self.load(running.port, endpoint, clients, self.duration)
+                        measured[endpoint.name][str(clients)] = stats
+                        if on_result:
+                            on_result(server.name, endpoint.name, clients, stats)
+                results[server.name] = {'command': running.command[1:], 'endpoints': measured}
+        return {
+            'commit': git_commit(),
+            'recorded_at': timezone.now().isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'cpus': os.cpu_count(),
+            'duration': self.duration,
+            'workers': self.workers,
+            'threads': self.threads,
+            'servers': results,
+        }
+
+
+def compare_servers(results, baseline='wsgi', other='asgi'):
+    """Yield (endpoint, concurrency, baseline req/s, other req/s, relative change) where both servers ran."""
+    servers = results['servers']
+    if baseline not in servers or other not in servers:
+        return
+    for name, levels in servers[baseline]['endpoints'].items():
+        for clients, before in levels.items():
+            after = servers[other]['endpoints'].get(name, {}).get(clients)
+            if after is None:
+                continue
+            change = (after['throughput_rps'] - before['throughput_rps']) / before['throughput_rps']
+            yield name, int(clients), before['throughput_rps'], after['throughput_rps'], change
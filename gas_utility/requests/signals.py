@@ -0,0 +1,81 @@
+from collections import Counter
+
+from django.db import connections
+from django.db.models.signals import post_delete, post_migrate, pre_delete, pre_migrate
+from django.dispatch import receiver
+from django.utils import timezone
+
+from accounts.models import Customer, SupportRepresentative
+from . import search
+from .models import ServiceRequest, ServiceRequestChange, ServiceRequestCounter, _counter_key
+
+
+@receiver(pre_delete, sender=Customer)
+def release_customer_request_counters(sender, instance, using, **kwargs):
+    """
+    Decrement counters for requests removed by a customer cascade delete.
+
+    The cascade deletes ServiceRequest rows directly and bypasses the model and
+    queryset hooks, so the counters are adjusted and the deletions recorded here
+    inside the same transaction.
+    """
+    requests = ServiceRequest.objects.using(using).filter(customer=instance)
+    deltas = Counter()
+    for row in requests.status_breakdown():
+        deltas[_counter_key(row)] -= row['count']
+    ServiceRequestCounter.objects.db_manager(using).adjust(deltas)
+    ServiceRequestChange.objects.db_manager(using).record(
+        [ServiceRequestChange.DELETED], requests.values_list('pk', flat=True)
+    )
+
+
+@receiver(pre_delete, sender=SupportRepresentative)
+def record_unassigned_requests(sender, instance, using, **kwargs):
+    """
+    Record the assignment changes of requests unassigned because their representative is deleted.
+
+    The cascade sets assigned_to to NULL with a plain UPDATE, so updated_at, and
+    the ETags and Last-Modified dates built on it, are moved on here.
+    """
+    assigned = ServiceRequest.objects.using(using).filter(assigned_to=instance)
+    ServiceRequestChange.objects.db_manager(using).record(
+        [ServiceRequestChange.ASSIGNMENT], assigned.values_list('pk', flat=True)
+    )
+    assigned.update(updated_at=timezone.now())
+
+
+@receiver(post_delete, sender=ServiceRequest)
+def release_attachment(sender, instance, **kwargs):
+    """Drop the deleted request's reference to its attachment; shared files stay until unused."""
+    if instance.attached_file:
+        instance.attached_file.delete(save=False)
+
+
+def _plan_touches_search_tables(plan):
+    return any(migration.app_label in search.TRIGGER_APPS for migration, backwards in plan or [])
+
+
+@receiver(pre_migrate)
+def suspend_search_triggers(sender, using, plan=None, **kwargs):
+    """Drop the search index triggers before migrations alter the tables they reference."""
+    if sender.label != 'requests' or not _plan_touches_search_tables(plan):
+        return
+    search.suspend_triggers(connections[using])
+
+
+@receiver(post_migrate)
+def ensure_search_triggers(sender, using, plan=None, **kwargs):
+    """
+    Recreate any missing search index triggers after migrations.
+
+    SQLite rebuilds a table to apply most schema changes, which silently drops
+    the triggers attached to it. The index itself is only rebuilt when a
+    migration of the run declares it needs one (see search.REBUILD_ATTRIBUTE),
+    so routine deploys don't reindex every request.
+    """
+    if sender.label != 'requests':
+        return
+    connection = connections[using]
+    search.resume_triggers(connection)
+    if search.is_installed(connection) and search.plan_needs_rebuild(plan):
+        search.rebuild(connection)
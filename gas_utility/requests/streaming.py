@@ -0,0 +1,41 @@
+"""
+Streamed response bodies under ASGI.
+
+Django serves a StreamingHttpResponse built on a synchronous iterator to an
+ASGI server by reading the whole iterator into a list first, so a large
+export or attachment would sit in memory before its first byte is sent.
+``streaming_content`` gives ASGI requests an asynchronous iterator instead,
+which pulls the synchronous one a few items at a time in the request's sync
+thread (where its database connection lives).
+"""
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+
+# Items taken from the synchronous iterator per switch to the sync thread
+ASYNC_BATCH_SIZE = 4
+
+
+def is_asgi(request):
+    """Return True if ``request`` (a Django or REST framework request) came in through ASGI."""
+    return isinstance(getattr(request, '_request', request), ASGIRequest)
+
+
+async def iterate_in_batches(iterator, batch_size=ASYNC_BATCH_SIZE):
+    """Yield the items of a synchronous ``iterator``, ``batch_size`` at a time, and close it when done."""
+    next_batch = sync_to_async(lambda: list(islice(iterator, batch_size)))
+    try:
+        while batch := await next_batch():
+            for item in batch:
+                yield item
+    finally:
+        close = getattr(iterator, 'close', None)
+        if close is not None:
+            # A generator holding a database cursor must close in the thread that opened it
+            await sync_to_async(close)()
+
+
+def streaming_content(request, iterator):
+    """Return ``iterator`` in the form a StreamingHttpResponse for ``request`` can stream without buffering."""
+    return iterate_in_batches(iter(iterator)) if is_asgi(request) else iterator
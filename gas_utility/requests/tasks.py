@@ -0,0 +1,31 @@
+"""Background tasks run by ``manage.py run_jobs``; see requests.jobs."""
+from django.core.mail import send_mail
+
+from .attachments import attachment_storage
+from .jobs import task
+from .models import ServiceRequest
+
+
+@task('requests.notify_status_change', backoff=30)
+def notify_status_change(request_id, old_status, new_status):
+    """Email the customer that their service request changed status."""
+    service_request = ServiceRequest.objects.select_related('customer__user').filter(id=request_id).first()
+    if service_request is None or not service_request.customer.user.email:
+        return
+    user = service_request.customer.user
+    send_mail(
+        subject=f"Service request #{service_request.seq} is now {new_status}",
+        message=(
+            f"Hello {user.get_full_name() or user.username},\n\n"
+            f"Your {service_request.service_type} request #{service_request.seq} changed "
+            f"from {old_status} to {new_status}.\n"
+        ),
+        from_email=None,
+        recipient_list=[user.email],
+    )
+
+
+@task('requests.delete_attachment_file', max_attempts=3)
+def delete_attachment_file(name):
+    """Remove an attachment file whose last reference was dropped."""
+    attachment_storage.delete_unreferenced(name)
@@ -1,3 +1,1724 @@
-from django.test import TestCase
+import asyncio
+import base64
+import csv
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+import warnings
+from datetime import datetime, timezone
+from importlib import import_module
+from unittest import mock
+
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.apps import apps
+from django.core import mail
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.db.migrations.loader import MigrationLoader
+from django.db.models import F
+from django.test import Client, TransactionTestCase, override_settings
+from django.urls import reverse, reverse_lazy
+from django.utils import timezone as django_timezone
+
+from accounts.models import SupportRepresentative, User
+from gas_utility import asgi_urls, metrics
+from gas_utility.testing import ServiceDataTestCase, query_budget
+from . import jobs, search, signals
+from .attachments import MAX_ATTACHMENT_SIZE, AttachmentUploadHandler, attachment_storage
+from .exports import EXPORT_COLUMNS
+from .live import LATE_COMMIT_WINDOW, ChangeFeed, event_stream, read_changes
+from .models import (
+    AttachmentBlob, ImportCheckpoint, Job, ServiceRequest, ServiceRequestChange, ServiceRequestCounter,
+    ServiceRequestEvent,
+)
+from .serializers import ServiceRequestCreateSerializer, ServiceRequestSerializer
+from .views import ServiceRequestViewSet
+
+# Upper bound on total SQL time per request, in seconds
+SQL_TIME_BUDGET = 0.5
+
+# Calls made by the test tasks below
+task_calls = []
+
+
+@jobs.task('tests.record')
+def record_task(value):
+    task_calls.append(value)
+
+
+@jobs.task('tests.flaky', max_attempts=2, backoff=60)
+def flaky_task():
+    raise ValueError('Meter service unavailable')
+
+
+@jobs.task('tests.limited', concurrency=1)
+def limited_task():
+    pass
+
+
+class CustomerPageQueryBudgetTests(ServiceDataTestCase):
+    """Query budgets for the customer-facing pages."""
+
+    def setUp(self):
+        self.client.force_login(self.customer_user)
+
+    def test_home(self):
+        with query_budget(0, SQL_TIME_BUDGET):
+            response = self.client.get(reverse('home'))
+        self.assertRedirects(response, reverse('login'), fetch_redirect_response=False)
+
+    def test_dashboard(self):
+        with query_budget(3, SQL_TIME_BUDGET):
+            response = self.client.get(reverse('dashboard'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['requests']), 10)
+
+    def test_dashboard_filtered_last_page(self):
+        with query_budget(3, SQL_TIME_BUDGET):
+            response = self.client.get(reverse('dashboard'), {'status': 'Pending', 'page': 2})
+        self.assertEqual(response.status_code, 200)
+
+    def test_submit_request_form(self):
+        with query_budget(1, SQL_TIME_BUDGET):
+            response = self.client.get(reverse('submit_request'))
+        self.assertEqual(response.status_code, 200)
+
+    def test_submit_request(self):
+        with query_budget(8, SQL_TIME_BUDGET):
+            response = self.client.post(reverse('submit_request'), {
+                'service_type': 'Gas Leak',
+                'priority': 'Urgent',
+                'description': 'Smell of gas in the basement',
+            })
+        self.assertRedirects(response, reverse('dashboard'), fetch_redirect_response=False)
+
+    def test_request_detail(self):
+        with query_budget(3, SQL_TIME_BUDGET):
+            response = self.client.get(reverse('request_detail', args=[self.customer_request.id]))
+        self.assertEqual(response.status_code, 200)
+
+    def test_request_detail_of_other_customer(self):
+        with query_budget(2, SQL_TIME_BUDGET):
+            response = self.client.get(reverse('request_detail', args=[self.other_request.id]))
+        self.assertRedirects(response, reverse('dashboard'), fetch_redirect_response=False)
+
+    def test_support_dashboard_denied(self):
+        with query_budget(1, SQL_TIME_BUDGET):
+            response = self.client.get(reverse('support_dashboard'))
+        self.assertRedirects(response, reverse('dashboard'), fetch_redirect_response=False)
+
+
+class ServiceRequestStatisticsTests(ServiceDataTestCase):
+    """Resolution time statistics computed in the database."""
+
+    def resolve_in(self, requests, days):
+        """Mark ``requests`` Resolved, each taking the matching number of ``days``."""
+        resolved_at = django_timezone.now()
+        for service_request, duration in zip(requests, days):
+            ServiceRequest.objects.filter(pk=service_request.pk).update(
+                status='Resolved', created_at=resolved_at - timedelta(days=duration), resolved_at=resolved_at
+            )
+
+    def test_percentiles_use_nearest_rank(self):
+        requests = ServiceRequest.objects.filter(customer=self.customer).order_by('id')[:10]
+        self.resolve_in(requests, range(10, 0, -1))
+        stats = ServiceRequest.objects.filter(pk__in=[request.pk for request in requests]).resolution_stats()
+        self.assertEqual(stats['avg'], timedelta(days=5.5))
+        self.assertEqual(stats['p50'], timedelta(days=5))
+        self.assertEqual(stats['p90'], timedelta(days=9))
+
+    def test_percentiles_with_ties(self):
+        requests = ServiceRequest.objects.filter(customer=self.customer).order_by('id')[:4]
+        self.resolve_in(requests, [1, 1, 1, 4])
+        stats = ServiceRequest.objects.filter(pk__in=[request.pk for request in requests]).resolution_stats()
+        self.assertEqual(stats['p50'], timedelta(days=1))
+        self.assertEqual(stats['p90'], timedelta(days=4))
+
+    def test_statistics_endpoint_reports_days(self):
+        ServiceRequest.objects.filter(status='Resolved').set_status('Pending')
+        requests = ServiceRequest.objects.order_by('id')[:20]
+        self.resolve_in(requests, range(1, 21))
+        self.client.force_login(self.staff_user)
+        data = self.client.get('/api/service-requests/statistics/').json()
+        self.assertEqual(data['resolved'], 20)
+        self.assertAlmostEqual(data['avg_resolution_days'], 10.5)
+        self.assertAlmostEqual(data['p50_resolution_days'], 10)
+        self.assertAlmostEqual(data['p90_resolution_days'], 18)
+
+    def test_no_resolved_requests(self):
+        stats = ServiceRequest.objects.filter(status='Pending').resolution_stats()
+        self.assertEqual(stats, {'avg': None, 'p50': None, 'p90': None})
+
+
+class ServiceRequestCounterTests(ServiceDataTestCase):
+    """ServiceRequestCounter stays equal to a recount after every write path."""
+
+    def assertCountersCorrect(self):
+        self.assertEqual(ServiceRequestCounter.objects.verify(), {})
+
+    def test_seeded_counters_match(self):
+        self.assertCountersCorrect()
+        self.assertEqual(
+            sum(ServiceRequestCounter.objects.status_totals().values()), ServiceRequest.objects.count()
+        )
+
+    def test_save(self):
+        ServiceRequest.objects.create(customer=self.customer, service_type='Gas Leak', description='New', priority='Urgent')
+        self.assertCountersCorrect()
+        self.customer_request.status = 'Resolved'
+        self.customer_request.priority = 'Low'
+        self.customer_request.save()
+        self.assertCountersCorrect()
+        self.customer_request.description = 'Unrelated edit'
+        self.customer_request.save(update_fields=['description'])
+        self.assertCountersCorrect()
+
+    def test_queryset_update(self):
+        ServiceRequest.objects.filter(customer=self.customer).update(status='In Progress')
+        self.assertCountersCorrect()
+        ServiceRequest.objects.filter(priority='Low').set_status('Resolved')
+        self.assertCountersCorrect()
+        ServiceRequest.objects.filter(status='Pending').update(priority=F('priority'))
+        self.assertCountersCorrect()
+
+    def test_bulk_update(self):
+        requests = list(ServiceRequest.objects.filter(customer=self.customer))
+        for index, service_request in enumerate(requests):
+            service_request.status = ServiceRequest.STATUS_CHOICES[index % 3][0]
+            service_request.service_type = 'Meter Problem'
+        ServiceRequest.objects.bulk_update(requests, ['status', 'service_type'])
+        self.assertCountersCorrect()
+
+    def test_delete(self):
+        self.customer_request.delete()
+        self.assertCountersCorrect()
+        ServiceRequest.objects.filter(status='Pending').delete()
+        self.assertCountersCorrect()
+
+    def test_bulk_create(self):
+        ServiceRequest.objects.bulk_create([
+            ServiceRequest(customer=customer, service_type='Billing Issue', description='Bulk', status='Resolved')
+            for customer in self.customers[:3]
+        ])
+        self.assertCountersCorrect()
+
+    def test_cascade_delete(self):
+        self.customers[1].delete()
+        self.assertCountersCorrect()
+        self.customers[2].user.delete()
+        self.assertCountersCorrect()
+        self.assertEqual(
+            sum(ServiceRequestCounter.objects.status_totals().values()), ServiceRequest.objects.count()
+        )
+
+    def test_rebuild_repairs_drift(self):
+        ServiceRequestCounter.objects.filter(status='Pending').update(count=0)
+        self.assertNotEqual(ServiceRequestCounter.objects.verify(), {})
+        ServiceRequestCounter.objects.rebuild()
+        self.assertCountersCorrect()
+
+
+class KeysetCursorPaginationTests(ServiceDataTestCase):
+    """Keyset pages of the service-requests API."""
+
+    list_url = '/api/service-requests/'
+
+    def setUp(self):
+        self.client.force_login(self.staff_user)
+        # Share created_at between many rows so only the id tiebreak orders them
+        tied_at = django_timezone.now() - timedelta(days=1)
+        ServiceRequest.objects.filter(customer__in=self.customers[1:6]).update(created_at=tied_at)
+
+    def walk(self, url, params=None, direction='next'):
+        """Follow ``direction`` links from ``url``; return the ids of every page, in order."""
+        pages = []
+        response = self.client.get(url, params)
+        while True:
+            self.assertEqual(response.status_code, 200)
+            pages.append([item['id'] for item in response.json()['results']])
+            link = response.json()[direction]
+            if link is None:
+                return pages, response
+            response = self.client.get(link)
+
+    def test_pages_follow_ordering_with_tiebreak(self):
+        pages, last = self.walk(self.list_url, {'pagination': 'cursor', 'page_size': 7})
+        expected = list(ServiceRequest.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+        self.assertEqual([pk for page in pages for pk in page], expected)
+        self.assertTrue(all(len(page) == 7 for page in pages[:-1]))
+
+    def test_pages_follow_client_ordering(self):
+        params = {'pagination': 'cursor', 'page_size': 5, 'ordering': 'priority,-status'}
+        pages, last = self.walk(self.list_url, params)
+        expected = ServiceRequest.objects.order_by('priority', '-status', '-created_at', '-id')
+        self.assertEqual([pk for page in pages for pk in page], list(expected.values_list('id', flat=True)))
+
+    def test_previous_links_return_the_same_pages(self):
+        pages, last = self.walk(self.list_url, {'pagination': 'cursor', 'page_size': 6})
+        backwards, first = self.walk(last.json()['previous'], direction='previous')
+        self.assertEqual(backwards, pages[-2::-1])
+
+    def test_pages_are_stable_while_rows_are_added_and_removed(self):
+        first = self.client.get(self.list_url, {'pagination': 'cursor', 'page_size': 10}).json()
+        ServiceRequest.objects.create(customer=self.customer, service_type='Other', description='Newer than the cursor')
+        ServiceRequest.objects.filter(pk=first['results'][0]['id']).delete()
+        pages, last = self.walk(first['next'])
+        expected = list(ServiceRequest.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+        seen = [pk for page in pages for pk in page]
+        self.assertEqual(seen, expected[10:])
+        self.assertFalse({item['id'] for item in first['results']} & set(seen))
+
+    def test_invalid_cursor_is_not_found(self):
+        response = self.client.get(self.list_url, {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 404)
+
+
+class ServiceRequestSearchTests(ServiceDataTestCase):
+    """Full-text search: what matches, ranking, and the index following writes."""
+
+    def setUp(self):
+        self.in_description = ServiceRequest.objects.create(
+            customer=self.customers[1], service_type='Meter Problem', description='Cracked regulator on the meter'
+        )
+        self.in_notes = ServiceRequest.objects.create(
+            customer=self.customers[2], service_type='Other', description='Odd noise outside'
+        )
+        ServiceRequestEvent.objects.create(service_request=self.in_notes, kind='note', body='Replaced the regulator')
+
+    def search_ids(self, text):
+        return list(ServiceRequest.objects.search(text).values_list('id', flat=True))
+
+    def test_matches_every_term_as_prefix(self):
+        self.assertEqual(self.search_ids('regul'), [self.in_description.id, self.in_notes.id])
+        self.assertEqual(self.search_ids('regulator cracked'), [self.in_description.id])
+        self.assertEqual(self.search_ids('regulator missing'), [])
+
+    def test_matches_customer_name_username_and_email(self):
+        own = set(ServiceRequest.objects.filter(customer=self.customer).values_list('id', flat=True))
+        self.assertEqual(set(self.search_ids('customer0')), own)
+        self.assertEqual(set(self.search_ids('customer0@example.com')), own)
+        self.assertEqual(set(self.search_ids('Customer 0')), own)
+
+    def test_description_ranks_above_notes(self):
+        ranked = ServiceRequest.objects.search('regulator')
+        self.assertGreater(ranked[0].search_rank, ranked[1].search_rank)
+        self.assertEqual(ranked[0], self.in_description)
+
+    def test_query_syntax_is_ignored(self):
+        self.assertEqual(self.search_ids('"regulator": (cracked*'), [self.in_description.id])
+        self.assertEqual(self.search_ids('()*'), [])
+
+    def test_index_follows_writes(self):
+        self.in_description.description = 'Cracked valve on the meter'
+        self.in_description.save()
+        self.assertEqual(self.search_ids('regulator'), [self.in_notes.id])
+        ServiceRequest.objects.filter(pk=self.in_notes.pk).delete()
+        self.assertEqual(self.search_ids('regulator'), [])
+
+        user = self.customers[1].user
+        user.first_name = 'Priya'
+        user.save()
+        self.assertEqual(set(self.search_ids('priya')), set(self.customers[1].service_requests.values_list('id', flat=True)))
+
+    def test_api_and_dashboard_order_by_relevance(self):
+        self.client.force_login(self.staff_user)
+        response = self.client.get('/api/service-requests/', {'search': 'regulator'})
+        self.assertEqual([item['id'] for item in response.json()['results']], [self.in_description.id, self.in_notes.id])
+        response = self.client.get(reverse('support_dashboard'), {'q': 'regulator'})
+        self.assertEqual(list(response.context['service_requests']), [self.in_description, self.in_notes])
+
+    def test_migrated_notes_rank_like_note_events(self):
+        migration = import_module('requests.migrations.0009_servicerequestevent')
+        blob = f'2024-03-05 10:15:00 - {self.staff_user.username}:\nReplaced the regulator'
+        legacy = ServiceRequest.objects.create(
+            customer=self.customers[3], service_type='Other', description='Odd noise outside', notes=blob
+        )
+        schema_editor = mock.Mock(connection=connection)
+
+        migration.parse_notes_into_events(apps, schema_editor)
+        legacy.refresh_from_db()
+        self.assertIsNone(legacy.notes)
+        self.assertEqual(list(legacy.events.values_list('kind', 'body', 'author')), [
+            ('note', 'Replaced the regulator', self.staff_user.id),
+        ])
+        ranks = {row.id: row.search_rank for row in ServiceRequest.objects.search('regulator')}
+        self.assertAlmostEqual(ranks[legacy.id], ranks[self.in_notes.id])
+
+        migration.write_events_into_notes(apps, schema_editor)
+        legacy.refresh_from_db()
+        self.assertEqual(legacy.notes, blob)
+
+    def test_migrations_rebuild_only_when_declared(self):
+        graph = MigrationLoader(connection).graph
+        routine = [(graph.nodes[('accounts', '0005_revokedsession')], False)]
+        reindexing = routine + [(graph.nodes[('requests', '0014_rebuild_search_index')], False)]
+        config = apps.get_app_config('requests')
+        search.suspend_triggers(connection)
+        with mock.patch.object(search, 'rebuild') as rebuild:
+            signals.ensure_search_triggers(config, connection.alias, plan=routine)
+            rebuild.assert_not_called()
+            signals.ensure_search_triggers(config, connection.alias, plan=reindexing)
+            rebuild.assert_called_once_with(connection)
+        # The triggers are back
+        created = ServiceRequest.objects.create(customer=self.customer, service_type='Other', description='Hissing pipe')
+        self.assertEqual(self.search_ids('hissing'), [created.id])
+
+
+class ServiceRequestSequenceTests(ServiceDataTestCase):
+    """Per-customer request numbers."""
+
+    def test_existing_requests_are_numbered_per_customer(self):
+        seqs = list(ServiceRequest.objects.filter(customer=self.customer).order_by('created_at', 'id').values_list('seq', flat=True))
+        self.assertEqual(seqs, list(range(1, self.CUSTOMER_REQUESTS + 1)))
+        self.customer.refresh_from_db()
+        self.assertEqual(self.customer.last_request_seq, self.CUSTOMER_REQUESTS)
+
+    def test_numbers_are_not_reused_after_delete(self):
+        latest = ServiceRequest.objects.filter(customer=self.customer).order_by('-seq').first()
+        latest.delete()
+        created = ServiceRequest.objects.create(customer=self.customer, service_type='Other', description='Next')
+        self.assertEqual(created.seq, latest.seq + 1)
+
+    def test_bulk_create_numbers_each_customer(self):
+        other = self.customers[1]
+        created = ServiceRequest.objects.bulk_create([
+            ServiceRequest(customer=customer, service_type='Other', description='Bulk')
+            for customer in [self.customer, other, self.customer]
+        ])
+        self.assertEqual(
+            [request.seq for request in created],
+            [self.CUSTOMER_REQUESTS + 1, self.REQUESTS_PER_OTHER_CUSTOMER + 1, self.CUSTOMER_REQUESTS + 2]
+        )
+
+    def test_dashboard_numbers_are_stable_across_pages(self):
+        self.client.force_login(self.customer_user)
+        response = self.client.get(reverse('dashboard'), {'page': 3})
+        self.assertEqual([request.seq for request in response.context['requests']], [5, 4, 3, 2, 1])
+
+
+class ServiceRequestEventTests(ServiceDataTestCase):
+    """Event timeline written by the support detail page."""
+
+    def setUp(self):
+        self.client.force_login(self.staff_user)
+
+    def test_update_appends_events_without_touching_notes(self):
+        self.customer_request.refresh_from_db()
+        notes = self.customer_request.notes
+        self.client.post(reverse('support_request_detail', args=[self.customer_request.id]), {
+            'status': 'In Progress', 'priority': self.customer_request.priority, 'notes': 'Engineer dispatched',
+            'assigned_to': self.staff_rep.id,
+        })
+        events = ServiceRequestEvent.objects.timeline(self.customer_request)
+        self.assertEqual(
+            sorted((event.kind, event.body, event.old_value, event.new_value, event.author) for event in events),
+            [
+                ('assignment', '', '', 'Sam Staff', self.staff_user),
+                ('note', 'Engineer dispatched', '', '', self.staff_user),
+                ('status', '', 'Pending', 'In Progress', self.staff_user),
+            ]
+        )
+        self.customer_request.refresh_from_db()
+        self.assertEqual(self.customer_request.notes, notes)
+
+    def test_unchanged_update_records_nothing(self):
+        self.client.post(reverse('support_request_detail', args=[self.customer_request.id]), {
+            'status': self.customer_request.status, 'priority': self.customer_request.priority, 'notes': '',
+            'assigned_to': '',
+        })
+        self.assertFalse(ServiceRequestEvent.objects.filter(service_request=self.customer_request).exists())
+
+    def test_events_are_append_only(self):
+        event = ServiceRequestEvent.objects.create(service_request=self.customer_request, kind='note', body='First')
+        event.body = 'Edited'
+        with self.assertRaises(ValueError):
+            event.save()
+
+    def test_timeline_is_paginated_newest_first(self):
+        ServiceRequestEvent.objects.bulk_create(
+            ServiceRequestEvent(service_request=self.customer_request, kind='note', body=f'Note {index}')
+            for index in range(25)
+        )
+        response = self.client.get(reverse('support_request_detail', args=[self.customer_request.id]), {'events_page': 3})
+        self.assertEqual([event.body for event in response.context['events']], [f'Note {index}' for index in range(4, -1, -1)])
+        self.assertContains(response, 'Page 3 of 3')
+
+    def test_search_matches_note_events(self):
+        ServiceRequestEvent.objects.create(service_request=self.customer_request, kind='note', body='corroded regulator valve')
+        self.assertEqual(list(ServiceRequest.objects.search('regulator').values_list('id', flat=True)), [self.customer_request.id])
+
+    def test_api_patch_appends_events(self):
+        notes = self.customer_request.notes
+        response = self.client.patch(
+            f'/api/service-requests/{self.customer_request.id}/',
+            {'status': 'Resolved', 'assigned_to': self.reps[1].id, 'notes': 'Valve replaced'},
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('notes', response.json())
+        events = ServiceRequestEvent.objects.timeline(self.customer_request)
+        self.assertEqual(
+            sorted((event.kind, event.body, event.old_value, event.new_value, event.author) for event in events),
+            [
+                ('assignment', '', '', 'Rep 1', self.staff_user),
+                ('note', 'Valve replaced', '', '', self.staff_user),
+                ('status', '', 'Pending', 'Resolved', self.staff_user),
+            ]
+        )
+        self.customer_request.refresh_from_db()
+        self.assertEqual(self.customer_request.notes, notes)
+        self.assertEqual(list(Job.objects.values_list('payload', flat=True)), [
+            {'request_id': self.customer_request.id, 'old_status': 'Pending', 'new_status': 'Resolved'},
+        ])
+
+    def test_customer_can_add_a_note_through_the_api(self):
+        self.client.force_login(self.customer_user)
+        response = self.client.patch(
+            f'/api/service-requests/{self.customer_request.id}/', {'notes': 'Meter is in the garage'},
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        event = ServiceRequestEvent.objects.get(service_request=self.customer_request)
+        self.assertEqual((event.kind, event.body, event.author), ('note', 'Meter is in the garage', self.customer_user))
+
+    def test_dashboard_bulk_actions_record_an_event_per_request(self):
+        selected = list(ServiceRequest.objects.filter(status='Pending').values_list('id', flat=True)[:4])
+        ServiceRequest.objects.filter(id__in=selected).assign(self.reps[2])
+        self.client.post(reverse('support_dashboard'), {
+            'action': 'update_status', 'new_status': 'In Progress', 'selected_requests': selected,
+        })
+        self.client.post(reverse('support_dashboard'), {
+            'action': 'assign', 'support_rep': self.staff_rep.id, 'selected_requests': selected,
+        })
+        events = ServiceRequestEvent.objects.filter(service_request_id__in=selected, author=self.staff_user)
+        self.assertEqual(
+            sorted(events.values_list('service_request_id', 'kind', 'old_value', 'new_value')),
+            sorted(
+                [(pk, 'status', 'Pending', 'In Progress') for pk in selected]
+                + [(pk, 'assignment', 'Rep 2', 'Sam Staff') for pk in selected]
+            )
+        )
+        self.assertEqual(
+            sorted(payload['request_id'] for payload in Job.objects.values_list('payload', flat=True)), sorted(selected)
+        )
+
+    def test_unchanged_rows_get_no_events(self):
+        resolved = ServiceRequest.objects.filter(status='Resolved')
+        resolved.set_status('Resolved', author=self.staff_user)
+        self.assertFalse(ServiceRequestEvent.objects.exists())
+        self.assertFalse(Job.objects.exists())
+
+    def test_listings_leave_out_notes(self):
+        with query_budget(10) as budget:
+            self.client.get(reverse('support_dashboard'))
+        self.assertFalse([query for query in budget.queries if '"requests_servicerequest"."notes"' in query['sql']])
+
+    def test_migration_parses_legacy_notes(self):
+        parse_notes = import_module('requests.migrations.0009_servicerequestevent').parse_notes
+        created_at = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        notes = (
+            'Called the customer\n\n'
+            '2024-03-05 10:15:00 - staff:\nMeter replaced\nTested OK\n\n'
+            '2024-03-05 11:00:00 - staff:\nStatus changed from Pending to Resolved'
+        )
+        self.assertEqual(list(parse_notes(notes, created_at)), [
+            (created_at, None, 'Called the customer'),
+            (datetime(2024, 3, 5, 10, 15, tzinfo=timezone.utc), 'staff', 'Meter replaced\nTested OK'),
+            (datetime(2024, 3, 5, 11, 0, tzinfo=timezone.utc), 'staff', 'Status changed from Pending to Resolved'),
+        ])
+
+
+class AttachmentStorageTests(ServiceDataTestCase):
+    """Content-addressed attachment storage and streaming upload limits."""
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        self.enterContext(self.settings(MEDIA_ROOT=media_root))
+        self.client.force_login(self.customer_user)
+
+    def submit(self, name, content):
+        return self.client.post(reverse('submit_request'), {
+            'service_type': 'Gas Leak', 'priority': 'Urgent', 'description': 'Photo of the leak',
+            'attached_file': SimpleUploadedFile(name, content),
+        })
+
+    def test_identical_uploads_are_stored_once(self):
+        self.submit('leak.jpg', b'same photo')
+        self.submit('LEAK-copy.JPG', b'same photo')
+        first, second = ServiceRequest.objects.filter(customer=self.customer).order_by('-id')[:2]
+        self.assertEqual(first.attached_file.name, second.attached_file.name)
+        self.assertRegex(first.attached_file.name, r'^service_requests/[0-9a-f]{2}/[0-9a-f]{64}\.jpg$')
+        self.assertEqual(AttachmentBlob.objects.get().ref_count, 2)
+        with first.attached_file.open() as stored:
+            self.assertEqual(stored.read(), b'same photo')
+
+    def test_file_is_removed_with_its_last_reference(self):
+        self.submit('leak.pdf', b'report')
+        self.submit('leak.pdf', b'report')
+        first, second = ServiceRequest.objects.filter(customer=self.customer).order_by('-id')[:2]
+        name = first.attached_file.name
+        first.delete()
+        self.assertEqual(jobs.run_due_jobs(), 0)
+        self.assertTrue(attachment_storage.exists(name))
+        self.assertEqual(AttachmentBlob.objects.get(name=name).ref_count, 1)
+        second.delete()
+        self.assertEqual(jobs.run_due_jobs(), 1)
+        self.assertFalse(attachment_storage.exists(name))
+        self.assertFalse(AttachmentBlob.objects.exists())
+
+    def test_oversized_upload_is_rejected(self):
+        response = self.submit('leak.png', b'x' * (MAX_ATTACHMENT_SIZE + 1))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['form'].errors['attached_file'], ['File size must be under 5MB'])
+        self.assertFalse(AttachmentBlob.objects.exists())
+        self.assertEqual(os.listdir(attachment_storage.location), [])
+
+    def test_disallowed_type_is_rejected_by_api(self):
+        response = self.client.post('/api/service-requests/', {
+            'customer': self.customer.id, 'service_type': 'Other', 'description': 'Script', 'priority': 'Low',
+            'attached_file': SimpleUploadedFile('run.exe', b'MZ'),
+        })
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('attached_file', response.json())
+        self.assertFalse(AttachmentBlob.objects.exists())
+
+    def test_attachment_is_served_with_validators(self):
+        self.submit('leak.pdf', b'%PDF-1.4 report')
+        service_request = ServiceRequest.objects.filter(customer=self.customer).latest('id')
+        url = reverse('request_attachment', args=[service_request.id])
+        with query_budget(2, SQL_TIME_BUDGET):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'%PDF-1.4 report')
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        content_hash = service_request.attached_file.name.rsplit('/', 1)[-1].split('.')[0]
+        self.assertEqual(response['ETag'], f'"{content_hash}"')
+
+        response = self.client.get(url, headers={'If-None-Match': response['ETag']})
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get(url, headers={'If-Modified-Since': response['Last-Modified']})
+        self.assertEqual(response.status_code, 304)
+
+    def test_attachment_range_requests(self):
+        self.submit('leak.pdf', b'0123456789')
+        url = reverse('request_attachment', args=[ServiceRequest.objects.filter(customer=self.customer).latest('id').id])
+        response = self.client.get(url, headers={'Range': 'bytes=2-5'})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), b'2345')
+        self.assertEqual(response['Content-Range'], 'bytes 2-5/10')
+        self.assertEqual(response['Content-Length'], '4')
+        response = self.client.get(url, headers={'Range': 'bytes=-3'})
+        self.assertEqual(b''.join(response.streaming_content), b'789')
+        response = self.client.get(url, headers={'Range': 'bytes=2-5', 'If-Range': '"stale"'})
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(url, headers={'Range': 'bytes=20-'})
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */10')
+
+    async def test_attachment_streams_without_buffering_under_asgi(self):
+        content = bytes(range(256)) * 1024
+        await sync_to_async(self.submit)('survey.pdf', content)
+        service_request = await ServiceRequest.objects.filter(customer=self.customer).alatest('id')
+        url = reverse('request_attachment', args=[service_request.id])
+        await self.async_client.aforce_login(self.customer_user)
+        # Django warns, then reads the whole body into memory, when ASGI gets a synchronous iterator
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            response = await self.async_client.get(url)
+            self.assertTrue(response.is_async)
+            self.assertEqual(response['Content-Length'], str(len(content)))
+            self.assertEqual(b''.join([part async for part in response]), content)
+
+            response = await self.async_client.get(url, headers={'Range': 'bytes=1000-99999'})
+            self.assertEqual(response.status_code, 206)
+            self.assertEqual(response['Content-Range'], f'bytes 1000-99999/{len(content)}')
+            self.assertEqual(b''.join([part async for part in response]), content[1000:100000])
+
+    def test_attachment_is_private_to_owner_and_staff(self):
+        self.submit('leak.pdf', b'report')
+        url = reverse('request_attachment', args=[ServiceRequest.objects.filter(customer=self.customer).latest('id').id])
+        self.client.force_login(self.customers[1].user)
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.client.force_login(self.staff_user)
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_attachment_is_served_under_its_uploaded_name(self):
+        self.submit('Meter reading.pdf', b'report')
+        self.submit('Zählerstand "März".pdf', b'report')
+        second, first = ServiceRequest.objects.filter(customer=self.customer).order_by('-id')[:2]
+        self.assertEqual(first.attached_file.name, second.attached_file.name)
+        self.assertEqual(first.attachment_name, 'Meter reading.pdf')
+
+        response = self.client.get(reverse('request_attachment', args=[first.id]))
+        self.assertEqual(response['Content-Disposition'], 'inline; filename="Meter reading.pdf"')
+        response = self.client.get(reverse('request_attachment', args=[second.id]))
+        self.assertEqual(
+            response['Content-Disposition'], "inline; filename*=utf-8''Z%C3%A4hlerstand%20%22M%C3%A4rz%22.pdf"
+        )
+
+    def test_batch_created_attachment_keeps_its_uploaded_name(self):
+        serializer = ServiceRequestCreateSerializer(many=True, data=[{
+            'customer': self.customer.id, 'service_type': 'Gas Leak', 'priority': 'High', 'description': 'Photo',
+            'attached_file': SimpleUploadedFile('Leak photo.jpg', b'photo'),
+        }])
+        serializer.is_valid(raise_exception=True)
+        [created] = serializer.save(customer=self.customer)
+        created.refresh_from_db()
+        self.assertEqual(created.attachment_name, 'Leak photo.jpg')
+        self.assertRegex(created.attached_file.name, r'^service_requests/[0-9a-f]{2}/[0-9a-f]{64}\.jpg$')
+
+    def test_upload_handler_is_installed_by_attachment_views_only(self):
+        installed = []
+        original_new_file = AttachmentUploadHandler.new_file
+
+        def new_file(handler, *args, **kwargs):
+            installed.append(handler.request.path)
+            return original_new_file(handler, *args, **kwargs)
+
+        with mock.patch.object(AttachmentUploadHandler, 'new_file', new_file):
+            self.submit('leak.pdf', b'report')
+            self.client.post('/api/service-requests/', {
+                'customer': self.customer.id, 'service_type': 'Other', 'description': 'Report', 'priority': 'Low',
+                'attached_file': SimpleUploadedFile('report.pdf', b'report'),
+            })
+            self.client.force_login(self.staff_user)
+            self.client.post(reverse('support_dashboard'), {'file': SimpleUploadedFile('other.pdf', b'other')})
+        self.assertEqual(installed, [reverse('submit_request'), '/api/service-requests/'])
+
+    def test_submit_still_checks_csrf(self):
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(self.customer_user)
+        response = client.post(reverse('submit_request'), {
+            'service_type': 'Gas Leak', 'priority': 'Urgent', 'description': 'Photo of the leak',
+            'attached_file': SimpleUploadedFile('leak.jpg', b'photo'),
+        })
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(ServiceRequest.objects.filter(description='Photo of the leak').exists())
+
+    def test_attachment_offloaded_to_web_server(self):
+        self.submit('leak.pdf', b'report')
+        service_request = ServiceRequest.objects.filter(customer=self.customer).latest('id')
+        with self.settings(ATTACHMENT_SENDFILE_HEADER='X-Accel-Redirect'):
+            response = self.client.get(reverse('request_attachment', args=[service_request.id]))
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected-media/{service_request.attached_file.name}')
+        self.assertEqual(response.content, b'')
+
+
+class BackgroundJobTests(ServiceDataTestCase):
+    """Database-backed job queue."""
+
+    def setUp(self):
+        task_calls.clear()
+
+    def test_job_runs_once_and_is_removed(self):
+        jobs.enqueue('tests.record', {'value': 7})
+        jobs.enqueue('tests.record', {'value': 8}, delay=60)
+        self.assertEqual(jobs.run_due_jobs(), 1)
+        self.assertEqual(jobs.run_due_jobs(), 0)
+        self.assertEqual(task_calls, [7])
+        self.assertEqual(Job.objects.get().payload, {'value': 8})
+
+    def test_failed_job_is_retried_with_backoff_then_marked_failed(self):
+        job = jobs.enqueue('tests.flaky')
+        with self.assertLogs('requests.jobs', 'WARNING'):
+            jobs.run_due_jobs()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.QUEUED, 1))
+        self.assertGreaterEqual(job.run_at, django_timezone.now() + timedelta(seconds=59))
+        self.assertIn('Meter service unavailable', job.last_error)
+
+        Job.objects.filter(id=job.id).update(run_at=django_timezone.now())
+        with self.assertLogs('requests.jobs', 'WARNING'):
+            jobs.run_due_jobs()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, 2))
+        self.assertEqual(jobs.run_due_jobs(), 0)
+
+    def test_expired_lease_is_claimed_again(self):
+        job = jobs.enqueue('tests.record', {'value': 1})
+        token, claimed = jobs.claim('crashed-worker', 10)
+        self.assertEqual(claimed, [job.id])
+        self.assertEqual(jobs.claim('other-worker', 10), (None, []))
+
+        Job.objects.filter(id=job.id).update(locked_until=django_timezone.now() - timedelta(seconds=1))
+        self.assertEqual(jobs.run_due_jobs(), 1)
+        self.assertEqual(task_calls, [1])
+        # The crashed worker's late result is ignored
+        jobs.execute(job.id, token)
+        self.assertEqual(task_calls, [1])
+
+    def test_concurrency_limit_is_respected_when_claiming(self):
+        first = jobs.enqueue('tests.limited')
+        jobs.enqueue('tests.limited')
+        other = jobs.enqueue('tests.record', {'value': 2})
+        self.assertEqual(jobs.claim('worker', 10)[1], [first.id, other.id])
+
+    def test_status_change_notifies_customer_in_background(self):
+        self.client.force_login(self.staff_user)
+        self.client.post(reverse('support_request_detail', args=[self.customer_request.id]), {
+            'status': 'Resolved', 'priority': self.customer_request.priority, 'notes': '', 'assigned_to': '',
+        })
+        self.assertEqual(mail.outbox, [])
+        self.assertEqual(jobs.run_due_jobs(), 1)
+        self.assertEqual(mail.outbox[0].to, [self.customer_user.email])
+        self.assertIn('Pending to Resolved', mail.outbox[0].body)
+
+
+class JobWorkerTests(TransactionTestCase):
+    """The worker's thread pool, which needs committed rows visible to other connections."""
+
+    def test_worker_runs_jobs_on_a_thread_pool(self):
+        task_calls.clear()
+        for value in range(6):
+            jobs.enqueue('tests.record', {'value': value})
+        processed = jobs.Worker(concurrency=3, poll_interval=0.01).run(burst=True)
+        self.assertEqual(processed, 6)
+        self.assertEqual(sorted(task_calls), list(range(6)))
+        self.assertFalse(Job.objects.exists())
+
+
+class ServiceDataImportTests(ServiceDataTestCase):
+    """import_service_data: streaming bulk import with checkpoints."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def write_file(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w', encoding='utf-8', newline='') as handle:
+            handle.write(content)
+        return path
+
+    def import_file(self, *args):
+        stdout, stderr = io.StringIO(), io.StringIO()
+        call_command('import_service_data', *args, stdout=stdout, stderr=stderr)
+        return stdout.getvalue(), stderr.getvalue()
+
+    def test_customers_are_imported_from_csv(self):
+        path = self.write_file('customers.csv', (
+            'username,email,first_name,password,phone_number\n'
+            'legacy1,legacy1@example.com,Asha,gas-pass-1,+911234567890\n'
+            'legacy2,legacy2@example.com,Ravi,,\n'
+            'customer0,customer0@example.com,Dup,whatever,\n'
+            ',nobody@example.com,,,\n'
+        ))
+        stdout, stderr = self.import_file('customers', path, '--hash-workers', '0', '--chunk-size', '2')
+
+        first = User.objects.get(username='legacy1')
+        self.assertTrue(first.check_password('gas-pass-1'))
+        self.assertEqual((first.role, first.customer_profile.phone_number), ('customer', '+911234567890'))
+        self.assertFalse(User.objects.get(username='legacy2').has_usable_password())
+        self.assertNotEqual(User.objects.get(username='customer0').first_name, 'Dup')
+        self.assertIn('Record 4: username is required', stderr)
+        self.assertIn('Imported 2 customers from 4 records', stdout)
+        self.assertEqual(ImportCheckpoint.objects.get().position, 4)
+
+    def test_passwords_can_be_hashed_on_a_process_pool(self):
+        path = self.write_file('customers.jsonl', '{"username": "pooled", "password": "gas-pass-2"}\n')
+        self.import_file('customers', path, '--hash-workers', '1')
+        self.assertTrue(User.objects.get(username='pooled').check_password('gas-pass-2'))
+
+    def test_service_requests_keep_legacy_timestamps_and_notes(self):
+        customer = self.customers[0]
+        customer.refresh_from_db()
+        last_seq = customer.last_request_seq
+        lines = [
+            {'customer': customer.user.username, 'service_type': 'Gas Leak', 'description': 'Smell near meter',
+             'status': 'Resolved', 'priority': 'High', 'created_at': '2019-03-01T09:30:00+00:00',
+             'updated_at': '2019-03-02T10:00:00+00:00', 'assigned_to': 'staff', 'notes': 'Valve replaced'},
+            {'customer': customer.user.username, 'service_type': 'Billing Issue', 'description': 'Overcharged'},
+            {'customer': 'no-such-customer', 'service_type': 'Gas Leak', 'description': 'Lost'},
+        ]
+        path = self.write_file('requests.jsonl', '\n'.join(json.dumps(line) for line in lines) + '\n{not json\n')
+        stdout, stderr = self.import_file('requests', path)
+
+        resolved, pending = ServiceRequest.objects.filter(description__in=['Smell near meter', 'Overcharged']).order_by('seq')
+        self.assertEqual((resolved.seq, pending.seq), (last_seq + 1, last_seq + 2))
+        self.assertEqual(resolved.created_at, datetime(2019, 3, 1, 9, 30, tzinfo=timezone.utc))
+        self.assertEqual(resolved.resolved_at, datetime(2019, 3, 2, 10, tzinfo=timezone.utc))
+        self.assertEqual((resolved.assigned_to, pending.status), (self.staff_rep, 'Pending'))
+        self.assertEqual(list(resolved.events.values_list('kind', 'body')), [('note', 'Valve replaced')])
+        self.assertEqual(ServiceRequestCounter.objects.verify(), {})
+        self.assertIn("Record 3: Unknown customer 'no-such-customer'", stderr)
+        self.assertIn('Record 4: Invalid JSON', stderr)
+
+    def test_import_resumes_after_the_checkpoint(self):
+        username = self.customers[0].user.username
+        path = self.write_file('requests.csv', 'customer,service_type,description\n' + ''.join(
+            f'{username},Gas Leak,Leak {index}\n' for index in range(1, 6)
+        ))
+        ImportCheckpoint.objects.create(name=f'requests:{os.path.abspath(path)}', position=3)
+        stdout, stderr = self.import_file('requests', path, '--chunk-size', '1')
+
+        self.assertIn('Resuming after record 3', stdout)
+        self.assertEqual(
+            sorted(ServiceRequest.objects.filter(description__startswith='Leak ').values_list('description', flat=True)),
+            ['Leak 4', 'Leak 5']
+        )
+        self.assertEqual(ImportCheckpoint.objects.get().position, 5)
+
+        self.import_file('requests', path, '--restart')
+        self.assertEqual(ServiceRequest.objects.filter(description__startswith='Leak ').count(), 7)
+
+
+class BenchmarkToolingTests(ServiceDataTestCase):
+    """generate_service_data and benchmark_endpoints."""
+
+    def test_generated_data_is_seeded_and_consistent(self):
+        call_command(
+            'generate_service_data', '--customers', '20', '--reps', '3', '--requests', '150',
+            '--batch-size', '40', '--seed', '7', stdout=io.StringIO()
+        )
+        generated = ServiceRequest.objects.filter(customer__user__username__startswith='sample-customer-')
+        self.assertEqual(generated.count(), 150)
+        self.assertEqual(SupportRepresentative.objects.filter(user__username__startswith='sample-rep-').count(), 3)
+        self.assertEqual(ServiceRequestCounter.objects.verify(), {})
+        self.assertFalse(generated.filter(status='Resolved', resolved_at__isnull=True).exists())
+        self.assertTrue(User.objects.get(username='sample-customer-0').check_password('sample-pass-123'))
+        first_run = list(generated.order_by('id').values_list('customer__user__username', 'status', 'priority', 'service_type'))
+
+        generated.delete()
+        User.objects.filter(username__startswith='sample-').delete()
+        call_command(
+            'generate_service_data', '--customers', '20', '--reps', '3', '--requests', '150',
+            '--batch-size', '40', '--seed', '7', stdout=io.StringIO()
+        )
+        self.assertEqual(
+            list(generated.order_by('id').values_list('customer__user__username', 'status', 'priority', 'service_type')),
+            first_run
+        )
+
+    def test_benchmark_results_are_saved_and_compared(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        output = os.path.join(directory, 'results.json')
+        call_command(
+            'benchmark_endpoints', '--iterations', '3', '--warmup', '1', '--output', output, stdout=io.StringIO()
+        )
+        with open(output) as handle:
+            results = json.load(handle)
+        self.assertEqual(
+            list(results['endpoints']),
+            ['dashboard', 'support_dashboard', 'support_request_detail', 'statistics', 'api_list', 'api_detail']
+        )
+        detail = results['endpoints']['support_request_detail']
+        self.assertLessEqual(detail['p50_ms'], detail['p99_ms'])
+        self.assertGreater(detail['queries_per_request'], 0)
+        self.assertEqual(results['dataset']['service_requests'], ServiceRequest.objects.count())
+
+        stdout = io.StringIO()
+        call_command(
+            'benchmark_endpoints', '--iterations', '2', '--endpoint', 'statistics', '--compare', output, stdout=stdout
+        )
+        self.assertIn('statistics', stdout.getvalue())
+        self.assertIn('queries_per_request', stdout.getvalue())
+
+
+class ServerTimingTests(ServiceDataTestCase):
+    """Server-Timing header and on-demand request profiling."""
+
+    def setUp(self):
+        self.profile_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.profile_dir)
+        settings_override = override_settings(
+            SERVER_TIMING=True, REQUEST_PROFILING=True, REQUEST_PROFILE_DIR=self.profile_dir
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def timing_entries(self, response):
+        return {entry.split(';')[0]: entry for entry in response.headers['Server-Timing'].split(', ')}
+
+    def test_server_timing_reports_sql_template_and_serializer_time(self):
+        self.client.force_login(self.staff_user)
+        with query_budget(20) as budget:
+            page = self.client.get(reverse('support_dashboard'))
+        entries = self.timing_entries(page)
+        self.assertIn(f'desc="{len(budget.queries)} queries"', entries['sql'])
+        self.assertIn('template', entries)
+        self.assertNotIn('serializer', entries)
+
+        api = self.timing_entries(self.client.get(reverse('servicerequest-list')))
+        self.assertIn('serializer', api)
+        self.assertNotIn('template', api)
+
+    def test_middleware_is_skipped_when_disabled(self):
+        self.client.force_login(self.staff_user)
+        with override_settings(SERVER_TIMING=False, REQUEST_PROFILING=False):
+            response = self.client.get(reverse('support_dashboard') + '?_profile=cprofile')
+        self.assertNotIn('Server-Timing', response.headers)
+        self.assertEqual(os.listdir(self.profile_dir), [])
+
+    def test_staff_can_profile_a_request_and_download_it(self):
+        self.client.force_login(self.staff_user)
+        response = self.client.get(reverse('support_dashboard'), headers={'X-Profile': 'cprofile'})
+        download = self.client.get(response.headers['X-Profile-Download'])
+        self.assertEqual(download.status_code, 200)
+        self.assertIn('attachment', download.headers['Content-Disposition'])
+        self.assertTrue(b''.join(download.streaming_content))
+
+        response = self.client.get(reverse('support_dashboard') + '?_profile=memory')
+        self.assertIn('memory', self.timing_entries(response))
+        self.assertTrue(response.headers['X-Profile-Download'].endswith('.tracemalloc/'))
+        self.assertEqual(len(os.listdir(self.profile_dir)), 2)
+
+    def test_profiling_is_staff_only(self):
+        self.client.force_login(self.customer_user)
+        response = self.client.get(reverse('dashboard'), headers={'X-Profile': 'cprofile'})
+        self.assertNotIn('X-Profile-Download', response.headers)
+        self.assertEqual(os.listdir(self.profile_dir), [])
+        self.assertEqual(self.client.get(reverse('profile_download', args=['x.prof'])).status_code, 302)
+
+
+@override_settings(METRICS_ALLOWED_IPS=['127.0.0.1'])
+class MetricsTests(ServiceDataTestCase):
+    """Prometheus metrics at /metrics."""
+
+    def setUp(self):
+        metrics.registry.reset()
+
+    def scrape(self, **kwargs):
+        response = self.client.get(reverse('metrics'), **kwargs)
+        self.assertEqual(response.status_code, 200)
+        return response.content.decode()
+
+    def test_requests_queries_backlog_and_caches_are_exported(self):
+        self.client.force_login(self.staff_user)
+        self.client.get(reverse('support_dashboard'))
+        self.client.get('/no-such-page/')
+        cache.get('metrics-test')
+        cache.set('metrics-test', 1)
+        cache.get('metrics-test')
+
+        body = self.scrape()
+        self.assertIn('gas_utility_http_requests_total{view="support_dashboard",method="GET",status="200"} 1.0', body)
+        self.assertIn('gas_utility_http_requests_total{view="unmatched",method="GET",status="404"} 1.0', body)
+        self.assertIn('gas_utility_http_request_duration_seconds_count{view="support_dashboard"} 1', body)
+        self.assertIn('gas_utility_db_queries_total{view="support_dashboard"}', body)
+        pending_high = ServiceRequest.objects.filter(status='Pending', priority='High').count()
+        self.assertIn(f'gas_utility_service_requests{{status="Pending",priority="High"}} {pending_high}', body)
+        self.assertIn('gas_utility_cache_hit_ratio{cache="default"} 0.5', body)
+
+    def test_worker_processes_are_added_up(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        other_worker = {
+            'counters': [['gas_utility_http_requests_total', ['dashboard', 'GET', '200'], 4.0]],
+            'histograms': [['gas_utility_http_request_duration_seconds', ['dashboard'], [1] + [0] * 10 + [0.003, 1]]],
+        }
+        with open(os.path.join(directory, '1234-abc.json'), 'w') as handle:
+            json.dump(other_worker, handle)
+
+        with override_settings(METRICS_DIR=directory):
+            self.client.force_login(self.customer_user)
+            self.client.get(reverse('dashboard'))
+            body = self.scrape()
+        self.assertIn('gas_utility_http_requests_total{view="dashboard",method="GET",status="200"} 5.0', body)
+        self.assertIn('gas_utility_http_request_duration_seconds_count{view="dashboard"} 2', body)
+        self.assertEqual(len(os.listdir(directory)), 2)
+
+    def test_metrics_require_token_or_allowed_address(self):
+        self.assertEqual(self.client.get(reverse('metrics'), REMOTE_ADDR='203.0.113.5').status_code, 403)
+        with override_settings(METRICS_TOKEN='scrape-secret', METRICS_ALLOWED_IPS=[]):
+            self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+            self.assertEqual(
+                self.client.get(reverse('metrics'), headers={'Authorization': 'Bearer wrong'}).status_code, 403
+            )
+            self.scrape(headers={'Authorization': 'Bearer scrape-secret'})
+
+    def test_metrics_denied_by_default(self):
+        # Behind a local reverse proxy every request comes from 127.0.0.1
+        with override_settings(METRICS_TOKEN=None, METRICS_ALLOWED_IPS=[]):
+            self.assertEqual(self.client.get(reverse('metrics'), REMOTE_ADDR='127.0.0.1').status_code, 403)
+            self.assertEqual(self.client.get(reverse('metrics'), REMOTE_ADDR='::1').status_code, 403)
+
+
+class AsyncReadViewTests(ServiceDataTestCase):
+    """The async views routed under ASGI answer like the synchronous ones."""
+
+    async def sync_get(self, user, url, **kwargs):
+        """GET ``url`` from the synchronous views (the test client is a WSGI client)."""
+        await sync_to_async(self.client.force_login)(user)
+        return await sync_to_async(self.client.get)(url, **kwargs)
+
+    async def assert_same_json(self, user, urls):
+        expected = [await self.sync_get(user, url) for url in urls]
+        await self.async_client.aforce_login(user)
+        # The async handlers must serve these without falling back to the sync ones. The routes
+        # were built when asgi_urls was imported, before the patches hide the statistics action.
+        with mock.patch.object(ServiceRequestViewSet, 'list', side_effect=AssertionError('sync list used')), \
+                mock.patch.object(ServiceRequestViewSet, 'retrieve', side_effect=AssertionError('sync retrieve used')), \
+                mock.patch.object(ServiceRequestViewSet, 'statistics', side_effect=AssertionError('sync statistics used')):
+            for url, sync_response in zip(urls, expected):
+                response = await self.async_client.get(url)
+                self.assertEqual(response.status_code, sync_response.status_code, url)
+                self.assertEqual(response.json(), sync_response.json(), url)
+
+    async def test_api_reads_match_sync_views(self):
+        list_url = reverse('servicerequest-list')
+        await self.assert_same_json(self.staff_user, [
+            list_url,
+            list_url + '?status=Pending&ordering=priority&page=2',
+            list_url + '?page=last&fields=id,status&expand=customer',
+            list_url + '?search=meter',
+            list_url + '?page=99',
+            list_url + '?fields=nope',
+            reverse('servicerequest-detail', args=[self.other_request.pk]),
+            reverse('servicerequest-statistics'),
+        ])
+        await self.assert_same_json(self.customer_user, [
+            list_url,
+            reverse('servicerequest-detail', args=[self.customer_request.pk]),
+            reverse('servicerequest-detail', args=[self.other_request.pk]),
+            reverse('servicerequest-statistics'),
+        ])
+
+    async def test_export_streams_without_buffering(self):
+        url = reverse('servicerequest-export')
+        for params in ({'format': 'csv', 'status': 'Pending'}, {'format': 'ndjson'}):
+            sync_response = await self.sync_get(self.staff_user, url, data=params)
+            expected = await sync_to_async(b''.join)(sync_response.streaming_content)
+            await self.async_client.aforce_login(self.staff_user)
+            # Django warns, then reads the whole body into memory, when ASGI gets a synchronous iterator
+            with warnings.catch_warnings():
+                warnings.simplefilter('error')
+                response = await self.async_client.get(url, params)
+                self.assertTrue(response.is_async)
+                self.assertEqual(b''.join([part async for part in response]), expected)
+            self.assertEqual(response['Content-Type'], sync_response['Content-Type'])
+
+    async def test_other_requests_use_the_sync_view(self):
+        await self.async_client.aforce_login(self.staff_user)
+        list_url = reverse('servicerequest-list')
+        cursor_page = await self.async_client.get(list_url + '?pagination=cursor')
+        self.assertIn('next', cursor_page.json())
+        self.assertNotIn('count', cursor_page.json())
+
+        await self.async_client.alogout()
+        credentials = base64.b64encode(f'customer0:{self.PASSWORD}'.encode()).decode()
+        basic = await self.async_client.get(list_url, headers={'Authorization': f'Basic {credentials}'})
+        self.assertEqual(basic.json()['count'], self.CUSTOMER_REQUESTS)
+
+        await self.async_client.aforce_login(self.customer_user)
+        created = await self.async_client.post(
+            list_url, {'customer': self.customer.pk, 'service_type': 'Gas Leak', 'description': 'Smell of gas', 'priority': 'High'}
+        )
+        self.assertEqual(created.status_code, 201)
+        self.assertEqual((await self.async_client.get(list_url)).json()['count'], self.CUSTOMER_REQUESTS + 1)
+        await self.async_client.alogout()
+        self.assertEqual((await self.async_client.get(list_url)).status_code, 403)
+
+    async def test_dashboard(self):
+        await self.async_client.aforce_login(self.customer_user)
+        for query in ('', '?page=2&status=Pending', '?page=99', '?page=x'):
+            expected = await self.sync_get(self.customer_user, reverse('dashboard') + query)
+            response = await self.async_client.get(reverse('dashboard') + query)
+            self.assertEqual(response.status_code, 200)
+            page, expected_page = response.context['requests'], expected.context['requests']
+            self.assertEqual(page.number, expected_page.number, query)
+            self.assertEqual(page.paginator.count, expected_page.paginator.count, query)
+            self.assertEqual([row.pk for row in page], [row.pk for row in expected_page], query)
+
+        await self.async_client.aforce_login(self.staff_user)
+        response = await self.async_client.get(reverse('dashboard'))
+        self.assertRedirects(response, reverse('support_dashboard'), fetch_redirect_response=False)
+
+    async def test_middleware_measures_async_requests(self):
+        metrics.registry.reset()
+        await self.async_client.aforce_login(self.staff_user)
+        with override_settings(SERVER_TIMING=True):
+            response = await self.async_client.get(reverse('servicerequest-list'))
+        self.assertRegex(response.headers['Server-Timing'], r'sql;dur=[0-9.]+;desc="[1-9][0-9]* queries"')
+        self.assertIn('serializer', response.headers['Server-Timing'])
+        labels = ('servicerequest-list',)
+        self.assertGreater(metrics.registry.counters['gas_utility_db_queries_total', labels], 0)
+
+
+class ConditionalRequestTests(ServiceDataTestCase):
+    """ETags, 304s and If-Match on the service request API."""
+
+    def setUp(self):
+        self.client.force_login(self.staff_user)
+        self.detail_url = reverse('servicerequest-detail', args=[self.customer_request.pk])
+        self.list_url = reverse('servicerequest-list')
+
+    def test_unchanged_request_is_not_modified(self):
+        response = self.client.get(self.detail_url)
+        etag = response['ETag']
+        self.assertIn('no-cache', response['Cache-Control'])
+        self.assertIn('Last-Modified', response)
+
+        with query_budget(2, SQL_TIME_BUDGET):
+            response = self.client.get(self.detail_url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+        ServiceRequest.objects.filter(pk=self.customer_request.pk).set_status('Resolved')
+        response = self.client.get(self.detail_url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()['status'], 'Resolved')
+
+    def test_unchanged_list_is_not_modified(self):
+        url = self.list_url + '?status=Pending&page=2'
+        etag = self.client.get(url)['ETag']
+        self.assertNotEqual(self.client.get(self.list_url + '?status=Resolved')['ETag'], etag)
+
+        with query_budget(2, SQL_TIME_BUDGET):
+            response = self.client.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+
+        ServiceRequest.objects.filter(status='Pending').order_by('pk').first().delete()
+        self.assertEqual(self.client.get(url, headers={'If-None-Match': etag}).status_code, 200)
+
+        cursor_url = self.list_url + '?pagination=cursor'
+        etag = self.client.get(cursor_url)['ETag']
+        self.assertEqual(self.client.get(cursor_url, headers={'If-None-Match': etag}).status_code, 304)
+        newest = ServiceRequest.objects.order_by('-created_at').first()
+        ServiceRequest.objects.filter(pk=newest.pk).set_status('Resolved' if newest.status != 'Resolved' else 'Pending')
+        self.assertEqual(self.client.get(cursor_url, headers={'If-None-Match': etag}).status_code, 200)
+
+    def test_deleting_the_assignee_changes_validators(self):
+        rep = self.reps[-1]
+        ServiceRequest.objects.filter(pk=self.customer_request.pk).assign(rep)
+        etag = self.client.get(self.detail_url)['ETag']
+        list_etag = self.client.get(self.list_url)['ETag']
+
+        rep.delete()
+        response = self.client.get(self.detail_url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.json()['assigned_to'])
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertNotEqual(self.client.get(self.list_url)['ETag'], list_etag)
+
+    def test_patch_honours_if_match(self):
+        etag = self.client.get(self.detail_url)['ETag']
+        ServiceRequest.objects.filter(pk=self.customer_request.pk).set_status('In Progress')
+
+        response = self.client.patch(
+            self.detail_url, {'status': 'Resolved'}, content_type='application/json', headers={'If-Match': etag}
+        )
+        self.assertEqual(response.status_code, 412)
+        self.assertEqual(ServiceRequest.objects.get(pk=self.customer_request.pk).status, 'In Progress')
+
+        etag = self.client.get(self.detail_url)['ETag']
+        response = self.client.patch(
+            self.detail_url, {'status': 'Resolved'}, content_type='application/json', headers={'If-Match': etag}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['ETag'], self.client.get(self.detail_url)['ETag'])
+
+    async def test_async_views_send_the_same_validators(self):
+        await self.async_client.aforce_login(self.staff_user)
+        for url in (self.detail_url, self.list_url + '?priority=High'):
+            etag = (await sync_to_async(self.client.get)(url))['ETag']
+            response = await self.async_client.get(url)
+            self.assertEqual(response['ETag'], etag)
+            response = await self.async_client.get(url, headers={'If-None-Match': etag})
+            self.assertEqual(response.status_code, 304)
+
+
+def parse_events(text):
+    """Split a text/event-stream body into (event, data) pairs."""
+    events = []
+    for block in text.strip().split('\n\n'):
+        fields = dict(line.split(': ', 1) for line in block.split('\n') if not line.startswith(':'))
+        if 'event' in fields:
+            events.append((fields['event'], json.loads(fields['data'])))
+    return events
+
+
+@override_settings(LIVE_UPDATES_POLL_INTERVAL=0.01)
+class LiveDashboardTests(ServiceDataTestCase):
+    """The change feed and the support dashboard's event stream."""
+
+    # The stream is only routed under ASGI
+    events_url = reverse_lazy('support_dashboard_events', urlconf=asgi_urls)
+
+    def changes_since(self, start):
+        return list(
+            ServiceRequestChange.objects.filter(id__gt=start).order_by('id').values_list('service_request_id', 'kind')
+        )
+
+    def test_writes_record_changes(self):
+        start = ServiceRequestChange.objects.latest_id()
+        request = ServiceRequest.objects.get(pk=self.other_request.pk)
+        request.notes = 'Checked'
+        request.save()
+        request.status = 'Resolved' if request.status != 'Resolved' else 'Pending'
+        request.assigned_to = self.reps[1] if request.assigned_to != self.reps[1] else None
+        request.save()
+        selected = ServiceRequest.objects.filter(pk__in=[self.customer_request.pk])
+        selected.assign(self.staff_rep)
+        created = ServiceRequest.objects.create(customer=self.customer, service_type='Gas Leak', description='Leak')
+        created_id = created.pk
+        created.delete()
+        self.assertEqual(self.changes_since(start), [
+            (request.pk, 'status'), (request.pk, 'assignment'),
+            (self.customer_request.pk, 'assignment'),
+            (created_id, 'created'), (created_id, 'deleted'),
+        ])
+
+        start = ServiceRequestChange.objects.latest_id()
+        with mock.patch('requests.models.CHANGE_FEED_ROW_LIMIT', 5):
+            ServiceRequest.objects.all().set_status('In Progress')
+        self.assertEqual(self.changes_since(start), [(None, 'bulk')])
+
+    def test_read_changes_merges_changes_per_request(self):
+        start = ServiceRequestChange.objects.latest_id()
+        ServiceRequest.objects.filter(pk=self.other_request.pk).set_status('Resolved')
+        ServiceRequest.objects.filter(pk=self.other_request.pk).assign(self.reps[2])
+        created = ServiceRequest.objects.create(customer=self.customer, service_type='Gas Leak', description='Leak')
+        ServiceRequest.objects.filter(pk=self.customer_request.pk).delete()
+
+        text, position = read_changes(start)
+        self.assertEqual(position, ServiceRequestChange.objects.latest_id())
+        events = parse_events(text)
+        self.assertEqual([event for event, data in events], ['request', 'request', 'deleted', 'totals'])
+        self.assertEqual(events[0][1]['id'], self.other_request.pk)
+        self.assertEqual(events[0][1]['changes'], ['status', 'assignment'])
+        self.assertEqual(events[0][1]['assigned_to'], self.reps[2].get_full_name())
+        self.assertEqual(events[1][1]['changes'], ['created'])
+        self.assertEqual(events[1][1]['customer'], 'Customer 0')
+        self.assertEqual(events[2][1], {'id': self.customer_request.pk})
+        self.assertEqual(events[3][1]['total'], ServiceRequest.objects.count())
+
+        with mock.patch('requests.live.READ_LIMIT', 2):
+            self.assertEqual([event for event, data in parse_events(read_changes(start)[0])], ['reload', 'totals'])
+        self.assertEqual(read_changes(position), ('', position))
+
+    async def test_feed_sends_changes_that_commit_out_of_order(self):
+        feed = ChangeFeed()
+        queue, start = await feed.subscribe()
+        # On PostgreSQL, a transaction can commit after one that was given a higher id
+        await ServiceRequestChange.objects.acreate(
+            id=start + 2, service_request_id=self.other_request.pk, kind=ServiceRequestChange.ASSIGNMENT
+        )
+        [(event, data)] = parse_events(await asyncio.wait_for(queue.get(), 5))
+        self.assertEqual((event, data['id']), ('request', self.other_request.pk))
+        self.assertEqual(list(feed.missing), [start + 1])
+
+        await ServiceRequestChange.objects.acreate(
+            id=start + 1, service_request_id=self.customer_request.pk, kind=ServiceRequestChange.ASSIGNMENT
+        )
+        [(event, data)] = parse_events(await asyncio.wait_for(queue.get(), 5))
+        self.assertEqual((event, data['id']), ('request', self.customer_request.pk))
+        self.assertEqual(feed.missing, {})
+        self.assertEqual(feed.position, start + 2)
+        feed.unsubscribe(queue)
+
+    def test_skipped_ids_are_given_up_on(self):
+        start = ServiceRequestChange.objects.latest_id()
+        ServiceRequestChange.objects.create(
+            id=start + 3, service_request_id=self.other_request.pk, kind=ServiceRequestChange.ASSIGNMENT
+        )
+        missing = {}
+        text, position = read_changes(start, missing=missing)
+        self.assertEqual(position, start + 3)
+        self.assertEqual(sorted(missing), [start + 1, start + 2])
+
+        ServiceRequestChange.objects.create(
+            id=start + 1, service_request_id=self.customer_request.pk, kind=ServiceRequestChange.ASSIGNMENT
+        )
+        with mock.patch('requests.live.time.monotonic', return_value=time.monotonic() + LATE_COMMIT_WINDOW + 1):
+            self.assertEqual(read_changes(position, missing=missing), ('', position))
+        self.assertEqual(missing, {})
+
+    async def test_stream_pushes_changes(self):
+        await self.async_client.aforce_login(self.staff_user)
+        response = await self.async_client.get(self.events_url)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = aiter(response.streaming_content)
+        self.assertTrue((await anext(stream)).startswith(b'retry: '))
+
+        await ServiceRequest.objects.filter(pk=self.other_request.pk).aupdate(assigned_to=self.reps[3])
+        [(event, data)] = parse_events((await asyncio.wait_for(anext(stream), 5)).decode())
+        self.assertEqual((event, data['id'], data['changes']), ('request', self.other_request.pk, ['assignment']))
+
+        await self.async_client.aforce_login(self.customer_user)
+        response = await self.async_client.get(self.events_url)
+        self.assertEqual(response.status_code, 403)
+
+    async def test_reconnecting_stream_gets_missed_changes(self):
+        feed = ChangeFeed()
+        start = await sync_to_async(ServiceRequestChange.objects.latest_id)()
+        created = await ServiceRequest.objects.acreate(customer=self.customer, service_type='Other', description='New')
+        stream = event_stream(feed, last_event_id=start)
+        await anext(stream)
+        events = parse_events(await anext(stream))
+        self.assertEqual([event for event, data in events], ['request', 'totals'])
+        self.assertEqual(events[0][1]['id'], created.pk)
+        self.assertEqual(len(feed.streams), 1)
+        await stream.aclose()
+        self.assertFalse(feed.streams)
+
+    async def test_dashboard_connects_only_under_asgi(self):
+        await self.async_client.aforce_login(self.staff_user)
+        response = await self.async_client.get(reverse('support_dashboard'))
+        self.assertTrue(response.context['live_insert'])
+        latest_id = await sync_to_async(ServiceRequestChange.objects.latest_id)()
+        self.assertEqual(response.context['live_events_url'], f'{self.events_url}?after={latest_id}')
+        response = await self.async_client.get(reverse('support_dashboard') + '?status=Pending')
+        self.assertFalse(response.context['live_insert'])
+
+        await sync_to_async(self.client.force_login)(self.staff_user)
+        response = await sync_to_async(self.client.get)(reverse('support_dashboard'))
+        self.assertNotIn('live_events_url', response.context)
+
+
+class SupportPageQueryBudgetTests(ServiceDataTestCase):
+    """Query budgets for the support staff pages and bulk actions."""
+
+    def setUp(self):
+        self.client.force_login(self.staff_user)
+
+    def test_customer_dashboard_redirects(self):
+        with query_budget(1, SQL_TIME_BUDGET):
+            response = self.client.get(reverse('dashboard'))
+        self.assertRedirects(response, reverse('support_dashboard'), fetch_redirect_response=False)
+
+    def test_support_dashboard(self):
+        with query_budget(5, SQL_TIME_BUDGET):
+            response = self.client.get(reverse('support_dashboard'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['service_requests']), 15)
+
+    def test_support_dashboard_filtered(self):
+        with query_budget(4, SQL_TIME_BUDGET):
+            response = self.client.get(reverse('support_dashboard'), {
+                'status': 'Pending', 'priority': 'High', 'assigned': 'me', 'sort': '-priority', 'page': 1,
+            })
+        self.assertEqual(response.status_code, 200)
+
+    def test_support_dashboard_export_links_keep_filters(self):
+        response = self.client.get(reverse('support_dashboard'), {'status': 'Pending', 'page': 2})
+        self.assertContains(response, '/api/service-requests/export/?format=csv&amp;status=Pending"')
+
+    def test_support_dashboard_search(self):
+        with query_budget(5, SQL_TIME_BUDGET):
+            response = self.client.get(reverse('support_dashboard'), {'q': 'meter'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context['service_requests'])
+
+    def test_bulk_update_status(self):
+        selected = list(ServiceRequest.objects.values_list('id', flat=True)[:10])
+        with query_budget(16, SQL_TIME_BUDGET):
+            response = self.client.post(reverse('support_dashboard'), {
+                'action': 'update_status', 'new_status': 'Resolved', 'selected_requests': selected,
+            })
+        self.assertRedirects(response, reverse('support_dashboard'), fetch_redirect_response=False)
+        self.assertEqual(ServiceRequest.objects.filter(id__in=selected, status='Resolved').count(), 10)
+
+    def test_bulk_assign(self):
+        selected = list(ServiceRequest.objects.values_list('id', flat=True)[:10])
+        with query_budget(14, SQL_TIME_BUDGET):
+            response = self.client.post(reverse('support_dashboard'), {
+                'action': 'assign', 'support_rep': self.staff_rep.id, 'selected_requests': selected,
+            })
+        self.assertRedirects(response, reverse('support_dashboard'), fetch_redirect_response=False)
+        self.assertEqual(ServiceRequest.objects.filter(id__in=selected, assigned_to=self.staff_rep).count(), 10)
+
+    def test_bulk_unassign(self):
+        selected = list(ServiceRequest.objects.values_list('id', flat=True)[:10])
+        with query_budget(13, SQL_TIME_BUDGET):
+            response = self.client.post(reverse('support_dashboard'), {
+                'action': 'assign', 'support_rep': '', 'selected_requests': selected,
+            })
+        self.assertRedirects(response, reverse('support_dashboard'), fetch_redirect_response=False)
+        self.assertFalse(ServiceRequest.objects.filter(id__in=selected, assigned_to__isnull=False).exists())
+
+    def test_bulk_update_status_scales_to_large_selections(self):
+        selected = list(ServiceRequest.objects.values_list('id', flat=True)) + list(range(100000, 101500))
+        with query_budget(40, SQL_TIME_BUDGET):
+            response = self.client.post(reverse('support_dashboard'), {
+                'action': 'update_status', 'new_status': 'In Progress', 'selected_requests': selected,
+            }, follow=False)
+        self.assertRedirects(response, reverse('support_dashboard'), fetch_redirect_response=False)
+        self.assertEqual(ServiceRequest.objects.exclude(status='In Progress').count(), 0)
+        self.assertEqual(ServiceRequestCounter.objects.verify(), {})
+
+    def test_bulk_update_status_keeps_resolved_at(self):
+        resolved = ServiceRequest.objects.filter(status='Resolved').first()
+        pending = ServiceRequest.objects.filter(status='Pending').first()
+        self.client.post(reverse('support_dashboard'), {
+            'action': 'update_status', 'new_status': 'Resolved', 'selected_requests': [resolved.id, pending.id],
+        })
+        resolved_again = ServiceRequest.objects.get(id=resolved.id)
+        pending.refresh_from_db()
+        self.assertEqual(resolved_again.resolved_at, resolved.resolved_at)
+        self.assertIsNotNone(pending.resolved_at)
+        self.assertGreater(pending.updated_at, resolved.updated_at)
+
+        self.client.post(reverse('support_dashboard'), {
+            'action': 'update_status', 'new_status': 'In Progress', 'selected_requests': [resolved.id, pending.id],
+        })
+        self.assertFalse(ServiceRequest.objects.filter(id__in=[resolved.id, pending.id], resolved_at__isnull=False).exists())
+
+    def test_bulk_update_status_rejects_unknown_status(self):
+        response = self.client.post(reverse('support_dashboard'), {
+            'action': 'update_status', 'new_status': 'Bogus', 'selected_requests': [self.customer_request.id],
+        })
+        self.assertRedirects(response, reverse('support_dashboard'), fetch_redirect_response=False)
+        self.assertFalse(ServiceRequest.objects.filter(status='Bogus').exists())
+
+    def test_bulk_assign_reports_rows_changed(self):
+        selected = [self.customer_request.id, self.other_request.id, 999999, 'abc']
+        response = self.client.post(reverse('support_dashboard'), {
+            'action': 'assign', 'support_rep': self.staff_rep.id, 'selected_requests': selected,
+        }, follow=True)
+        self.assertContains(response, f'Assigned 2 service requests to {self.staff_rep.get_full_name()}.')
+
+    def test_support_request_detail(self):
+        with query_budget(5, SQL_TIME_BUDGET):
+            response = self.client.get(reverse('support_request_detail', args=[self.customer_request.id]))
+        self.assertEqual(response.status_code, 200)
+
+    def test_support_request_update(self):
+        with query_budget(15, SQL_TIME_BUDGET):
+            response = self.client.post(reverse('support_request_detail', args=[self.customer_request.id]), {
+                'status': 'In Progress', 'priority': 'High', 'notes': 'Engineer dispatched',
+                'assigned_to': self.staff_rep.id,
+            })
+        self.assertRedirects(
+            response, reverse('support_request_detail', args=[self.customer_request.id]),
+            fetch_redirect_response=False
+        )
+
+    def test_delete_request(self):
+        with query_budget(9, SQL_TIME_BUDGET):
+            response = self.client.post(reverse('delete_request', args=[self.other_request.id]))
+        self.assertRedirects(response, reverse('support_dashboard'), fetch_redirect_response=False)
+        self.assertFalse(ServiceRequest.objects.filter(id=self.other_request.id).exists())
+
+
+class ServiceRequestApiQueryBudgetTests(ServiceDataTestCase):
+    """Query budgets for /api/service-requests/ as a customer and as support staff."""
+
+    def test_list_as_customer(self):
+        self.client.force_login(self.customer_user)
+        with query_budget(4, SQL_TIME_BUDGET):
+            response = self.client.get('/api/service-requests/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['count'], self.CUSTOMER_REQUESTS)
+
+    def test_list_as_staff(self):
+        self.client.force_login(self.staff_user)
+        with query_budget(3, SQL_TIME_BUDGET):
+            response = self.client.get('/api/service-requests/', {'status': 'Pending', 'ordering': 'priority'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_list_search_as_staff(self):
+        self.client.force_login(self.staff_user)
+        with query_budget(4, SQL_TIME_BUDGET):
+            response = self.client.get('/api/service-requests/', {'search': 'meter'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_cursor_list_as_staff(self):
+        self.client.force_login(self.staff_user)
+        with query_budget(3, SQL_TIME_BUDGET):
+            response = self.client.get('/api/service-requests/', {'pagination': 'cursor'})
+        self.assertEqual(response.status_code, 200)
+        with query_budget(3, SQL_TIME_BUDGET):
+            response = self.client.get(response.json()['next'])
+        self.assertEqual(response.status_code, 200)
+
+    def test_list_sparse_fields_as_staff(self):
+        self.client.force_login(self.staff_user)
+        with query_budget(3, SQL_TIME_BUDGET) as budget:
+            response = self.client.get('/api/service-requests/', {'fields': 'id,status,priority'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.json()['results'][0]), {'id', 'status', 'priority'})
+        page_query = budget.queries[-1]['sql']
+        self.assertNotIn('"description"', page_query)
+        self.assertNotIn('"notes"', page_query)
+        self.assertNotIn('JOIN', page_query)
+
+    def test_cursor_list_sparse_fields_with_expand(self):
+        self.client.force_login(self.staff_user)
+        params = {'pagination': 'cursor', 'fields': 'id,status', 'expand': 'customer', 'ordering': 'priority'}
+        with query_budget(2, SQL_TIME_BUDGET):
+            response = self.client.get('/api/service-requests/', params)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.json()['results'][0]), {'id', 'status', 'customer_details'})
+        with query_budget(2, SQL_TIME_BUDGET):
+            response = self.client.get(response.json()['next'])
+        self.assertEqual(set(response.json()['results'][0]), {'id', 'status', 'customer_details'})
+
+    def test_list_default_fields_leave_out_notes(self):
+        self.client.force_login(self.staff_user)
+        with query_budget(4, SQL_TIME_BUDGET) as budget:
+            response = self.client.get('/api/service-requests/')
+        expected = [name for name in ServiceRequestSerializer.Meta.fields if name != 'notes']
+        self.assertEqual(list(response.json()['results'][0]), expected)
+        page_query = next(query['sql'] for query in budget.queries if 'LIMIT' in query['sql'])
+        self.assertNotIn('"notes"', page_query)
+        response = self.client.get('/api/service-requests/', {'fields': 'id,notes'})
+        self.assertEqual(set(response.json()['results'][0]), {'id', 'notes'})
+        response = self.client.get(f'/api/service-requests/{self.customer_request.id}/')
+        self.assertEqual(list(response.json()), ServiceRequestSerializer.Meta.fields)
+
+    def test_list_rejects_unknown_fields(self):
+        self.client.force_login(self.staff_user)
+        response = self.client.get('/api/service-requests/', {'fields': 'id,secret', 'expand': 'owner'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.json()), {'fields', 'expand'})
+
+    def test_retrieve_as_customer(self):
+        self.client.force_login(self.customer_user)
+        with query_budget(2, SQL_TIME_BUDGET):
+            response = self.client.get(f'/api/service-requests/{self.customer_request.id}/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_statistics_as_staff(self):
+        self.client.force_login(self.staff_user)
+        with query_budget(3, SQL_TIME_BUDGET):
+            response = self.client.get('/api/service-requests/statistics/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['total'], ServiceRequest.objects.count())
+
+    def test_statistics_as_customer(self):
+        self.client.force_login(self.customer_user)
+        with query_budget(1, SQL_TIME_BUDGET):
+            response = self.client.get('/api/service-requests/statistics/')
+        self.assertEqual(response.status_code, 403)
+
+    def test_export_csv_as_staff(self):
+        self.client.force_login(self.staff_user)
+        with query_budget(2, SQL_TIME_BUDGET):
+            response = self.client.get('/api/service-requests/export/', {'format': 'csv', 'status': 'Pending'})
+            rows = list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/csv'))
+        self.assertIn('attachment; filename="service-requests-', response['Content-Disposition'])
+        self.assertEqual(rows[0], EXPORT_COLUMNS)
+        self.assertEqual(len(rows) - 1, ServiceRequest.objects.filter(status='Pending').count())
+        self.assertEqual({row[EXPORT_COLUMNS.index('status')] for row in rows[1:]}, {'Pending'})
+
+    def test_export_ndjson_uses_dashboard_filters(self):
+        self.client.force_login(self.staff_user)
+        ServiceRequest.objects.filter(id=self.customer_request.id).update(description='=HYPERLINK("x") corroded valve')
+        response = self.client.get('/api/service-requests/export/', {
+            'format': 'ndjson', 'q': 'corroded', 'assigned': 'unassigned', 'sort': 'relevance',
+        })
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson; charset=utf-8')
+        expected = ServiceRequest.objects.search('corroded').filter(assigned_to__isnull=True)
+        self.assertEqual([row['id'] for row in rows], list(expected.values_list('id', flat=True)))
+        self.assertEqual(list(rows[0]), EXPORT_COLUMNS)
+
+    def test_export_csv_neutralizes_formulas(self):
+        self.client.force_login(self.staff_user)
+        ServiceRequest.objects.filter(id=self.customer_request.id).update(description='=SUM(A1:A9)')
+        response = self.client.get('/api/service-requests/export/', {'format': 'csv'})
+        self.assertIn("'=SUM(A1:A9)", b''.join(response.streaming_content).decode())
+
+    def test_export_as_customer(self):
+        self.client.force_login(self.customer_user)
+        response = self.client.get('/api/service-requests/export/', {'format': 'ndjson'})
+        self.assertEqual(response.status_code, 403)
+
+    def test_create_as_customer(self):
+        self.client.force_login(self.customer_user)
+        with query_budget(9, SQL_TIME_BUDGET):
+            response = self.client.post('/api/service-requests/', {
+                'customer': self.customer.id, 'service_type': 'Meter Problem',
+                'description': 'Meter display is blank', 'priority': 'Low',
+            })
+        self.assertEqual(response.status_code, 201)
+
+    def test_partial_update_as_staff(self):
+        self.client.force_login(self.staff_user)
+        with query_budget(13, SQL_TIME_BUDGET):
+            response = self.client.patch(
+                f'/api/service-requests/{self.customer_request.id}/',
+                {'status': 'Resolved'}, content_type='application/json'
+            )
+        self.assertEqual(response.status_code, 200)
+
+    def test_destroy_as_staff(self):
+        self.client.force_login(self.staff_user)
+        with query_budget(9, SQL_TIME_BUDGET):
+            response = self.client.delete(f'/api/service-requests/{self.other_request.id}/')
+        self.assertEqual(response.status_code, 204)
+
+    def test_batch_create_as_customer(self):
+        self.client.force_login(self.customer_user)
+        items = [
+            {'customer': self.customer.id, 'service_type': 'Gas Leak', 'description': f'Leak {index}', 'priority': 'High'}
+            for index in range(50)
+        ]
+        with query_budget(11, SQL_TIME_BUDGET):
+            response = self.client.post('/api/service-requests/batch/', items, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([item['description'] for item in response.json()], [item['description'] for item in items])
+        self.assertEqual(ServiceRequest.objects.filter(description__startswith='Leak ').count(), 50)
+        self.assertEqual(ServiceRequestCounter.objects.verify(), {})
+
+    def test_batch_create_rejects_invalid_items(self):
+        self.client.force_login(self.customer_user)
+        other_customer = self.customers[1]
+        items = [
+            {'customer': self.customer.id, 'service_type': 'Gas Leak', 'description': 'Valid item'},
+            {'customer': other_customer.id, 'service_type': 'Gas Leak', 'description': 'Someone else'},
+            {'customer': self.customer.id, 'service_type': 'Unknown', 'description': 'Bad type'},
+        ]
+        response = self.client.post('/api/service-requests/batch/', items, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        errors = response.json()
+        self.assertEqual(errors[0], {})
+        self.assertIn('customer', errors[1])
+        self.assertIn('service_type', errors[2])
+        self.assertFalse(ServiceRequest.objects.filter(description='Valid item').exists())
+
+    def test_batch_update_as_staff(self):
+        self.client.force_login(self.staff_user)
+        targets = list(ServiceRequest.objects.values_list('id', flat=True)[:50])
+        items = [
+            {'id': pk, 'status': 'Resolved' if index % 2 else 'In Progress', 'notes': f'Batch note {index}'}
+            for index, pk in enumerate(targets)
+        ]
+        statuses = ServiceRequest.objects.in_bulk(targets)
+        changed = sum(1 for item in items if statuses[item['id']].status != item['status'])
+        with query_budget(31, SQL_TIME_BUDGET):
+            response = self.client.patch('/api/service-requests/batch/', items, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item['id'] for item in response.json()], targets)
+        self.assertEqual(ServiceRequest.objects.filter(id__in=targets, status='Resolved', resolved_at__isnull=False).count(), 25)
+        self.assertEqual(ServiceRequest.objects.filter(id__in=targets, status='In Progress', resolved_at__isnull=True).count(), 25)
+        self.assertEqual(
+            list(ServiceRequestEvent.objects.filter(service_request_id=targets[3], kind='note').values_list('body', flat=True)),
+            ['Batch note 3']
+        )
+        self.assertEqual(ServiceRequestEvent.objects.filter(service_request_id__in=targets, kind='status').count(), changed)
+        self.assertEqual(ServiceRequestCounter.objects.verify(), {})
+
+    def test_batch_update_reports_per_item_errors(self):
+        self.client.force_login(self.customer_user)
+        second_request = ServiceRequest.objects.filter(customer=self.customer).exclude(id=self.customer_request.id).first()
+        items = [
+            {'id': self.customer_request.id, 'priority': 'Urgent'},
+            {'id': self.other_request.id, 'priority': 'Urgent'},
+            {'id': self.customer_request.id, 'priority': 'Low'},
+            {'priority': 'Low'},
+            {'id': second_request.id, 'status': 'Resolved'},
+        ]
+        response = self.client.patch('/api/service-requests/batch/', items, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        errors = response.json()
+        self.assertEqual(errors[0], {})
+        self.assertEqual(errors[1], {'id': ['Not found.']})
+        self.assertEqual(errors[2], {'id': ['Duplicate id in batch.']})
+        self.assertIn('id', errors[3])
+        self.assertIn('non_field_errors', errors[4])
+        self.assertNotEqual(ServiceRequest.objects.get(id=self.customer_request.id).priority, 'Urgent')
 
-# Create your tests here.
@@ -2,7 +2,7 @@ from django.urls import path, include
 from django.shortcuts import redirect
 from rest_framework.routers import DefaultRouter
 from .views import (
-    dashboard, submit_request, request_detail,
+    dashboard, submit_request, request_detail, request_attachment,
     support_dashboard, support_request_detail, delete_request,
     ServiceRequestViewSet
 )
@@ -23,6 +23,7 @@ urlpatterns = [
     path('dashboard/', dashboard, name='dashboard'),
     path('submit-request/', submit_request, name='submit_request'),
     path('request/<int:request_id>/', request_detail, name='request_detail'),
+    path('request/<int:request_id>/attachment/', request_attachment, name='request_attachment'),
     
     # Support staff URLs
     path('support/dashboard/', support_dashboard, name='support_dashboard'),
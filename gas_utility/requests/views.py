@@ -1,14 +1,17 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.views.decorators.http import require_http_methods
-from django.utils.timezone import now
 from django.contrib import messages
-from django.db.models import Q, Count, F
+from django.db import transaction
+from django.db.models import F
+from django.core.exceptions import ValidationError as DjangoValidationError
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
-from django.http import JsonResponse, HttpResponseForbidden
+from django.http import Http404, JsonResponse, HttpResponseForbidden
 from django.views.decorators.cache import cache_page
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
 from django.utils.decorators import method_decorator
 from django.views.generic import ListView, DetailView, CreateView, UpdateView
+from django.urls import NoReverseMatch, reverse
 
 from rest_framework import viewsets, permissions, status, filters
 from rest_framework.decorators import action
@@ -17,15 +20,23 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.exceptions import ValidationError
 from django_filters.rest_framework import DjangoFilterBackend
 
-from accounts.models import User, Customer, SupportRepresentative
-from .models import ServiceRequest
+from accounts.models import User, SupportRepresentative
+from .attachments import attachment_response, use_attachment_upload_handler
+from .conditional import Validators, has_conditions, list_state, request_state
+from .exports import CSVRenderer, NDJSONRenderer, export_response
+from .models import (
+    ServiceRequest, ServiceRequestChange, ServiceRequestCounter, ServiceRequestEvent, queue_status_notifications
+)
+from .pagination import CountedPageNumberPagination, KeysetCursorPagination
 from .forms import ServiceRequestForm, ServiceRequestUpdateForm
 from .serializers import (
     ServiceRequestSerializer, ServiceRequestCreateSerializer,
-    ServiceRequestUpdateSerializer, ServiceRequestStatisticsSerializer
+    ServiceRequestUpdateSerializer, ServiceRequestStatisticsSerializer,
+    ServiceRequestBatchSerializer
 )
 
 import logging
+from collections import Counter
 
 # Set up logger
 logger = logging.getLogger(__name__)
@@ -55,32 +66,113 @@ class IsOwnerOrSupportStaff(permissions.BasePermission):
             return True
         
         # Check if the object has a customer field directly
-        if hasattr(obj, 'customer'):
-            try:
-                customer = Customer.objects.get(user=request.user)
-                return obj.customer == customer
-            except Customer.DoesNotExist:
-                return False
+        if hasattr(obj, 'customer_id'):
+            customer_id = request.profiles.ids()[0]
+            return customer_id is not None and obj.customer_id == customer_id
         
         # For other cases, deny access
         return False
 
+# Custom filters
+class FullTextSearchFilter(filters.SearchFilter):
+    """
+    DRF search backed by the service request full-text index.
+
+    Results are ranked by relevance unless the client passes an explicit ordering.
+    Must come after OrderingFilter in ``filter_backends`` so the ranking survives.
+    """
+    def filter_queryset(self, request, queryset, view):
+        search_text = self.get_search_terms(request)
+        if not search_text.strip():
+            return queryset
+        
+        queryset = queryset.search(search_text)
+        if filters.OrderingFilter.ordering_param in request.query_params:
+            queryset = filters.OrderingFilter().filter_queryset(request, queryset, view)
+        return queryset
+
+def statistics_data(breakdown, resolution):
+    """
+    Shape the statistics endpoint's response from the counters table breakdown
+    and ServiceRequestQuerySet.resolution_stats().
+    """
+    # The counters table holds every count; fold it into the headline numbers
+    by_status, by_service_type, by_priority = Counter(), Counter(), Counter()
+    for row in breakdown:
+        by_status[row['status']] += row['count']
+        by_service_type[row['service_type']] += row['count']
+        by_priority[row['priority']] += row['count']
+
+    def to_days(delta):
+        return delta.total_seconds() / (60 * 60 * 24) if delta is not None else None
+
+    return {
+        'total': sum(by_status.values()),
+        'pending': by_status['Pending'],
+        'in_progress': by_status['In Progress'],
+        'resolved': by_status['Resolved'],
+        'by_service_type': [
+            {'service_type': service_type, 'count': count}
+            for service_type, count in sorted(by_service_type.items(), key=lambda item: (-item[1], item[0]))
+        ],
+        'by_priority': [
+            {'priority': priority, 'count': count}
+            for priority, count in sorted(by_priority.items())
+        ],
+        'avg_resolution_days': to_days(resolution['avg']),
+        'p50_resolution_days': to_days(resolution['p50']),
+        'p90_resolution_days': to_days(resolution['p90']),
+    }
+
 # API ViewSets
 class ServiceRequestViewSet(viewsets.ModelViewSet):
     """
     API endpoint that allows service requests to be viewed or edited.
     """
     queryset = ServiceRequest.objects.all()
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter, FullTextSearchFilter]
     filterset_fields = ['status', 'priority', 'service_type']
     search_fields = ['description', 'customer__user__username', 'customer__user__email']
     ordering_fields = ['created_at', 'updated_at', 'priority', 'status']
     ordering = ['-created_at']
+    pagination_class = CountedPageNumberPagination
+    cursor_pagination_class = KeysetCursorPagination
+    
+    # ServiceRequestQuerySet method that loads the related rows each action renders,
+    # so a page costs the same number of queries whatever its size
+    query_profiles = {
+        'list': 'with_serializer_related',
+        'retrieve': 'with_serializer_related',
+    }
+    
+    @property
+    def paginator(self):
+        """
+        Use keyset pagination when the client asks for it with ``?pagination=cursor``
+        (or follows a ``cursor`` link); otherwise keep the default page-number pagination.
+        """
+        if not hasattr(self, '_paginator'):
+            params = self.request.query_params
+            if 'cursor' in params or params.get('pagination') == 'cursor':
+                self._paginator = self.cursor_pagination_class()
+            else:
+                return super().paginator
+        return self._paginator
+    
+    # Largest list accepted by the batch actions
+    batch_max_size = 1000
+    
+    def initialize_request(self, request, *args, **kwargs):
+        request = super().initialize_request(request, *args, **kwargs)
+        # Only creates take attachments; the body is parsed later, on first access
+        if self.action in ['create', 'batch']:
+            use_attachment_upload_handler(request)
+        return request
     
     def get_serializer_class(self):
-        if self.action == 'create':
+        if self.action in ['create', 'batch']:
             return ServiceRequestCreateSerializer
-        elif self.action in ['update', 'partial_update']:
+        elif self.action in ['update', 'partial_update', 'batch_update']:
             return ServiceRequestUpdateSerializer
         return ServiceRequestSerializer
     
@@ -92,6 +184,8 @@ class ServiceRequestViewSet(viewsets.ModelViewSet):
             permission_classes = [IsAuthenticated]
         elif self.action in ['update', 'partial_update', 'destroy']:
             permission_classes = [IsAuthenticated, IsOwnerOrSupportStaff]
+        elif self.action in ['export']:
+            permission_classes = [IsAuthenticated, IsSupportStaff]
         else:
             permission_classes = [IsAuthenticated]
         return [permission() for permission in permission_classes]
@@ -104,24 +198,186 @@ class ServiceRequestViewSet(viewsets.ModelViewSet):
         
         # Support staff can see all service requests
         if user.role == 'support_staff':
-            return ServiceRequest.objects.all()
+            queryset = ServiceRequest.objects.all()
+        else:
+            # Regular users can only see their own service requests; filtering through
+            # the join needs no query here, so async views can build the queryset too
+            queryset = ServiceRequest.objects.filter(customer__user=user)
+        
+        profile = self.query_profiles.get(self.action)
+        if profile:
+            queryset = getattr(queryset, profile)(**self.get_sparse_query_kwargs(queryset))
+        return queryset
+    
+    def get_serializer_context(self):
+        # Lists leave out the fields ServiceRequestSerializer only shows one request at a time
+        return {**super().get_serializer_context(), 'listing': self.action == 'list'}
+    
+    def get_sparse_query_kwargs(self, queryset):
+        """
+        Narrow the query to the fields selected with ``?fields=`` / ``?expand=``,
+        or for lists to the default list fields.
         
-        # Regular users can only see their own service requests
+        Only the serialized columns (plus the ordering ones the cursor paginator
+        reads back) are loaded, and only the requested nested relations are joined.
+        """
+        selected = ServiceRequestSerializer.requested_fields(self.request.query_params, self.action == 'list')
+        if selected is None:
+            return {}
+        columns, relations = ServiceRequestSerializer.query_fields(selected)
+        ordering = filters.OrderingFilter().get_ordering(self.request, queryset, self) or self.ordering
+        columns.update(field.lstrip('-') for field in ordering)
+        columns.update(field.lstrip('-') for field in self.cursor_pagination_class.tiebreak_ordering)
+        # Read for the ETag
+        columns.add('updated_at')
+        return {'columns': columns, 'relations': relations}
+    
+    def list(self, request, *args, **kwargs):
+        """
+        List service requests. The ETag covers the row count and latest update under
+        the current filters; a matching If-None-Match gets a 304 without serializing.
+        Keyset pages never count the rows, so their ETag covers the loaded page instead.
+        """
+        queryset = self.filter_queryset(self.get_queryset())
+        format = request.accepted_renderer.format
+        if isinstance(self.paginator, CountedPageNumberPagination):
+            count, latest = list_state(queryset)
+            validators = Validators.for_list(count, latest, format)
+            not_modified = validators.check(request)
+            if not_modified is not None:
+                return not_modified
+            self.paginator.known_count = count
+            page = self.paginate_queryset(queryset)
+        else:
+            page = self.paginate_queryset(queryset)
+            links = (self.paginator.get_next_link(), self.paginator.get_previous_link())
+            validators = Validators.for_page(page, links, format)
+            not_modified = validators.check(request)
+            if not_modified is not None:
+                return not_modified
+        
+        if page is not None:
+            response = self.get_paginated_response(self.get_serializer(page, many=True).data)
+        else:
+            response = Response(self.get_serializer(queryset, many=True).data)
+        return validators.apply(response)
+    
+    def retrieve(self, request, *args, **kwargs):
+        """
+        Return one service request with an ETag and Last-Modified from its updated_at.
+        Conditional requests are checked with a one-column query before the row is loaded.
+        """
+        if has_conditions(request):
+            validators = self.get_stored_validators()
+            response = validators.check(request) if validators else None
+            if response is not None:
+                return response
+        
+        instance = self.get_object()
+        response = Response(self.get_serializer(instance).data)
+        return Validators.for_request(instance.pk, instance.updated_at, request.accepted_renderer.format).apply(response)
+    
+    def update(self, request, *args, **kwargs):
+        """
+        Update a service request. If-Match (or If-Unmodified-Since) is checked against
+        the stored row, locked until the update commits; a stale validator gets a 412.
+        """
+        if has_conditions(request):
+            with transaction.atomic():
+                validators = self.get_stored_validators(lock=True)
+                response = validators.check(request) if validators else None
+                if response is not None:
+                    return response
+                response = super().update(request, *args, **kwargs)
+        else:
+            response = super().update(request, *args, **kwargs)
+        
+        instance = self.updated_instance
+        return Validators.for_request(instance.pk, instance.updated_at, request.accepted_renderer.format).apply(response)
+    
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        self.updated_instance = serializer.instance
+    
+    def get_stored_validators(self, lock=False):
+        """
+        Return the validators of the requested service request as stored, or None
+        if it doesn't exist; get_object() then raises the 404.
+        """
+        queryset = self.filter_queryset(self.get_queryset())
+        if lock:
+            queryset = queryset.select_for_update()
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
         try:
-            customer = Customer.objects.get(user=user)
-            return ServiceRequest.objects.filter(customer=customer)
-        except Customer.DoesNotExist:
-            return ServiceRequest.objects.none()
+            state = request_state(queryset, **{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        except (TypeError, ValueError, DjangoValidationError):
+            return None
+        return Validators.for_request(*state, self.request.accepted_renderer.format) if state else None
     
     def perform_create(self, serializer):
         """
         Set the customer when creating a service request.
         """
-        try:
-            customer = Customer.objects.get(user=self.request.user)
-            serializer.save(customer=customer)
-        except Customer.DoesNotExist:
+        customer = self.request.profiles.customer
+        if customer is None:
+            raise ValidationError("Customer profile not found.")
+        serializer.save(customer=customer)
+    
+    @action(detail=False, methods=['post'])
+    def batch(self, request):
+        """
+        Create a list of service requests in one transaction.
+
+        Items are validated like single creates; if any item is invalid nothing is
+        written and the response is a list of per-item errors in request order.
+        Otherwise the created requests are returned, with their ids, in request order.
+        """
+        customer = request.profiles.customer
+        if customer is None:
             raise ValidationError("Customer profile not found.")
+        
+        serializer = self.get_batch_serializer(context={**self.get_serializer_context(), 'customer': customer})
+        serializer.is_valid(raise_exception=True)
+        with transaction.atomic():
+            serializer.save(customer=customer)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+    
+    @batch.mapping.patch
+    def batch_update(self, request):
+        """
+        Partially update a list of service requests in one transaction.
+
+        Each item holds the request ``id`` plus the fields to change, validated
+        like a single PATCH. If any item is invalid nothing is written and the
+        response is a list of per-item errors in request order.
+        """
+        items = request.data if isinstance(request.data, list) else []
+        pks = [ServiceRequestBatchSerializer.item_pk(item) for item in items[:self.batch_max_size]]
+        
+        with transaction.atomic():
+            instances = self.get_queryset().select_for_update().in_bulk([pk for pk in pks if pk is not None])
+            for instance in instances.values():
+                self.check_object_permissions(request, instance)
+            serializer = self.get_batch_serializer(instances, partial=True)
+            serializer.is_valid(raise_exception=True)
+            serializer.save()
+        return Response(serializer.data)
+    
+    def get_batch_serializer(self, instances=None, **kwargs):
+        """Return a list serializer for the request body of a batch action."""
+        return self.get_serializer(
+            instances, data=self.request.data, many=True,
+            allow_empty=False, max_length=self.batch_max_size, **kwargs
+        )
+    
+    @action(detail=False, methods=['get'], renderer_classes=[CSVRenderer, NDJSONRenderer])
+    def export(self, request):
+        """
+        Stream every service request matching the support dashboard filters as
+        CSV (``?format=csv``, the default) or NDJSON (``?format=ndjson``).
+        """
+        queryset = filter_support_requests(ServiceRequest.objects.all(), request.query_params, request.profiles)
+        return export_response(request, queryset, request.accepted_renderer.format)
     
     @action(detail=False, methods=['get'])
     def statistics(self, request):
@@ -135,49 +391,12 @@ class ServiceRequestViewSet(viewsets.ModelViewSet):
             )
         
         try:
-            # Get basic statistics
-            total = ServiceRequest.objects.count()
-            pending = ServiceRequest.objects.filter(status='Pending').count()
-            in_progress = ServiceRequest.objects.filter(status='In Progress').count()
-            resolved = ServiceRequest.objects.filter(status='Resolved').count()
-            
-            # Get statistics by service type
-            service_type_stats = ServiceRequest.objects.values('service_type').annotate(
-                count=Count('id')
-            ).order_by('-count')
-            
-            # Get statistics by priority
-            priority_stats = ServiceRequest.objects.values('priority').annotate(
-                count=Count('id')
-            ).order_by('priority')
-            
-            # Calculate average resolution time for resolved requests
-            resolved_requests = ServiceRequest.objects.filter(
-                status='Resolved', 
-                resolved_at__isnull=False
+            data = statistics_data(
+                ServiceRequestCounter.objects.breakdown(),
+                # Average and percentile resolution times are computed in the database
+                ServiceRequest.objects.resolution_stats()
             )
             
-            avg_resolution_days = None
-            if resolved_requests.exists():
-                resolution_times = []
-                for req in resolved_requests:
-                    if req.resolved_at and req.created_at:
-                        delta = req.resolved_at - req.created_at
-                        resolution_times.append(delta.total_seconds() / (60 * 60 * 24))  # Convert to days
-                
-                if resolution_times:
-                    avg_resolution_days = sum(resolution_times) / len(resolution_times)
-            
-            data = {
-                'total': total,
-                'pending': pending,
-                'in_progress': in_progress,
-                'resolved': resolved,
-                'by_service_type': list(service_type_stats),
-                'by_priority': list(priority_stats),
-                'avg_resolution_days': avg_resolution_days
-            }
-            
             serializer = ServiceRequestStatisticsSerializer(data)
             return Response(serializer.data)
         
@@ -189,6 +408,19 @@ class ServiceRequestViewSet(viewsets.ModelViewSet):
             )
 
 # Traditional views for web interface
+def filter_customer_requests(customer, status_filter, service_type_filter):
+    """Return the customer's dashboard rows with the dashboard filters applied, newest first."""
+    # The legacy notes text is not shown on the dashboard
+    requests_query = ServiceRequest.objects.filter(customer=customer).defer('notes')
+    
+    if status_filter:
+        requests_query = requests_query.filter(status=status_filter)
+    
+    if service_type_filter:
+        requests_query = requests_query.filter(service_type=service_type_filter)
+    
+    return requests_query.order_by('-created_at')
+
 @login_required
 def dashboard(request):
     """Display customer dashboard with paginated and filtered service requests."""
@@ -198,23 +430,14 @@ def dashboard(request):
     
     try:
         # Get or create customer profile
-        customer, created = Customer.objects.get_or_create(user=request.user)
+        customer = request.profiles.get_or_create_customer()
         
         # Get filter parameters
         status_filter = request.GET.get('status', '')
         service_type_filter = request.GET.get('service_type', '')
         
         # Build query
-        requests_query = ServiceRequest.objects.filter(customer=customer)
-        
-        if status_filter:
-            requests_query = requests_query.filter(status=status_filter)
-        
-        if service_type_filter:
-            requests_query = requests_query.filter(service_type=service_type_filter)
-        
-        # Order by created_at (newest first)
-        requests_query = requests_query.order_by('-created_at')
+        requests_query = filter_customer_requests(customer, status_filter, service_type_filter)
         
         # Paginate results
         paginator = Paginator(requests_query, 10)  # 10 requests per page
@@ -232,10 +455,6 @@ def dashboard(request):
         # Get unique status values and service types for filtering
         status_choices = ServiceRequest.STATUS_CHOICES
         service_type_choices = ServiceRequest.SERVICE_TYPES
-        
-        # Add user-specific request ID (starting from 1)
-        for index, req in enumerate(requests, 1):
-            req.user_request_id = index
             
     except Exception as e:
         logger.error(f"Error in dashboard view: {str(e)}")
@@ -255,16 +474,27 @@ def dashboard(request):
     return render(request, 'dashboard.html', context)
 
 # Submit a Service Request
-@login_required
+@csrf_exempt
 def submit_request(request):
-    """Handle service request submission with validation."""
+    """
+    Handle service request submission with validation.
+
+    The CSRF check reads the request body, so it runs only after the attachment
+    upload handler is installed.
+    """
+    use_attachment_upload_handler(request)
+    return _submit_request(request)
+
+@login_required
+@csrf_protect
+def _submit_request(request):
     # If user is a support staff, redirect to support dashboard
     if hasattr(request.user, 'role') and request.user.role == 'support_staff':
         return redirect('support_dashboard')
     
     try:
         # Get or create customer profile
-        customer, created = Customer.objects.get_or_create(user=request.user)
+        customer = request.profiles.get_or_create_customer()
         
         if request.method == 'POST':
             form = ServiceRequestForm(request.POST, request.FILES)
@@ -293,30 +523,96 @@ def request_detail(request, request_id):
         service_request = get_object_or_404(ServiceRequest, id=request_id)
         
         # Access control: ensure the user can only view their own requests
-        if not (hasattr(request.user, 'role') and request.user.role == 'support_staff'):
-            try:
-                customer = Customer.objects.get(user=request.user)
-                if service_request.customer != customer:
-                    messages.error(request, "You don't have permission to view this request.")
-                    return redirect('dashboard')
-                
-                # Add user-specific request ID
-                user_requests = ServiceRequest.objects.filter(customer=customer).order_by('-created_at')
-                
-                for index, req in enumerate(user_requests, 1):
-                    if req.id == service_request.id:
-                        service_request.user_request_id = index
-                        break
-            except Customer.DoesNotExist:
-                messages.error(request, "You don't have permission to view this request.")
-                return redirect('dashboard')
+        if not can_view_request(request, service_request):
+            messages.error(request, "You don't have permission to view this request.")
+            return redirect('dashboard')
     
     except Exception as e:
         logger.error(f"Error in request_detail view: {str(e)}")
         messages.error(request, "An error occurred while retrieving the request details.")
         return redirect('dashboard')
 
-    return render(request, 'request_detail.html', {'service_request': service_request})
+    return render(request, 'request_detail.html', {
+        'service_request': service_request,
+        'events': timeline_page(request, service_request)
+    })
+
+def can_view_request(request, service_request):
+    """Support staff can view every service request; customers only their own."""
+    if hasattr(request.user, 'role') and request.user.role == 'support_staff':
+        return True
+    return request.profiles.ids()[0] == service_request.customer_id
+
+# Serve a Service Request Attachment
+@login_required
+@require_http_methods(["GET", "HEAD"])
+def request_attachment(request, request_id):
+    """Stream a request's attachment to users allowed to view the request."""
+    service_request = get_object_or_404(
+        ServiceRequest.objects.only('id', 'customer', 'attached_file', 'attachment_name'), id=request_id
+    )
+    if not can_view_request(request, service_request):
+        return HttpResponseForbidden("You don't have permission to view this attachment.")
+    if not service_request.attached_file:
+        raise Http404("This service request has no attachment.")
+    return attachment_response(request, service_request.attached_file, service_request.attachment_name)
+
+def timeline_page(request, service_request):
+    """Return the requested page of the service request's event timeline, newest first."""
+    paginator = Paginator(ServiceRequestEvent.objects.timeline(service_request), 10)
+    try:
+        return paginator.page(request.GET.get('events_page'))
+    except PageNotAnInteger:
+        return paginator.page(1)
+    except EmptyPage:
+        return paginator.page(paginator.num_pages)
+
+def filter_support_requests(queryset, params, profiles):
+    """
+    Apply the support dashboard's filters and sort order from ``params``.
+    ``profiles`` is the request's RequestProfiles, for the "assigned to me" filter.
+    
+    Shared by the dashboard and the service request export so both select the same rows.
+    """
+    # Apply filters
+    status_filter = params.get('status', '')
+    priority_filter = params.get('priority', '')
+    service_type_filter = params.get('service_type', '')
+    search_query = params.get('q', '')
+    assigned_filter = params.get('assigned', '')
+    
+    if status_filter:
+        queryset = queryset.filter(status=status_filter)
+        
+    if priority_filter:
+        queryset = queryset.filter(priority=priority_filter)
+        
+    if service_type_filter:
+        queryset = queryset.filter(service_type=service_type_filter)
+    
+    if assigned_filter:
+        if assigned_filter == 'me':
+            # Get the support representative profile for the current user
+            support_rep_id = profiles.ids()[1]
+            if support_rep_id is not None:
+                queryset = queryset.filter(assigned_to_id=support_rep_id)
+        elif assigned_filter == 'unassigned':
+            queryset = queryset.filter(assigned_to__isnull=True)
+        
+    if search_query:
+        # Full-text index lookup, ordered by relevance
+        queryset = queryset.search(search_query)
+    
+    # Apply sorting
+    sort_by = params.get('sort', 'relevance' if search_query else '-created_at')
+    valid_sort_fields = ['created_at', '-created_at', 'priority', '-priority', 'status', '-status']
+    
+    if sort_by in valid_sort_fields:
+        queryset = queryset.order_by(sort_by)
+    elif not (search_query and sort_by == 'relevance'):
+        queryset = queryset.order_by('-created_at')
+        
+    return queryset
 
 # Support Staff Dashboard
 @method_decorator(login_required, name='dispatch')
@@ -326,6 +622,7 @@ class SupportDashboardView(ListView):
     template_name = 'support_dashboard.html'
     context_object_name = 'service_requests'
     paginate_by = 15
+    bulk_batch_size = 500
     
     def dispatch(self, request, *args, **kwargs):
         # Check if user is a support staff
@@ -336,113 +633,55 @@ class SupportDashboardView(ListView):
     
     def get_queryset(self):
         """Filter and sort service requests based on query parameters."""
-        queryset = ServiceRequest.objects.all()
-        
-        # Apply filters
-        status_filter = self.request.GET.get('status', '')
-        priority_filter = self.request.GET.get('priority', '')
-        service_type_filter = self.request.GET.get('service_type', '')
-        search_query = self.request.GET.get('q', '')
-        assigned_filter = self.request.GET.get('assigned', '')
-        
-        if status_filter:
-            queryset = queryset.filter(status=status_filter)
-            
-        if priority_filter:
-            queryset = queryset.filter(priority=priority_filter)
-            
-        if service_type_filter:
-            queryset = queryset.filter(service_type=service_type_filter)
-        
-        if assigned_filter:
-            if assigned_filter == 'me':
-                # Get the support representative profile for the current user
-                try:
-                    support_rep = SupportRepresentative.objects.get(user=self.request.user)
-                    queryset = queryset.filter(assigned_to=support_rep)
-                except SupportRepresentative.DoesNotExist:
-                    pass
-            elif assigned_filter == 'unassigned':
-                queryset = queryset.filter(assigned_to__isnull=True)
-            
-        if search_query:
-            queryset = queryset.filter(
-                Q(customer__user__username__icontains=search_query) |
-                Q(customer__user__email__icontains=search_query) |
-                Q(customer__user__first_name__icontains=search_query) |
-                Q(customer__user__last_name__icontains=search_query) |
-                Q(description__icontains=search_query)
-            )
-        
-        # Apply sorting
-        sort_by = self.request.GET.get('sort', '-created_at')
-        valid_sort_fields = ['created_at', '-created_at', 'priority', '-priority', 'status', '-status']
-        
-        if sort_by in valid_sort_fields:
-            queryset = queryset.order_by(sort_by)
-        else:
-            queryset = queryset.order_by('-created_at')
-            
-        return queryset
+        return filter_support_requests(ServiceRequest.objects.with_related(), self.request.GET, self.request.profiles)
     
     def post(self, request, *args, **kwargs):
         """Handle bulk actions on service requests."""
         action = request.POST.get('action')
         selected_requests = request.POST.getlist('selected_requests')
+        selected_ids = sorted({int(req_id) for req_id in selected_requests if req_id.isdigit()})
         
-        if not selected_requests:
+        if not selected_ids:
             messages.warning(request, "No requests were selected.")
             return redirect('support_dashboard')
         
         if action == 'update_status':
             new_status = request.POST.get('new_status')
-            if new_status:
-                count = 0
-                for req_id in selected_requests:
-                    try:
-                        req = ServiceRequest.objects.get(id=req_id)
-                        req.status = new_status
-                        req.save()
-                        count += 1
-                    except ServiceRequest.DoesNotExist:
-                        continue
-                
+            if new_status in dict(ServiceRequest.STATUS_CHOICES):
+                count = self.bulk_update(selected_ids, lambda queryset: queryset.set_status(new_status, author=request.user))
                 messages.success(request, f"Updated status of {count} service requests to {new_status}.")
+            elif new_status:
+                messages.error(request, "Invalid status selected.")
         
         elif action == 'assign':
             rep_id = request.POST.get('support_rep')
             try:
                 if rep_id:
-                    rep = SupportRepresentative.objects.get(id=rep_id)
-                    count = 0
-                    for req_id in selected_requests:
-                        try:
-                            req = ServiceRequest.objects.get(id=req_id)
-                            req.assigned_to = rep
-                            req.save()
-                            count += 1
-                        except ServiceRequest.DoesNotExist:
-                            continue
-                    
+                    rep = SupportRepresentative.objects.select_related('user').get(id=rep_id)
+                    count = self.bulk_update(selected_ids, lambda queryset: queryset.assign(rep, author=request.user))
                     messages.success(request, f"Assigned {count} service requests to {rep.get_full_name()}.")
                 else:
                     # Unassign
-                    count = 0
-                    for req_id in selected_requests:
-                        try:
-                            req = ServiceRequest.objects.get(id=req_id)
-                            req.assigned_to = None
-                            req.save()
-                            count += 1
-                        except ServiceRequest.DoesNotExist:
-                            continue
-                    
+                    count = self.bulk_update(selected_ids, lambda queryset: queryset.assign(None, author=request.user))
                     messages.success(request, f"Unassigned {count} service requests.")
-            except SupportRepresentative.DoesNotExist:
+            except (SupportRepresentative.DoesNotExist, ValueError):
                 messages.error(request, "Invalid support representative selected.")
         
         return redirect('support_dashboard')
     
+    def bulk_update(self, ids, apply):
+        """
+        Run ``apply`` on the requests with the given ids in one transaction and
+        return the number of rows it changed. Ids are processed in batches of
+        ``bulk_batch_size`` to stay under the database's query parameter limits.
+        """
+        count = 0
+        with transaction.atomic():
+            for start in range(0, len(ids), self.bulk_batch_size):
+                batch = ids[start:start + self.bulk_batch_size]
+                count += apply(ServiceRequest.objects.filter(id__in=batch))
+        return count
+    
     def get_context_data(self, **kwargs):
         """Add additional context for filtering and statistics."""
         context = super().get_context_data(**kwargs)
@@ -452,14 +691,20 @@ class SupportDashboardView(ListView):
         context['priority'] = self.request.GET.get('priority', '')
         context['service_type'] = self.request.GET.get('service_type', '')
         context['q'] = self.request.GET.get('q', '')
-        context['sort'] = self.request.GET.get('sort', '-created_at')
+        context['sort'] = self.request.GET.get('sort', 'relevance' if context['q'] else '-created_at')
         context['assigned'] = self.request.GET.get('assigned', '')
         
-        # Add statistics
-        context['total_requests'] = ServiceRequest.objects.count()
-        context['pending_requests'] = ServiceRequest.objects.filter(status='Pending').count()
-        context['in_progress_requests'] = ServiceRequest.objects.filter(status='In Progress').count()
-        context['resolved_requests'] = ServiceRequest.objects.filter(status='Resolved').count()
+        # Current filters, for the export links
+        export_params = self.request.GET.copy()
+        export_params.pop('page', None)
+        context['export_query'] = export_params.urlencode()
+        
+        # Add statistics (read from the materialized counters table)
+        status_totals = ServiceRequestCounter.objects.status_totals()
+        context['total_requests'] = sum(status_totals.values())
+        context['pending_requests'] = status_totals['Pending']
+        context['in_progress_requests'] = status_totals['In Progress']
+        context['resolved_requests'] = status_totals['Resolved']
         
         # Add request choices for filtering
         context['status_choices'] = ServiceRequest.STATUS_CHOICES
@@ -467,13 +712,23 @@ class SupportDashboardView(ListView):
         context['service_type_choices'] = ServiceRequest.SERVICE_TYPES
         
         # Add support representatives for assignment
-        context['support_reps'] = SupportRepresentative.objects.all()
+        context['support_reps'] = SupportRepresentative.objects.select_related('user')
         
         # Add current user's support rep profile if it exists
+        context['current_support_rep'] = self.request.profiles.support_rep
+        
+        # Live updates stream, routed only under ASGI; it starts after the newest change this page shows
         try:
-            context['current_support_rep'] = SupportRepresentative.objects.get(user=self.request.user)
-        except SupportRepresentative.DoesNotExist:
-            context['current_support_rep'] = None
+            events_url = reverse('support_dashboard_events')
+        except NoReverseMatch:
+            pass
+        else:
+            context['live_events_url'] = f'{events_url}?after={ServiceRequestChange.objects.latest_id()}'
+            # New requests can be added to the table when it shows the newest requests, unfiltered
+            context['live_insert'] = (
+                not any(context[name] for name in ('status', 'priority', 'service_type', 'q', 'assigned'))
+                and context['sort'] == '-created_at' and context['page_obj'].number == 1
+            )
         
         return context
 
@@ -500,44 +755,24 @@ def support_request_detail(request, request_id):
         return redirect('dashboard')
     
     try:
-        service_request = get_object_or_404(ServiceRequest, id=request_id)
-        
-        # Add user-specific request ID
-        user_requests = ServiceRequest.objects.filter(
-            customer=service_request.customer
-        ).order_by('-created_at')
-        
-        for index, req in enumerate(user_requests, 1):
-            if req.id == service_request.id:
-                service_request.user_request_id = index
-                break
+        service_request = get_object_or_404(ServiceRequest.objects.with_related(), id=request_id)
         
         if request.method == 'POST':
+            # Validating the form writes the new values onto the instance, so keep
+            # the old ones for the timeline
+            old_status, old_assigned_to = service_request.status, service_request.assigned_to
             form = ServiceRequestUpdateForm(request.POST, instance=service_request)
             if form.is_valid():
-                updated_request = form.save(commit=False)
-                
-                # Handle notes - append new notes to existing ones
-                new_notes = form.cleaned_data.get('notes')
-                if new_notes:
-                    timestamp = now().strftime('%Y-%m-%d %H:%M:%S')
-                    if updated_request.notes:
-                        updated_request.notes += f"\n\n{timestamp} - {request.user.username}:\n{new_notes}"
-                    else:
-                        updated_request.notes = f"{timestamp} - {request.user.username}:\n{new_notes}"
-                
-                # Track status changes
-                if 'status' in form.changed_data:
-                    old_status = service_request.status
-                    new_status = updated_request.status
-                    status_change_note = f"\n\n{timestamp} - {request.user.username}:\nStatus changed from {old_status} to {new_status}"
-                    
-                    if updated_request.notes:
-                        updated_request.notes += status_change_note
-                    else:
-                        updated_request.notes = status_change_note
-                
-                updated_request.save()
+                with transaction.atomic():
+                    # Only write the edited columns, not the legacy notes text
+                    updated_request = form.save(commit=False)
+                    updated_request.save(update_fields=[*form.Meta.fields, 'updated_at', 'resolved_at'])
+                    ServiceRequestEvent.objects.record_update(
+                        updated_request, request.user, old_status, old_assigned_to,
+                        note=form.cleaned_data.get('notes')
+                    )
+                    # The customer email is sent by the job worker, not in this request
+                    queue_status_notifications([(updated_request.id, old_status, updated_request.status)])
                 messages.success(request, "Service request updated successfully!")
                 
                 # Redirect to the same page to show the updated information
@@ -546,7 +781,7 @@ def support_request_detail(request, request_id):
             form = ServiceRequestUpdateForm(instance=service_request)
         
         # Get all support representatives for assignment dropdown
-        support_reps = SupportRepresentative.objects.all()
+        support_reps = SupportRepresentative.objects.select_related('user')
         
         # Get customer details
         customer = service_request.customer
@@ -561,7 +796,8 @@ def support_request_detail(request, request_id):
             'form': form,
             'support_reps': support_reps,
             'customer': customer,
-            'customer_requests': customer_requests
+            'customer_requests': customer_requests,
+            'events': timeline_page(request, service_request)
         }
         
     except Exception as e: